@@ -0,0 +1,162 @@
+"""
+Click responsiveness benchmark
+
+Measures how late the Tkinter event loop handles events while clicks are waiting on slow
+Spotify or YouTube requests, with clicks handled inline on the Tkinter thread (as they
+used to be) and handed to an ActionDispatcher (see top_songs/actions.py).
+
+A timer is scheduled every TICK_INTERVAL milliseconds with root.after(), standing in for
+redraws and input events, and the lateness of every tick is recorded. Meanwhile songs are
+clicked several times each in quick succession, and every click waits --latency seconds,
+standing in for a network round trip. The loop is a Tcl interpreter driven by hand, so no
+display is needed.
+
+tests/test_actions.py checks the dispatcher keeps the loop responsive, this only reports numbers.
+
+Usage:
+    python benchmarks/action_latency.py [--clicks CLICKS] [--repeats REPEATS] [--latency SECONDS]
+        [--output FILE]
+"""
+
+import statistics
+import argparse
+import platform
+import tkinter
+import json
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from top_songs.actions import ActionDispatcher, ACTION_POLL_INTERVAL
+
+# Milliseconds between ticks of the timer whose lateness is measured.
+TICK_INTERVAL = 10
+# Milliseconds between clicks.
+CLICK_INTERVAL = 20
+
+
+def run_loop(make_handler, clicks, repeats):
+    """
+    Click songs while ticking a timer, and return how late each tick was.
+    
+    :param make_handler: function called with a Tcl interpreter, returning a function called
+        on the loop thread with a song number when it's clicked, and a function returning
+        whether every click has been handled
+    :param int clicks: number of songs clicked
+    :param int repeats: clicks on each song, in quick succession
+    :return: lateness of each tick in seconds, and seconds taken to handle every click
+    :rtype: tuple[list[float], float]
+    """
+    root = tkinter.Tcl()
+    handle_click, finished = make_handler(root)
+    lags = []
+    state = {'clicked': 0, 'next_tick': 0.0}
+    
+    def tick():
+        """Record how late this tick is and schedule the next one."""
+        now = time.perf_counter()
+        lags.append(max(now - state['next_tick'], 0.0))
+        state['next_tick'] = now + TICK_INTERVAL / 1000
+        root.after(TICK_INTERVAL, tick)
+    
+    def click():
+        """Click the next song (each song repeats times in a row), then schedule the next click."""
+        handle_click(state['clicked'] // repeats)
+        state['clicked'] += 1
+        if state['clicked'] < clicks * repeats:
+            root.after(CLICK_INTERVAL, click)
+    
+    start = time.perf_counter()
+    state['next_tick'] = start + TICK_INTERVAL / 1000
+    root.after(TICK_INTERVAL, tick)
+    root.after(0, click)
+    while state['clicked'] < clicks * repeats or not finished():
+        root.dooneevent()
+    return lags, time.perf_counter() - start
+
+
+def run_inline(clicks, repeats, latency):
+    """Handle every click on the loop thread, as TopSongsApp used to."""
+    requests = []
+    
+    def make_handler(_root):
+        """Wait for the stand-in request straight away on every click."""
+        return lambda song: (time.sleep(latency), requests.append(song)), lambda: True
+    
+    lags, seconds = run_loop(make_handler, clicks, repeats)
+    return lags, seconds, {'requests': len(requests)}
+
+
+def run_dispatched(clicks, repeats, latency):
+    """Hand every click to an ActionDispatcher, keyed by song as TopSongsApp does, so repeated clicks are dropped."""
+    requests = []
+    dispatchers = []
+    
+    def make_handler(root):
+        """Submit the stand-in request on every click."""
+        dispatcher = ActionDispatcher(root)
+        dispatchers.append(dispatcher)
+        
+        def handle_click(song):
+            """Submit a click on a song."""
+            dispatcher.submit(('play', song), lambda: (time.sleep(latency), requests.append(song)))
+        
+        return handle_click, lambda: not any(dispatcher.is_pending(('play', song)) for song in range(clicks))
+    
+    lags, seconds = run_loop(make_handler, clicks, repeats)
+    dispatchers[0].stop()
+    return lags, seconds, {'requests': len(requests), **dispatchers[0].stats}
+
+
+def summarize(lags, seconds, extra):
+    """
+    Return tick lateness percentiles in milliseconds, and the time taken to handle every click.
+    
+    :rtype: dict
+    """
+    lags = sorted(lags)
+    return {
+        'ticks': len(lags),
+        'p50_lag_ms': lags[len(lags) // 2] * 1000,
+        'p99_lag_ms': lags[min(int(len(lags) * 0.99), len(lags) - 1)] * 1000,
+        'max_lag_ms': lags[-1] * 1000,
+        'mean_lag_ms': statistics.fmean(lags) * 1000,
+        'seconds': seconds,
+        **extra,
+    }
+
+
+def main():
+    """Run both ways of handling clicks and output results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--clicks', type=int, default=10, help='songs clicked (default=10)')
+    arg_parser.add_argument('--repeats', type=int, default=3, help='clicks on each song (default=3)')
+    arg_parser.add_argument('--latency', type=float, default=0.3, help='seconds each click waits (default=0.3)')
+    arg_parser.add_argument('--output', help='file to write results to (default=print them)')
+    args = arg_parser.parse_args()
+    
+    results = {
+        'inline': summarize(*run_inline(args.clicks, args.repeats, args.latency)),
+        'dispatcher': summarize(*run_dispatched(args.clicks, args.repeats, args.latency)),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'clicks': args.clicks,
+            'repeats': args.repeats,
+            'latency': args.latency,
+            'tick_interval_ms': TICK_INTERVAL,
+            'poll_interval_ms': ACTION_POLL_INTERVAL,
+        },
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file_out:
+            file_out.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
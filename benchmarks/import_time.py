@@ -0,0 +1,89 @@
+"""
+Import time benchmark
+
+Compares the time taken to import the headless core of Top Songs (top_songs.core) with
+the time taken to import the GUI app (top_songs.main), as reported by python -X importtime.
+Interpreter startup imports are measured separately and subtracted.
+
+Usage:
+    python benchmarks/import_time.py [--runs RUNS] [--json]
+"""
+
+import statistics
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('top_songs.core', 'top_songs.main')
+
+
+def measure_import(statement):
+    """
+    Run a statement in a fresh interpreter and return the total import time in microseconds.
+    
+    :param str statement: python code to run, e.g. "import top_songs.core"
+    :rtype: int
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'{statement!r} failed: {result.stderr.strip().splitlines()[-1]}')
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        # Skip the header, and nested imports (already counted in their parent's cumulative time).
+        if not cumulative.strip().isdigit() or name.startswith('  '):
+            continue
+        total += int(cumulative)
+    return total
+
+
+def benchmark(runs):
+    """
+    Return the median import time of each module in MODULES, in milliseconds.
+    
+    :param int runs: number of times to import each module
+    :rtype: dict[str: float]
+    """
+    # Make sure .pyc files exist, so the first run isn't slower than the rest.
+    measure_import('pass')
+    baseline = statistics.median(measure_import('pass') for _ in range(runs))
+    results = {}
+    for module in MODULES:
+        try:
+            measure_import(f'import {module}')
+        except RuntimeError as error:
+            print(error, file=sys.stderr)
+            continue
+        times = [measure_import(f'import {module}') - baseline for _ in range(runs)]
+        results[module] = statistics.median(times) / 1000
+    return results
+
+
+def main():
+    """Run the benchmark and print results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--runs', type=int, default=10, help='imports per module (default=10)')
+    arg_parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = arg_parser.parse_args()
+    
+    results = benchmark(args.runs)
+    if args.json:
+        print(json.dumps({'import_ms': results}))
+        return
+    for module, milliseconds in results.items():
+        print(f'{module:<20} {milliseconds:8.1f} ms')
+    if len(results) == len(MODULES):
+        core, main_ = (results[module] for module in MODULES)
+        print(f'headless import is {core / main_:.1%} of the GUI import')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Song memory benchmark
+
+Compares the memory used by chart entries stored as dictionaries (the old layout) with
+entries stored as Song objects, whose names and artists are interned.
+
+Entries are generated as if parsed from many weeks of charts: each entry gets freshly
+created name and artist strings, drawn from a pool of distinct songs about a tenth the
+size of the number of entries (songs stay on the chart for weeks at a time).
+
+Usage:
+    python benchmarks/memory.py [--sizes 100 10000 1000000] [--json]
+"""
+
+import tracemalloc
+import argparse
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from top_songs.models import Song, strings
+
+SIZES = (100, 10_000, 1_000_000)
+
+
+def make_entries(size):
+    """Yield (number, name, artist) for size entries, with new string objects each time."""
+    distinct = max(size // 10, 1)
+    for i in range(size):
+        song = i % distinct
+        yield i % 100 + 1, ''.join(('Song Title ', str(song))), ''.join(('Artist Name ', str(song % 1000)))
+
+
+def measure(build, size):
+    """
+    Return the bytes still allocated after building a list of size entries.
+    
+    :param build: function turning (number, name, artist) into an entry
+    :param int size: number of entries
+    :rtype: int
+    """
+    strings.clear()
+    tracemalloc.start()
+    entries = [build(number, name, artist) for number, name, artist in make_entries(size)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    strings.clear()
+    return allocated
+
+
+def benchmark(sizes):
+    """
+    Return memory used by each layout at each size.
+    
+    :rtype: dict[int: dict[str: int]]
+    """
+    results = {}
+    for size in sizes:
+        results[size] = {
+            'dict': measure(lambda number, name, artist: {'number': number, 'name': name, 'artist': artist}, size),
+            'song': measure(Song, size),
+        }
+    return results
+
+
+def main():
+    """Run the benchmark and print results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of entries (default=100 10000 1000000)')
+    arg_parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = arg_parser.parse_args()
+    
+    results = benchmark(args.sizes)
+    if args.json:
+        print(json.dumps({'memory_bytes': results}))
+        return
+    print(f'{"entries":>10} {"dict":>12} {"Song":>12} {"saving":>8}')
+    for size, result in results.items():
+        saving = 1 - result['song'] / result['dict']
+        print(f'{size:>10} {result["dict"] / 1024:>9.0f} KB {result["song"] / 1024:>9.0f} KB {saving:>8.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Chart service load benchmark
+
+Measures how many cached reads a ChartService (see top_songs/service.py) answers per second,
+and how long they take, with many clients at once.
+
+The service is started in this process, in front of local stand-in servers (see stand_ins.py)
+and empty caches in a temporary directory. The chart and a YouTube lookup for every song on
+it are requested once to fill the service's cache, then every client reads those answers
+over and over on its own kept-alive connection, as TopSongsApp does.
+
+Results are printed as JSON, or written to a file with --output.
+
+Usage:
+    python benchmarks/service_load.py [--clients CLIENTS] [--requests REQUESTS] [--output FILE]
+"""
+
+from urllib.parse import urlencode
+import statistics
+import importlib
+import tempfile
+import argparse
+import platform
+import asyncio
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stand_ins import StandInServer, make_chart_page, redirect_youtube_search
+
+CHART = 'hot-100'
+
+
+def get_paths(chart_body):
+    """Return the paths clients read: the chart, and a YouTube lookup for every song on it."""
+    paths = [f'/chart?chart={CHART}&n=100']
+    for song in json.loads(chart_body)['songs']:
+        paths.append('/youtube?' + urlencode({'name': song['name'], 'artist': song['artist']}))
+    return paths
+
+
+async def get(reader, writer, path):
+    """
+    Send a GET request over a kept-alive connection and return the status and body.
+    
+    :rtype: tuple[int, bytes]
+    """
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b''):
+            break
+        if header.lower().startswith(b'content-length:'):
+            length = int(header.split(b':', 1)[1])
+    return status, await reader.readexactly(length)
+
+
+async def run_client(port, paths, requests, latencies):
+    """Read paths in turn, requests times, on one connection, adding each request's seconds to latencies."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            status, _ = await get(reader, writer, paths[i % len(paths)])
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f'{paths[i % len(paths)]} answered {status}')
+    finally:
+        writer.close()
+
+
+async def load(port, clients, requests):
+    """
+    Fill the service's cache, then read from it with many clients at once.
+    
+    :return: "requests", "seconds", "requests_per_second" and latency percentiles in milliseconds
+    :rtype: dict
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    status, chart_body = await get(reader, writer, f'/chart?chart={CHART}&n=100')
+    if status != 200:
+        raise RuntimeError(f'chart answered {status}')
+    paths = get_paths(chart_body)
+    for path in paths:
+        await get(reader, writer, path)
+    writer.close()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(port, paths, requests, latencies) for _ in range(clients)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+    }
+
+
+def main():
+    """Start the stand-in servers and the service, run the load and output results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--clients', type=int, default=50, help='clients reading at once (default=50)')
+    arg_parser.add_argument('--requests', type=int, default=200, help='requests sent by each client (default=200)')
+    arg_parser.add_argument('--output', help='file to write results to (default=print them)')
+    args = arg_parser.parse_args()
+    
+    billboard = StandInServer(chart_pages={CHART: make_chart_page()})
+    youtube = StandInServer()
+    billboard.start()
+    youtube.start()
+    # Top Songs reads this when top_songs.core is first imported.
+    os.environ['TOP_SONGS_BILLBOARD_URL'] = billboard.url
+    redirect_youtube_search(youtube.url)
+    service_module = importlib.import_module('top_songs.service')
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        service = service_module.ChartService(port=0)
+        thread = service.start()
+        try:
+            results = asyncio.run(load(service.port, args.clients, args.requests))
+            results['service'] = service.get_stats()
+        finally:
+            service.stop()
+            thread.join()
+            billboard.stop()
+            youtube.stop()
+            os.chdir(ROOT)
+    results['environment'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'clients': args.clients,
+        'requests_per_client': args.requests,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file_out:
+            file_out.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
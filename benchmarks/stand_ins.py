@@ -0,0 +1,329 @@
+"""
+Stand-in services
+
+Local HTTP servers standing in for Billboard, the Spotify Web API and YouTube search, so
+that benchmarks are reproducible, work offline and don't put load on the real services.
+
+Chart pages are read from saved pages (benchmarks/fixtures/hot-100.html, saved from
+www.billboard.com, or else the page the tests use, tests/fixtures/hot-100.html) when they
+exist, and otherwise built by make_chart_page() in the same layout. Spotify and YouTube answers are made up from the search query, so the same search
+always gets the same result.
+
+Every response can be delayed by a fixed latency, to model a real network.
+
+Top Songs searches YouTube with youtube_search, whose address can't be changed, so
+redirect_youtube_search() sends its searches to a stand-in instead.
+
+Classes:
+    StandInServer
+
+Functions:
+    make_chart_page(n, padding)
+    make_youtube_page(query, results, padding)
+    make_spotify_search(query, base_url)
+    make_id(text, length)
+    redirect_youtube_search(url)
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from types import SimpleNamespace
+import threading
+import hashlib
+import random
+import socket
+import html
+import json
+import time
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Directories saved chart pages are read from, first match wins.
+FIXTURES_DIRS = (os.path.join(ROOT, 'benchmarks', 'fixtures'), os.path.join(ROOT, 'tests', 'fixtures'))
+# Markup added to every chart row and YouTube result, so that pages are about as large as the real ones.
+ROW_PADDING = 8 * 1024
+PAGE_PADDING = 256 * 1024
+# Address youtube_search sends searches to.
+YOUTUBE_SEARCH_URL = 'https://youtube.com'
+NAME_WORDS = (
+    'Love', 'Night', 'Heart', 'Fire', 'Dance', 'Summer', 'Lights', 'Gold', 'Rain', 'Dreams',
+    'Midnight', 'Highway', 'Stars', 'Blue', 'Wild', 'Forever', 'Paradise', 'Ghost', 'Sugar', 'Thunder',
+)
+ARTIST_WORDS = (
+    'Taylor', 'Drake', 'Morgan', 'Olivia', 'Bad', 'Bunny', 'Zach', 'Sabrina', 'Post', 'Luke',
+    'Doja', 'Cat', 'Miley', 'Jelly', 'Roll', 'SZA', 'Noah', 'Kahan', 'Future', 'Metro',
+)
+ARTIST_JOINS = (' Featuring ', ' & ', ' x ', ', ')
+
+
+def make_id(text, length=22):
+    """Return a Spotify or YouTube style id made from text, the same text always gives the same id."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:length]
+
+
+def make_chart_page(n=100, padding=ROW_PADDING):
+    """
+    Return a chart page with n songs, in the layout of www.billboard.com chart pages.
+    
+    :param int n: number of chart rows
+    :param int padding: bytes of extra markup in each row (default=ROW_PADDING)
+    :rtype: bytes
+    
+    Songs are chosen at random from NAME_WORDS and ARTIST_WORDS, with a fixed seed,
+    so every call returns the same page.
+    """
+    rng = random.Random(n)
+    filler = '<span class="c-label a-font-primary-bold-l">' + 'x' * 64 + '</span>\n'
+    row_filler = filler * max(padding // len(filler), 0)
+    parts = [
+        '<!DOCTYPE html>\n<html lang="en-US"><head><meta charset="utf-8"><title>Billboard Hot 100</title>\n',
+        '<script>var pageData = "', 'y' * PAGE_PADDING, '";</script>\n</head><body>\n',
+        '<div class="chart-results-list">\n',
+    ]
+    for number in range(1, n + 1):
+        name = ' '.join(rng.sample(NAME_WORDS, rng.randint(1, 3)))
+        artist = ' '.join(rng.sample(ARTIST_WORDS, 2))
+        if rng.random() < 0.3:
+            artist += rng.choice(ARTIST_JOINS) + ' '.join(rng.sample(ARTIST_WORDS, 2))
+        parts.append(
+            f'<div class="o-chart-results-list-row-container">\n'
+            f'<ul class="o-chart-results-list-row">\n'
+            f'<li class="o-chart-results-list__item"><span class="c-label a-font-primary-bold-l">{number}</span></li>\n'
+            f'<li class="o-chart-results-list__item"><img class="c-lazy-image__img" src="/images/{number}.jpg" alt=""></li>\n'
+            f'<li class="o-chart-results-list__item">\n'
+            f'<h3 id="title-of-a-story" class="c-title a-no-trucate a-font-primary-bold-s">\n\t{html.escape(name)}\n</h3>\n'
+            f'<span class="c-label a-no-trucate a-font-primary-s">\n\t{html.escape(artist)}\n</span>\n'
+            f'</li>\n{row_filler}</ul>\n</div>\n'
+        )
+    parts.append('</div>\n</body></html>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def make_youtube_page(query, results=20, padding=PAGE_PADDING):
+    """
+    Return a YouTube search results page for a query.
+    
+    :param str query: search query
+    :param int results: number of videos listed (default=20)
+    :param int padding: bytes of extra markup around the results (default=PAGE_PADDING)
+    :rtype: bytes
+    """
+    videos = [
+        {'videoRenderer': {
+            'videoId': make_id(f'{query}\n{i}', 11),
+            'title': {'runs': [{'text': f'{query} (Official Video)'}]},
+            'longBylineText': {'runs': [{'text': f'{query} - Topic'}]},
+            'thumbnail': {'thumbnails': [{'url': 'x' * 200, 'width': 360, 'height': 202}]},
+        }}
+        for i in range(results)
+    ]
+    data = {'contents': {'twoColumnSearchResultsRenderer': {'primaryContents': {'sectionListRenderer': {
+        'contents': [{'itemSectionRenderer': {'contents': [{'adSlotRenderer': {}}] + videos}}],
+    }}}}}
+    return ''.join((
+        '<!DOCTYPE html><html><head><script>var ytcfg = "', 'z' * (padding // 2), '";</script></head><body>',
+        '<script>var ytInitialData = ', json.dumps(data), ';</script>',
+        '<script>var ytFooter = "', 'z' * (padding // 2), '";</script></body></html>',
+    )).encode('utf-8')
+
+
+def make_spotify_search(query, base_url):
+    """
+    Return a Spotify Web API track search result for a query.
+    
+    :param str query: search query
+    :param str base_url: url of the stand-in server, used for album art urls
+    :rtype: dict
+    """
+    track_id = make_id(query)
+    artist_id = make_id(query.split(' ')[-1])
+    return {'tracks': {'items': [{
+        'uri': f'spotify:track:{track_id}',
+        'name': query,
+        'artists': [{'uri': f'spotify:artist:{artist_id}', 'name': query.split(' ')[-1]}],
+        'album': {'images': [
+            {'url': f'{base_url}/images/{track_id}-640.jpg', 'width': 640, 'height': 640},
+            {'url': f'{base_url}/images/{track_id}-64.jpg', 'width': 64, 'height': 64},
+        ]},
+    }], 'total': 1}}
+
+
+def redirect_youtube_search(url):
+    """
+    Send youtube_search's searches made in this process to a stand-in server instead of YouTube.
+    
+    :param str url: base url of the stand-in server, e.g. http://127.0.0.1:8123
+    
+    Also usable as a process pool initializer, so searches made in pool processes are redirected too.
+    """
+    import youtube_search
+    import requests
+    
+    def get(search_url, **kwargs):
+        """Send a search request to the stand-in."""
+        return requests.get(search_url.replace(YOUTUBE_SEARCH_URL, url, 1), **kwargs)
+    
+    youtube_search.requests = SimpleNamespace(get=get)
+
+
+class StandInServer:
+    """
+    A class to run a stand-in Billboard, Spotify Web API and YouTube server on a background thread.
+    
+    Attributes:
+        latency : float
+            seconds each response is delayed by
+        chart_pages : dict[str: bytes]
+            chart name mapped to chart page
+        chart_sources : dict[str: str]
+            chart name mapped to where its page came from: a saved page's path, "make_chart_page()"
+            or "given"
+        url : str
+            base url of the server, e.g. http://127.0.0.1:8123
+        requests : int
+            number of requests answered
+    
+    Methods:
+        start(self):
+            Start answering requests.
+        stop(self):
+            Stop answering requests and close the server.
+        get_chart_page(self, chart):
+            Return the page for a chart, reading or building it the first time.
+        get_chart_source(self, chart):
+            Return where a chart's page came from.
+    
+    Routes:
+        GET /charts/<chart>: chart page, with an ETag (answers If-None-Match with 304)
+        GET /results?search_query=<query>: YouTube search results page
+        GET /v1/search?q=<query>: Spotify track search
+        GET /v1/me/player/devices: one Spotify player, named after this computer
+        PUT /v1/me/player/play: starts "playback"
+        GET /images/<name>: a small placeholder image
+    """
+    
+    def __init__(self, latency=0.0, chart_pages=None):
+        """
+        Create attributes for StandInServer object.
+        
+        :param float latency: seconds each response is delayed by (default=0.0)
+        :param dict[str: bytes] chart_pages: chart pages to serve (default=read or built when first requested)
+        """
+        self.latency = latency
+        self.chart_pages = dict(chart_pages or {})
+        self.chart_sources = {chart: 'given' for chart in self.chart_pages}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = None
+        host, port = self._server.server_address
+        self.url = f'http://{host}:{port}'
+    
+    def __enter__(self):
+        """Start the server when used as a context manager."""
+        self.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        """Stop the server when leaving the with block."""
+        self.stop()
+    
+    def start(self):
+        """Start answering requests."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop answering requests and close the server."""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def get_chart_page(self, chart):
+        """Return the page for a chart: a saved page from FIXTURES_DIRS if there is one, otherwise make_chart_page()."""
+        with self._lock:
+            if chart not in self.chart_pages:
+                self.chart_pages[chart] = make_chart_page()
+                self.chart_sources[chart] = 'make_chart_page()'
+                for directory in FIXTURES_DIRS:
+                    filename = os.path.join(directory, f'{chart}.html')
+                    if os.path.exists(filename):
+                        with open(filename, 'rb') as file_in:
+                            self.chart_pages[chart] = file_in.read()
+                        self.chart_sources[chart] = os.path.relpath(filename, ROOT)
+                        break
+            return self.chart_pages[chart]
+    
+    def get_chart_source(self, chart):
+        """Return where a chart's page came from (see self.chart_sources), reading or building it if not done yet."""
+        self.get_chart_page(chart)
+        return self.chart_sources[chart]
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers requests to a StandInServer (see StandInServer for routes)."""
+    
+    # Keep connections alive, as the real services do.
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        """Answer a GET request."""
+        stand_in = self._start_response()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/charts/'):
+            page = stand_in.get_chart_page(url.path[len('/charts/'):].strip('/'))
+            etag = f'"{hashlib.sha1(page).hexdigest()[:16]}"'
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', headers={'ETag': etag})
+            else:
+                self._send(200, page, 'text/html; charset=utf-8', {'ETag': etag})
+        elif url.path == '/results':
+            self._send(200, make_youtube_page(query.get('search_query', [''])[0]), 'text/html; charset=utf-8')
+        elif url.path == '/v1/search':
+            self._send_json(make_spotify_search(query.get('q', [''])[0], stand_in.url))
+        elif url.path == '/v1/me/player/devices':
+            self._send_json({'devices': [
+                {'id': make_id(socket.gethostname()), 'name': socket.gethostname(), 'type': 'Computer', 'is_active': True},
+            ]})
+        elif url.path.startswith('/images/'):
+            self._send(200, b'\xff\xd8\xff\xe0' + b'\x00' * 2048, 'image/jpeg')
+        else:
+            self._send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+    
+    def do_PUT(self):
+        """Answer a PUT request (only starting playback is supported)."""
+        self._start_response()
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlsplit(self.path).path == '/v1/me/player/play':
+            self._send(204, b'')
+        else:
+            self._send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+    
+    def log_message(self, format, *args):
+        """Don't log requests, benchmarks make thousands of them."""
+    
+    def _start_response(self):
+        """Count the request and wait out the server's latency, returning the StandInServer."""
+        stand_in = self.server.stand_in
+        with stand_in._lock:
+            stand_in.requests += 1
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        return stand_in
+    
+    def _send_json(self, data, status=200):
+        """Send data as a JSON response."""
+        self._send(status, json.dumps(data).encode('utf-8'), 'application/json; charset=utf-8')
+    
+    def _send(self, status, body, content_type=None, headers=None):
+        """Send a complete response."""
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,331 @@
+"""
+Offline benchmark suite
+
+Measures Top Songs against local stand-in servers (see stand_ins.py) instead of Billboard,
+Spotify and YouTube, so results are reproducible and can be compared between commits.
+
+Benchmarks:
+    parse: time to read songs out of a chart page, for each available parser
+    startup: time to get the chart with an empty chart cache (cold) and a fresh one (warm),
+        and time until the app window shows the chart, if a display is available
+    ui: time taken by TopSongsApp.create_song_widgets(), if a display is available
+    resolution: Spotify and YouTube lookups per second (see core.resolve_songs())
+
+The chart page served is a saved one if there is one (see stand_ins.py), and which page
+was used is recorded in the results. Benchmarks whose modules (or display) aren't available
+are skipped, and the reason is recorded in the results. Results are printed as JSON, or written to a file with --output.
+
+Usage:
+    python benchmarks/suite.py [--only parse startup ui resolution] [--latency SECONDS]
+        [--spotify-latency SECONDS] [--youtube-latency SECONDS] [--runs RUNS]
+        [--workers WORKERS] [--output FILE]
+"""
+
+from contextlib import contextmanager
+import statistics
+import importlib.util
+import tempfile
+import argparse
+import platform
+import shutil
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stand_ins import StandInServer, redirect_youtube_search
+
+BENCHMARKS = ('parse', 'startup', 'ui', 'resolution')
+CHART = 'hot-100'
+# Numbers of songs parsed, the whole chart and a typical "top 10".
+PARSE_SIZES = (100, 10)
+SPOTIFY_TOKEN = 'stand-in-token'
+# Seconds to wait for the app to show the chart before giving up.
+APP_TIMEOUT = 30
+
+
+class Skipped(Exception):
+    """Raised by a benchmark that can't run here, with the reason as its message."""
+
+
+def get_core():
+    """Import top_songs.core, after the stand-in urls have been set (see main())."""
+    return importlib.import_module('top_songs.core')
+
+
+def median_ms(function, runs):
+    """
+    Call a function a number of times and return the median time taken in milliseconds.
+    
+    :param function: function taking no arguments
+    :param int runs: number of calls
+    :rtype: float
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def connect_stand_in_spotify(server):
+    """Return a spotipy connection to a stand-in server, authorized with a made up token."""
+    from spotipy import Spotify
+    
+    sp_api = Spotify(auth=SPOTIFY_TOKEN, requests_session=get_core().get_spotify_session())
+    sp_api.prefix = f'{server.url}/v1/'
+    return sp_api
+
+
+def benchmark_parse(servers, runs, workers):
+    """
+    Time each available parser reading the chart page.
+    
+    :return: parser name mapped to number of songs mapped to median milliseconds
+    :rtype: dict[str: dict[int: float]]
+    """
+    from top_songs import parser
+    
+    core = get_core()
+    page = servers['billboard'].get_chart_page(CHART)
+    chunks = [page[i:i + core.CHART_CHUNK_SIZE] for i in range(0, len(page), core.CHART_CHUNK_SIZE)]
+    parsers = {'stream_' + ('lxml' if parser._get_etree() is not None else 'html.parser'): (
+        lambda n: parser.parse_chart_stream(iter(chunks), n)
+    )}
+    try:
+        import bs4
+        
+        parsers['bs4'] = lambda n: parser.parse_chart_html(page.decode('utf-8'), n)
+    except ImportError:
+        pass
+    results = {}
+    for name, parse in parsers.items():
+        results[name] = {n: median_ms(lambda: parse(n), runs) for n in PARSE_SIZES}
+    return results
+
+
+def benchmark_startup(servers, runs, workers):
+    """
+    Time getting the chart with a cold and a warm chart cache, and the app showing it.
+    
+    :return: "chart_cold_ms", "chart_warm_ms" and, with a display, "app_cold" and "app_warm"
+        (startup stage mapped to milliseconds, see TopSongsApp.get_startup_report())
+    :rtype: dict
+    """
+    from top_songs.cache import ChartCache
+    
+    core = get_core()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'chart_cache.json')
+        
+        def get_cold():
+            """Get the chart with an empty cache."""
+            if os.path.exists(filename):
+                os.remove(filename)
+            core.get_top_songs(100, ChartCache(filename))
+        
+        results['chart_cold_ms'] = median_ms(get_cold, runs)
+        cache = ChartCache(filename)
+        results['chart_warm_ms'] = median_ms(lambda: core.get_top_songs(100, cache), runs)
+    try:
+        results['app_cold'] = run_app(servers, warm=False)
+        results['app_warm'] = run_app(servers, warm=True)
+    except (Skipped, ImportError) as reason:
+        results['app_skipped'] = str(reason)
+    return results
+
+
+@contextmanager
+def open_app(servers, directory):
+    """
+    Create a TopSongsApp using the stand-in servers, and close it when done.
+    
+    :param str directory: working directory of the app, where it keeps its caches
+    :raise Skipped: if there is no display, or the window can't be opened here
+    
+    The app is only given back once it has shown the downloaded chart. It loads its
+    images relative to the working directory, so they are copied there first.
+    """
+    from top_songs.main import TopSongsApp
+    from tkinter import TclError
+    
+    sp_api = connect_stand_in_spotify(servers['spotify'])
+    os.makedirs(os.path.join(directory, 'top_songs'), exist_ok=True)
+    for filename in ('icon.ico', 'youtube.png', 'up_arrow.png'):
+        shutil.copy(os.path.join(ROOT, 'top_songs', filename), os.path.join(directory, 'top_songs', filename))
+    os.chdir(directory)
+    try:
+        try:
+            app = TopSongsApp(sp_api=sp_api)
+        except TclError as error:
+            # No display, or (away from Windows) the .ico window icon.
+            raise Skipped(f"couldn't open the window ({error})")
+        try:
+            wait_for_chart(app)
+            yield app
+        finally:
+            app.root.destroy()
+            app.device_cache.stop()
+    finally:
+        os.chdir(ROOT)
+
+
+def wait_for_chart(app):
+    """Run the app's event loop until its window has appeared and shown the downloaded chart."""
+    deadline = time.perf_counter() + APP_TIMEOUT
+    while 'chart' not in app.startup_times or 'window' not in app.startup_times:
+        if time.perf_counter() > deadline:
+            raise Skipped('app did not show the chart in time')
+        app.root.update()
+        time.sleep(0.001)
+
+
+def run_app(servers, warm):
+    """
+    Start the app and return how long each startup stage took to reach, in milliseconds.
+    
+    :param bool warm: start with this week's chart already cached
+    :rtype: dict[str: float]
+    """
+    from top_songs.cache import ChartCache, CHART_CACHE_FILE
+    
+    with tempfile.TemporaryDirectory() as directory:
+        if warm:
+            get_core().get_top_songs(100, ChartCache(os.path.join(directory, CHART_CACHE_FILE)))
+        with open_app(servers, directory) as app:
+            start = app.startup_times['start']
+            return {stage: (reached - start) * 1000 for stage, reached in app.startup_times.items() if stage != 'start'}
+
+
+def benchmark_ui(servers, runs, workers):
+    """
+    Time building the song rows (TopSongsApp.create_song_widgets()).
+    
+    :return: "create_song_widgets_ms" and "rows" (number of rows built)
+    :rtype: dict
+    """
+    with tempfile.TemporaryDirectory() as directory, open_app(servers, directory) as app:
+        canvas = app.widgets['canvas']
+        song_frames = app.widgets['song_frames']
+        
+        def rebuild():
+            """Remove every song row and build them again."""
+            for song_frame in song_frames:
+                canvas.delete(song_frame.item)
+                song_frame.destroy()
+            song_frames.clear()
+            app.create_song_widgets()
+            app.root.update_idletasks()
+        
+        milliseconds = median_ms(rebuild, runs)
+        return {'create_song_widgets_ms': milliseconds, 'rows': len(song_frames)}
+
+
+def benchmark_resolution(servers, runs, workers):
+    """
+    Resolve the whole chart on Spotify and YouTube, with no resolution cache.
+    
+    :return: service mapped to core.resolve_songs() stats
+    :rtype: dict[str: dict]
+    """
+    from top_songs.parser import parse_chart_stream
+    
+    # Raises ImportError without youtube_search, so the benchmark is skipped.
+    redirect_youtube_search(servers['youtube'].url)
+    core = get_core()
+    page = servers['billboard'].get_chart_page(CHART)
+    sp_api = connect_stand_in_spotify(servers['spotify'])
+    
+    def search_youtube(song):
+        """Find a song's music video, returning whether one was found."""
+        song.yt_url = core.search_youtube(song.name, song.artist)
+        return True
+    
+    results = {}
+    for service, resolve in (
+        ('spotify', lambda song: core.resolve_spotify_data(sp_api, song)),
+        ('youtube', search_youtube),
+    ):
+        runs_stats = [core.resolve_songs(parse_chart_stream([page], 100), resolve, workers) for _ in range(runs)]
+        results[service] = min(runs_stats, key=lambda stats: stats['seconds'])
+    return results
+
+
+def run(benchmarks, servers, runs, workers):
+    """
+    Run benchmarks and return their results.
+    
+    :param benchmarks: names of benchmarks to run, from BENCHMARKS
+    :param dict[str: StandInServer] servers: "billboard", "spotify" and "youtube" stand-ins
+    :param int runs: times each measurement is repeated
+    :param int workers: threads used to resolve songs
+    :rtype: dict
+    """
+    functions = {
+        'parse': benchmark_parse,
+        'startup': benchmark_startup,
+        'ui': benchmark_ui,
+        'resolution': benchmark_resolution,
+    }
+    results = {}
+    skipped = {}
+    for name in benchmarks:
+        try:
+            results[name] = functions[name](servers, runs, workers)
+        except (Skipped, ImportError) as reason:
+            skipped[name] = str(reason)
+    return {'results': results, 'skipped': skipped}
+
+
+def main():
+    """Start the stand-in servers, run the benchmarks and output results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help='benchmarks to run (default=all)')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='Billboard response delay in seconds (default=0.05)')
+    arg_parser.add_argument('--spotify-latency', type=float, default=0.03, help='Spotify response delay in seconds (default=0.03)')
+    arg_parser.add_argument('--youtube-latency', type=float, default=0.08, help='YouTube response delay in seconds (default=0.08)')
+    arg_parser.add_argument('--runs', type=int, default=5, help='times each measurement is repeated (default=5)')
+    arg_parser.add_argument('--workers', type=int, default=None, help='threads used to resolve songs (default=core.RESOLVE_WORKERS)')
+    arg_parser.add_argument('--output', help='file to write results to (default=print them)')
+    args = arg_parser.parse_args()
+    
+    servers = {
+        'billboard': StandInServer(args.latency),
+        'spotify': StandInServer(args.spotify_latency),
+        'youtube': StandInServer(args.youtube_latency),
+    }
+    for server in servers.values():
+        server.start()
+    # Top Songs reads these when top_songs.core is first imported.
+    os.environ['TOP_SONGS_BILLBOARD_URL'] = servers['billboard'].url
+    os.environ['TOP_SONGS_SPOTIFY_API_URL'] = servers['spotify'].url
+    workers = args.workers or get_core().RESOLVE_WORKERS
+    try:
+        report = run(args.only, servers, args.runs, workers)
+    finally:
+        for server in servers.values():
+            server.stop()
+    report['environment'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': {'billboard': args.latency, 'spotify': args.spotify_latency, 'youtube': args.youtube_latency},
+        'runs': args.runs,
+        'workers': workers,
+        'chart_page': servers['billboard'].get_chart_source(CHART),
+        'requests': {name: server.requests for name, server in servers.items()},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file_out:
+            file_out.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
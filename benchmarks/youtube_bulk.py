@@ -0,0 +1,168 @@
+"""
+Bulk music video resolution benchmark
+
+Measures how fast the music videos of a whole chart are found, and the memory it takes,
+three ways:
+    per_click: one search at a time, as clicking every song in turn would
+    threads: core.resolve_youtube_songs(), searching on a thread pool, as TopSongsApp does
+    processes: core.resolve_youtube_songs() with a search_pool, as a batch job could, the
+        pool's start up included
+
+Searches go to a local stand-in YouTube (see stand_ins.py), whose results pages are padded
+to the size of real ones and answered after --latency seconds. Each way starts with an empty
+ResolutionCache in a temporary directory and a fresh outbound gateway, so every song is
+searched for, and the cache is saved afterwards as TopSongsApp does.
+
+Memory is reported as the peak allocated by Python in this process (tracemalloc), and the
+largest resident size of any pool process, where the platform reports it.
+
+Results are printed as JSON, or written to a file with --output.
+
+Usage:
+    python benchmarks/youtube_bulk.py [--songs SONGS] [--latency SECONDS] [--workers WORKERS]
+        [--processes PROCESSES] [--only WAY [WAY ...]] [--output FILE]
+"""
+
+import tracemalloc
+import importlib
+import argparse
+import platform
+import tempfile
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stand_ins import StandInServer, make_chart_page, redirect_youtube_search
+
+WAYS = ('per_click', 'threads', 'processes')
+
+
+def get_children_max_rss():
+    """Return the largest resident size of any finished child process in bytes, or None if the platform doesn't say."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def resolve(way, songs, cache, workers, processes, url):
+    """
+    Find every song's music video one way.
+    
+    :param str way: one of WAYS
+    :param list[Song] songs: songs to resolve, their yt_url is set
+    :param ResolutionCache cache: empty cache to store results to
+    :param int workers: songs searched for at once (threads and processes)
+    :param int processes: processes in the search pool (processes)
+    :param str url: base url of the stand-in YouTube
+    :return: "resolved", "failed" and "seconds"
+    :rtype: dict
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    
+    core = importlib.import_module('top_songs.core')
+    if way == 'threads':
+        return core.resolve_youtube_songs(songs, cache, workers)
+    start = time.perf_counter()
+    if way == 'processes':
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=redirect_youtube_search,
+            initargs=(url,)
+        ) as search_pool:
+            stats = core.resolve_youtube_songs(songs, cache, workers, search_pool)
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+    resolved = sum(core.resolve_youtube_data(song, cache) for song in songs)
+    return {'resolved': resolved, 'failed': len(songs) - resolved, 'seconds': time.perf_counter() - start}
+
+
+def benchmark(way, songs, workers, processes, url):
+    """
+    Resolve a fresh copy of songs one way, from an empty cache, and return throughput and memory use.
+    
+    :return: "resolved", "failed", "seconds", "songs_per_second", "peak_python_bytes"
+        and "cache_entries"
+    :rtype: dict
+    """
+    from top_songs.cache import ResolutionCache
+    from top_songs.models import Song
+    from top_songs import outbound
+    
+    # Forget lookups made by earlier ways, which would otherwise answer this one's.
+    outbound.gateway = outbound.Gateway()
+    songs = [Song(song.number, song.name, song.artist) for song in songs]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResolutionCache(os.path.join(directory, 'resolution_cache.json'))
+        tracemalloc.start()
+        stats = resolve(way, songs, cache, workers, processes, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cache.save()
+        cache_entries = len(ResolutionCache(cache.filename).entries)
+    seconds = stats['seconds']
+    return {
+        'resolved': stats['resolved'],
+        'failed': stats['failed'],
+        'seconds': seconds,
+        'songs_per_second': stats['resolved'] / seconds if seconds else 0.0,
+        'peak_python_bytes': peak,
+        'cache_entries': cache_entries,
+    }
+
+
+def main():
+    """Start the stand-in YouTube, resolve the chart every way and output results."""
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--songs', type=int, default=100, help='songs resolved (default=100)')
+    arg_parser.add_argument('--latency', type=float, default=0.08, help='YouTube response delay in seconds (default=0.08)')
+    arg_parser.add_argument('--workers', type=int, default=None, help='songs searched for at once (default=core.YOUTUBE_WORKERS)')
+    arg_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='processes in the search pool (default=one per CPU)')
+    arg_parser.add_argument('--only', nargs='+', choices=WAYS, default=WAYS, help='ways to resolve songs (default=all)')
+    arg_parser.add_argument('--output', help='file to write results to (default=print them)')
+    args = arg_parser.parse_args()
+    
+    youtube = StandInServer(args.latency)
+    youtube.start()
+    redirect_youtube_search(youtube.url)
+    core = importlib.import_module('top_songs.core')
+    from top_songs.parser import parse_chart_stream
+    
+    songs = parse_chart_stream([make_chart_page()], args.songs)
+    workers = args.workers or core.YOUTUBE_WORKERS
+    results = {}
+    try:
+        for way in args.only:
+            results[way] = benchmark(way, songs, workers, args.processes, youtube.url)
+    finally:
+        youtube.stop()
+    results['children_max_rss_bytes'] = get_children_max_rss()
+    results['environment'] = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'songs': len(songs),
+        'latency': args.latency,
+        'workers': workers,
+        'processes': args.processes,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file_out:
+            file_out.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
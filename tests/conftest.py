@@ -0,0 +1,10 @@
+"""
+Shared test setup
+
+Makes top_songs importable when pytest is run from any directory, as the benchmarks do.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
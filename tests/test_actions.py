@@ -0,0 +1,91 @@
+"""
+Tests for top_songs.actions.ActionDispatcher, on a Tcl interpreter driven by hand so no display is needed.
+
+Slow actions stand in for Spotify and YouTube requests. While they run, a timer ticking every
+TICK_INTERVAL milliseconds must stay on time, as redraws and input events would.
+"""
+
+import threading
+import time
+
+import pytest
+
+tkinter = pytest.importorskip('tkinter')
+
+from top_songs.actions import ActionDispatcher
+
+# Milliseconds between ticks of the timer whose lateness is measured.
+TICK_INTERVAL = 10
+# Seconds each action takes.
+ACTION_SECONDS = 0.3
+# Most milliseconds a tick may be late while actions run, well above the dispatcher's
+# ACTION_POLL_INTERVAL cost but far below ACTION_SECONDS.
+MAX_LAG = 150
+
+
+@pytest.fixture
+def root():
+    """Return a Tcl interpreter, skipping the test if Tcl isn't installed."""
+    try:
+        return tkinter.Tcl()
+    except tkinter.TclError as error:
+        pytest.skip(f'Tcl not available: {error}')
+
+
+def run_until(root, condition, timeout=10):
+    """Handle events until condition() is true, failing the test after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out handling events'
+        root.dooneevent()
+
+
+def test_slow_actions_dont_delay_the_event_loop(root):
+    dispatcher = ActionDispatcher(root)
+    lags = []
+    state = {'next_tick': time.perf_counter() + TICK_INTERVAL / 1000, 'clicked': 0}
+    
+    def tick():
+        """Record how late this tick is and schedule the next one."""
+        now = time.perf_counter()
+        lags.append(max(now - state['next_tick'], 0.0))
+        state['next_tick'] = now + TICK_INTERVAL / 1000
+        root.after(TICK_INTERVAL, tick)
+    
+    def click():
+        """Submit a slow action for the next song, three clicks each, then schedule the next click."""
+        dispatcher.submit(('play', state['clicked'] // 3), time.sleep, ACTION_SECONDS)
+        state['clicked'] += 1
+        if state['clicked'] < 15:
+            root.after(20, click)
+    
+    root.after(TICK_INTERVAL, tick)
+    root.after(0, click)
+    try:
+        run_until(root, lambda: state['clicked'] == 15 and not any(dispatcher.is_pending(('play', song)) for song in range(5)))
+    finally:
+        dispatcher.stop()
+    assert max(lags) * 1000 < MAX_LAG
+    assert dispatcher.stats['started'] == 5
+    assert dispatcher.stats['dropped'] == 10
+
+
+def test_results_are_handed_to_the_loop_thread(root):
+    dispatcher = ActionDispatcher(root)
+    results = []
+    errors = []
+    
+    def fail():
+        """Raise like a failed request."""
+        raise ValueError('no results')
+    
+    dispatcher.submit(('play', 1), lambda: 'played', done=lambda result: results.append((result, threading.current_thread())))
+    dispatcher.submit(('play', 2), fail, failed=errors.append)
+    try:
+        run_until(root, lambda: not dispatcher.is_pending(('play', 1)) and not dispatcher.is_pending(('play', 2)))
+    finally:
+        dispatcher.stop()
+    assert results == [('played', threading.current_thread())]
+    assert [str(error) for error in errors] == ['no results']
+    assert dispatcher.stats['done'] == 1
+    assert dispatcher.stats['failed'] == 1
@@ -0,0 +1,85 @@
+"""
+Tests for top_songs.archive, backfilling from a local stub of www.billboard.com.
+
+The stub serves a chart page for any ?date=, with one song that is on every week's chart
+and one named after the chart's week, so overlapping backfills can be checked.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import threading
+import os
+
+import pytest
+
+pytest.importorskip('requests')
+
+from top_songs.archive import ChartArchive, get_chart_date
+from top_songs import core
+
+CHART = 'hot-100'
+ROW = (
+    '<div class="o-chart-results-list-row-container">\n'
+    '<ul class="o-chart-results-list-row">\n'
+    '<li class="o-chart-results-list__item"><span class="c-label a-font-primary-bold-l">{number}</span></li>\n'
+    '<li class="o-chart-results-list__item">\n'
+    '<h3 id="title-of-a-story" class="c-title a-no-trucate a-font-primary-bold-s">{name}</h3>\n'
+    '<span class="c-label a-no-trucate a-font-primary-s">{artist}</span>\n'
+    '</li>\n</ul>\n</div>\n'
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers every request with the chart of the week its ?date= falls in."""
+    
+    def do_GET(self):
+        """Answer a GET request."""
+        week = get_chart_date(parse_qs(urlsplit(self.path).query)['date'][0])
+        self.server.dates.append(week)
+        rows = ROW.format(number=1, name='Steady', artist='Artist') + ROW.format(number=2, name=f'Song {week}', artist='Artist')
+        body = f'<html><body><div class="chart-results-list">\n{rows}</div></body></html>'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        """Don't print requests."""
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Yield a running stub server that core.CHARTS[CHART] points at, with an empty list of requested weeks."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.dates = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    monkeypatch.setitem(core.CHARTS, CHART, f'http://{host}:{port}/charts/{CHART}')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_any_day_of_a_week_is_the_same_chart():
+    assert get_chart_date('2024-01-09') == get_chart_date('2024-01-12') == get_chart_date('2024-01-15') == '2024-01-09'
+    assert get_chart_date('2024-01-08') == '2024-01-02'
+
+
+def test_overlapping_backfills_store_each_week_once(stub, tmp_path):
+    archive = ChartArchive(os.path.join(tmp_path, 'charts.sqlite3'))
+    try:
+        # Saturday to Saturday, then Monday to Monday: the same five chart weeks.
+        first = archive.backfill(CHART, '2024-01-06', '2024-02-03', parse_workers=1)
+        assert len(first) == 5
+        assert archive.weeks_on_chart(CHART, 'Steady', 'Artist') == 5
+        assert archive.backfill(CHART, '2024-01-08', '2024-02-05', parse_workers=1) == []
+        assert archive.weeks_on_chart(CHART, 'Steady', 'Artist') == 5
+        assert sorted(stub.dates) == first
+        assert archive.movers(CHART, '2024-01-12') == [
+            ('Song 2024-01-09', 'Artist', None, 2),
+        ]
+    finally:
+        archive.close()
@@ -0,0 +1,83 @@
+"""
+Tests for top_songs.cache: which week ChartCache takes a stored chart to be from, and
+ResolutionCache's whole-song lookups.
+"""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import os
+
+from top_songs.cache import ChartCache, ResolutionCache, CHART_MATCH_ROWS, get_chart_week
+from top_songs.models import Song
+
+CHART = 'hot-100'
+
+
+def make_songs(names):
+    """Return a chart of songs with names, by one artist."""
+    return [Song(number, name, 'Artist') for number, name in enumerate(names, 1)]
+
+
+def make_cache(tmp_path, week, names):
+    """Return a ChartCache holding a chart from an earlier week, last checked long ago."""
+    cache = ChartCache(os.path.join(tmp_path, 'chart_cache.json'))
+    cache.store(CHART, make_songs(names), {})
+    cache.charts[CHART]['week'] = week
+    cache.charts[CHART]['checked'] = 0
+    return cache
+
+
+def last_week():
+    """Return the release date of last week's chart."""
+    return get_chart_week(datetime.now(timezone.utc) - timedelta(days=7))
+
+
+def test_new_chart_is_this_weeks(tmp_path):
+    cache = make_cache(tmp_path, last_week(), ['Old', 'Songs'])
+    cache.store(CHART, make_songs(['New', 'Songs']), {})
+    assert cache.charts[CHART]['week'] == get_chart_week()
+    assert cache.is_fresh(CHART, 2)
+
+
+def test_unchanged_chart_after_release_keeps_revalidating(tmp_path):
+    names = [f'Song {number}' for number in range(CHART_MATCH_ROWS)]
+    cache = make_cache(tmp_path, last_week(), names)
+    cache.store(CHART, make_songs(names), {})
+    assert cache.charts[CHART]['week'] == last_week()
+    # Just checked, so not asked again straight away...
+    assert cache.is_fresh(CHART, 2)
+    # ...but once REVALIDATE_INTERVAL has passed.
+    cache.charts[CHART]['checked'] = 0
+    assert not cache.is_fresh(CHART, 2)
+
+
+def test_short_chart_with_the_same_top_is_this_weeks(tmp_path):
+    names = [f'Song {number}' for number in range(CHART_MATCH_ROWS)]
+    cache = make_cache(tmp_path, last_week(), names)
+    # A top 10 that hasn't changed since last week.
+    cache.store(CHART, make_songs(names[:10]), {})
+    assert cache.charts[CHART]['week'] == get_chart_week()
+
+
+def test_chart_modified_before_release_is_last_weeks(tmp_path):
+    cache = make_cache(tmp_path, last_week(), ['Old', 'Songs'])
+    modified = datetime.now(timezone.utc) - timedelta(days=7)
+    cache.store(CHART, make_songs(['Other', 'Songs']), {'Last-Modified': format_datetime(modified, usegmt=True)})
+    assert cache.charts[CHART]['week'] == last_week()
+
+
+def test_bad_last_modified_is_ignored(tmp_path):
+    cache = make_cache(tmp_path, last_week(), ['Old', 'Songs'])
+    cache.store(CHART, make_songs(['New', 'Songs']), {'Last-Modified': 'not a date'})
+    assert cache.charts[CHART]['week'] == get_chart_week()
+
+
+def test_get_entry_returns_unexpired_results_as_one_lookup(tmp_path):
+    cache = ResolutionCache(os.path.join(tmp_path, 'resolution_cache.json'))
+    cache.put('Song', 'Artist', uri='spotify:track:1', yt_url='https://www.youtube.com/watch?v=1')
+    cache.entries[cache.make_key('Song', 'Artist')]['yt_url'][1] = 0
+    assert cache.get_entry(' song ', 'ARTIST') == {'uri': 'spotify:track:1'}
+    assert cache.get_stats()['hits'] == 1
+    assert cache.get_entry('Song', 'Artist', 'uri', 'art_url') == {'uri': 'spotify:track:1'}
+    assert cache.get_entry('Other', 'Artist') == {}
+    assert cache.get_stats()['misses'] == 2
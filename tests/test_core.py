@@ -0,0 +1,60 @@
+"""
+Tests for top_songs.core.merge_chart(): which positions are redrawn when a new chart arrives,
+and which songs keep the links already found for them.
+"""
+
+from top_songs.core import merge_chart
+from top_songs.models import Song
+
+
+def make_chart(*songs):
+    """Return a chart of (name, artist) songs, numbered in order."""
+    return [Song(number, name, artist) for number, (name, artist) in enumerate(songs, 1)]
+
+
+def get_rows(songs):
+    """Return (number, name, artist) of each song."""
+    return [(song.number, song.name, song.artist) for song in songs]
+
+
+def test_unchanged_chart_changes_nothing():
+    old = make_chart(('Owl', 'Fire'), ('Rain', 'Cloud'))
+    songs, changed = merge_chart(old, make_chart(('Owl', 'Fire'), ('Rain', 'Cloud')))
+    assert changed == []
+    assert songs[0] is old[0] and songs[1] is old[1]
+
+
+def test_moved_new_and_dropped_songs():
+    old = make_chart(('Owl', 'Fire'), ('Rain', 'Cloud'), ('Gone', 'Away'), ('Stay', 'Put'))
+    new = make_chart(('Rain', 'Cloud'), ('Owl', 'Fire'), ('Fresh', 'Face'), ('Stay', 'Put'))
+    songs, changed = merge_chart(old, new)
+    assert get_rows(songs) == get_rows(new)
+    # Two songs swapped places and a new one replaced a dropped one, the last didn't move.
+    assert changed == [0, 1, 2]
+    assert songs[0] is old[1] and songs[1] is old[0] and songs[3] is old[3]
+    assert songs[2] is new[2]
+
+
+def test_shorter_and_longer_charts_change_the_extra_positions():
+    old = make_chart(('Owl', 'Fire'), ('Rain', 'Cloud'), ('Gone', 'Away'))
+    songs, changed = merge_chart(old, make_chart(('Owl', 'Fire')))
+    assert changed == [1, 2]
+    assert len(songs) == 1
+    songs, changed = merge_chart(songs, make_chart(('Owl', 'Fire'), ('Fresh', 'Face')))
+    assert changed == [1]
+
+
+def test_links_are_kept_for_songs_still_on_the_chart():
+    old = make_chart(('Owl', 'Fire'), ('Gone', 'Away'))
+    old[0].uri = 'spotify:track:owl'
+    old[0].artist_uri = 'spotify:artist:fire'
+    old[0].yt_url = 'https://www.youtube.com/watch?v=owl'
+    old[1].uri = 'spotify:track:gone'
+    new = make_chart(('Fresh', 'Face'), ('Owl', 'Fire'))
+    songs, changed = merge_chart(old, new)
+    assert changed == [0, 1]
+    assert songs[1].number == 2
+    assert songs[1].uri == 'spotify:track:owl'
+    assert songs[1].artist_uri == 'spotify:artist:fire'
+    assert songs[1].yt_url == 'https://www.youtube.com/watch?v=owl'
+    assert songs[0].uri is None and songs[0].yt_url is None
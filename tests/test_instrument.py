@@ -0,0 +1,30 @@
+"""
+Tests for top_songs.instrument's environment variables.
+"""
+
+import pytest
+
+from top_songs import instrument
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    """Replace the shared recorder with a fresh one, stopping any dump it starts."""
+    recorder = instrument.Recorder()
+    monkeypatch.setattr(instrument, 'recorder', recorder)
+    yield recorder
+    recorder.stop_dump()
+
+
+@pytest.mark.parametrize('interval', ['x', 'yes', '0', '-5', 'nan'])
+def test_bad_stats_interval_is_ignored(recorder, capsys, interval):
+    instrument.configure_from_environment({instrument.STATS_VARIABLE: interval})
+    assert not recorder.enabled
+    assert recorder._dump_stopped is None
+    assert instrument.STATS_VARIABLE in capsys.readouterr().err
+
+
+def test_stats_interval_starts_dumping(recorder):
+    instrument.configure_from_environment({instrument.STATS_VARIABLE: '60'})
+    assert recorder.enabled
+    assert recorder._dump_stopped is not None
@@ -0,0 +1,147 @@
+"""
+Tests for top_songs.outbound.Gateway, against a local stub service.
+
+The stub answers each request with the next of a list of scripted statuses, after a delay,
+and counts requests, so single-flight, retries and negative caching can be checked by how
+many requests reach it.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+import time
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+from top_songs.outbound import Gateway
+from top_songs import outbound
+
+SERVICE = 'youtube'
+KEY = ('Song', 'Artist')
+VIDEOS = ['https://www.youtube.com/watch?v=stub']
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers every request with the server's next scripted status, after the server's delay."""
+    
+    def do_GET(self):
+        """Answer a GET request."""
+        with self.server.lock:
+            self.server.requests += 1
+            status = self.server.answers.pop(0) if self.server.answers else 200
+        time.sleep(self.server.delay)
+        body = json.dumps(self.server.videos if status == 200 else {'error': status}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        """Don't print requests."""
+
+
+@pytest.fixture
+def stub():
+    """Yield a running stub server, answering 200 with VIDEOS straight away unless told otherwise."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.answers = []
+    server.delay = 0.0
+    server.videos = VIDEOS
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_search(server):
+    """Return a function searching the stub as core does: raising for error answers, and IndexError if nothing was found."""
+    host, port = server.server_address
+    
+    def search():
+        """Send a search request to the stub and return the first result."""
+        with requests.get(f'http://{host}:{port}/search', timeout=5) as response:
+            response.raise_for_status()
+            return response.json()[0]
+    
+    return search
+
+
+def test_identical_calls_send_one_request(stub):
+    stub.delay = 0.3
+    gateway = Gateway()
+    search = make_search(stub)
+    callers = 8
+    start = threading.Barrier(callers)
+    results = []
+    
+    def look_up():
+        """Wait for every caller, then look the song up."""
+        start.wait()
+        results.append(gateway.call(SERVICE, KEY, search))
+    
+    threads = [threading.Thread(target=look_up) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == VIDEOS * callers
+    assert stub.requests == 1
+    assert gateway.stats[SERVICE] == {'sent': 1, 'coalesced': callers - 1}
+
+
+def test_server_errors_are_retried_with_jitter(stub, monkeypatch):
+    stub.answers = [503, 500]
+    gateway = Gateway(backoff=0.01)
+    waits = []
+    
+    def uniform(low, high):
+        """Record the range a backoff is picked from, and wait as little as possible."""
+        waits.append((low, high))
+        return low
+    
+    monkeypatch.setattr(outbound.random, 'uniform', uniform)
+    assert gateway.call(SERVICE, KEY, make_search(stub)) == VIDEOS[0]
+    assert stub.requests == 3
+    # A random wait up to the backoff, doubled for each retry.
+    assert waits == [(0, 0.01), (0, 0.02)]
+    assert gateway.stats[SERVICE] == {'sent': 3, 'retried': 2}
+
+
+def test_client_errors_and_the_last_attempt_are_raised(stub):
+    gateway = Gateway(backoff=0.01)
+    stub.answers = [404]
+    with pytest.raises(requests.HTTPError):
+        gateway.call(SERVICE, KEY, make_search(stub))
+    assert stub.requests == 1
+    stub.answers = [503, 503, 503]
+    with pytest.raises(requests.HTTPError):
+        gateway.call(SERVICE, KEY, make_search(stub))
+    assert stub.requests == 1 + gateway.max_attempts
+
+
+def test_not_found_is_remembered_until_it_expires(stub):
+    stub.videos = []
+    gateway = Gateway(negative_ttl=0.5)
+    search = make_search(stub)
+    with pytest.raises(IndexError):
+        gateway.call(SERVICE, KEY, search)
+    assert stub.requests == 1
+    with pytest.raises(IndexError):
+        gateway.call(SERVICE, KEY, search)
+    assert stub.requests == 1
+    assert gateway.stats[SERVICE]['negative_hit'] == 1
+    # Other lookups are still sent.
+    with pytest.raises(IndexError):
+        gateway.call(SERVICE, ('Other', 'Artist'), search)
+    assert stub.requests == 2
+    time.sleep(0.6)
+    stub.videos = VIDEOS
+    assert gateway.call(SERVICE, KEY, search) == VIDEOS[0]
+    assert stub.requests == 3
@@ -0,0 +1,92 @@
+"""
+Tests for top_songs.parser: the streaming chart parser must return the same songs as the reference parser.
+
+The saved page in fixtures/hot-100.html follows the layout of www.billboard.com chart pages,
+with the awkward parts of the real thing: markup and entities in titles, featured artists,
+multibyte characters, comments and scripts that look like rows, and headings outside rows.
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip('bs4')
+
+from top_songs import parser
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'hot-100.html')
+# Rows on the saved page.
+ROWS = 25
+
+
+@pytest.fixture(scope='module')
+def page():
+    """Return the saved chart page as bytes."""
+    with open(FIXTURE, 'rb') as file_in:
+        return file_in.read()
+
+
+@pytest.fixture(params=['html.parser', 'lxml'])
+def backend(request, monkeypatch):
+    """Run a test with each of iter_chart_rows()' parsers, skipping lxml when it isn't installed."""
+    if request.param == 'lxml':
+        if parser._get_etree() is None:
+            pytest.skip('lxml is not installed')
+    else:
+        monkeypatch.setattr(parser, '_get_etree', lambda: None)
+    return request.param
+
+
+def split(data, size):
+    """Return data in chunks of size bytes."""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def split_awkwardly(data):
+    """Return data split inside every multibyte character, entity and tag it has."""
+    cuts = set()
+    for i, byte in enumerate(data):
+        if byte >= 0x80 or data[i:i + 1] in (b'&', b'<'):
+            cuts.add(i + 1)
+    cuts = sorted(cuts)
+    return [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+
+
+@pytest.mark.parametrize('n', [1, 5, 10, ROWS, ROWS + 10])
+def test_same_songs_as_reference(page, backend, n):
+    expected = parser.parse_chart_html(page.decode('utf-8'), n)
+    assert len(expected) == min(n, ROWS)
+    assert list(parser.iter_chart_rows([page], n)) == expected
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 4096])
+def test_chunk_size_does_not_matter(page, backend, size):
+    expected = parser.parse_chart_html(page.decode('utf-8'), ROWS)
+    assert parser.parse_chart_stream(split(page, size), ROWS) == expected
+
+
+def test_chunks_split_inside_characters_entities_and_tags(page, backend):
+    chunks = split_awkwardly(page)
+    assert any(len(chunk.decode('utf-8', errors='ignore')) < len(chunk) for chunk in chunks)
+    expected = parser.parse_chart_html(page.decode('utf-8'), ROWS)
+    assert parser.parse_chart_stream(chunks, ROWS) == expected
+
+
+def test_stops_reading_after_n_rows(page, backend):
+    chunks = split(page, 256)
+    read = []
+    
+    def download():
+        """Yield chunks, recording how many have been read."""
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+    
+    songs = parser.parse_chart_stream(download(), 3)
+    assert [song.number for song in songs] == [1, 2, 3]
+    # The third row ends well before the middle of the page.
+    assert len(read) < len(chunks) // 2
+
+
+def test_no_rows_read_for_n_zero(page, backend):
+    assert parser.parse_chart_stream(iter(split(page, 256)), 0) == []
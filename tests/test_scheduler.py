@@ -0,0 +1,101 @@
+"""
+Tests for top_songs.scheduler, against a local stub of the Spotify Web API.
+
+The stub answers each request with the next of a list of scripted answers, so rate limiting
+and server errors can be tested without talking to Spotify.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+import time
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('spotipy')
+
+from top_songs.scheduler import SpotifyScheduler
+from top_songs import core
+
+# Seconds the stub asks to wait after a 429, longer than scheduler.DEFAULT_RETRY_AFTER.
+RETRY_AFTER = 2
+SEARCH_RESULT = {'tracks': {'items': [], 'total': 0}}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers every request with the server's next scripted (status, headers) answer."""
+    
+    def do_GET(self):
+        """Answer a GET request."""
+        status, headers = self.server.answers.pop(0) if self.server.answers else (200, {})
+        self.server.times.append(time.monotonic())
+        body = json.dumps(SEARCH_RESULT if status == 200 else {'error': {'status': status, 'message': 'stub'}})
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+    
+    def log_message(self, *args):
+        """Don't print requests."""
+
+
+@pytest.fixture
+def stub():
+    """Yield a running stub server, with empty answers and request times lists."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.daemon_threads = True
+    server.answers = []
+    server.times = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connect_stub(server):
+    """Return a SpotifyScheduler around a spotipy connection to the stub, set up as core.connect_spotify() does."""
+    from spotipy import Spotify
+    
+    sp_api = Spotify(auth='stub-token', requests_session=core.get_spotify_session(), requests_timeout=5)
+    host, port = server.server_address
+    sp_api.prefix = f'http://{host}:{port}/v1/'
+    return SpotifyScheduler(sp_api, rate=100, burst=100)
+
+
+def test_retry_after_is_honoured(stub):
+    stub.answers = [(429, {'Retry-After': str(RETRY_AFTER)})]
+    scheduler = connect_stub(stub)
+    assert scheduler.search(q='song', type='track') == SEARCH_RESULT
+    assert len(stub.times) == 2
+    assert stub.times[1] - stub.times[0] >= RETRY_AFTER
+    stats = scheduler.get_stats()
+    assert stats['throttled'] == 1
+    assert stats['rate'] < scheduler.max_rate
+
+
+def test_server_error_is_retried_without_throttling(stub):
+    stub.answers = [(503, {}), (500, {})]
+    scheduler = connect_stub(stub)
+    assert scheduler.search(q='song', type='track') == SEARCH_RESULT
+    assert len(stub.times) == 3
+    stats = scheduler.get_stats()
+    assert stats['throttled'] == 0
+    assert stats['retried'] == 2
+    assert stats['rate'] == scheduler.max_rate
+    assert stats['paused'] == 0
+
+
+def test_client_error_is_not_retried(stub):
+    from spotipy import SpotifyException
+    
+    stub.answers = [(404, {})]
+    scheduler = connect_stub(stub)
+    with pytest.raises(SpotifyException) as error:
+        scheduler.search(q='song', type='track')
+    assert error.value.http_status == 404
+    assert len(stub.times) == 1
@@ -0,0 +1,67 @@
+"""
+Tests for top_songs.search.SearchIndex, indexing songs by chart position as TopSongsApp does.
+"""
+
+from top_songs.search import SearchIndex, get_words
+from top_songs.core import merge_chart
+from top_songs.models import Song
+
+CHART = [
+    ('Night Owl', 'Wild Fire'),
+    ('Fire On Fire', 'Sam Smith'),
+    ('Owl City', 'Adam Young'),
+    ('Crazy In Love', 'Beyoncé ft. JAY-Z'),
+    ("Don't Start Now", 'Dua Lipa'),
+]
+
+
+def make_index(chart=CHART):
+    """Return an index of a chart's songs by index in the chart."""
+    return SearchIndex((index, texts) for index, texts in enumerate(chart))
+
+
+def test_words_are_folded():
+    assert get_words("Beyoncé ft. JAY-Z Don't") == ['beyonce', 'ft', 'jay', 'z', 'dont']
+
+
+def test_every_query_word_must_start_a_word_of_name_or_artist():
+    index = make_index()
+    assert index.search('owl') == [0, 2]
+    assert index.search('owl fire') == [0]
+    assert index.search('fi') == [0, 1]
+    assert index.search('owl sam') == []
+
+
+def test_case_and_accents_are_ignored():
+    index = make_index()
+    assert index.search('BEYONCE') == [3]
+    assert index.search('beyoncé jay') == [3]
+    assert index.search('dont') == [4]
+
+
+def test_empty_query_matches_every_song():
+    index = make_index()
+    assert index.search('') == [0, 1, 2, 3, 4]
+    assert index.search('  ... ') == [0, 1, 2, 3, 4]
+
+
+def test_typing_narrows_results():
+    index = make_index()
+    assert [index.search(query) for query in ('o', 'ow', 'owl', 'owl c')] == [[0, 1, 2], [0, 2], [0, 2], [2]]
+
+
+def test_results_stay_in_chart_order_after_a_refresh():
+    songs = [Song(number, name, artist) for number, (name, artist) in enumerate(CHART, 1)]
+    index = make_index()
+    assert index.search('owl') == [0, 2]
+    new_chart = [CHART[2], ('Owl Eyes', 'New Artist'), CHART[0], CHART[3]]
+    songs, changed = merge_chart(songs, [Song(number, name, artist) for number, (name, artist) in enumerate(new_chart, 1)])
+    # Reindex the changed positions, as TopSongsApp.show_songs() does.
+    for position in changed:
+        index.remove(position)
+        if position < len(songs):
+            index.add(position, songs[position].name, songs[position].artist)
+    assert index.search('owl') == [0, 1, 2]
+    assert [songs[position].name for position in index.search('owl')] == ['Owl City', 'Owl Eyes', 'Night Owl']
+    assert index.search('dua') == []
+    assert index.search('') == [0, 1, 2, 3]
@@ -5,10 +5,34 @@ Contains main code for TopSongs app.
 
 Modules:
     main.py
+    __main__.py
+    core.py
+    models.py
+    cache.py
+    artwork.py
+    prefetch.py
+    actions.py
+    scheduler.py
+    outbound.py
+    service.py
+    parser.py
+    devices.py
+    archive.py
+    search.py
+    instrument.py
 
 Resources:
     up_arrow.png
     youtube.png
+
+TopSongsApp (and with it tkinter, PIL and spotipy) is only imported when first used,
+so programs that only want chart data can import top_songs.core on its own.
 """
 
-from top_songs.main import TopSongsApp
+
+def __getattr__(name):
+    """Import TopSongsApp from main.py when it is first used."""
+    if name == 'TopSongsApp':
+        from top_songs.main import TopSongsApp
+        return TopSongsApp
+    raise AttributeError(f"module 'top_songs' has no attribute '{name}'")
@@ -0,0 +1,184 @@
+"""
+Module __main__
+
+Writes a Billboard chart to standard output as NDJSON (one JSON object per line, per song),
+for batch jobs and servers without a display. Run with: python -m top_songs
+
+Each song is written as soon as it is ready: straight away when it is read from the chart
+page, or once its links have been found when --spotify or --youtube are given. Songs
+being resolved at once may finish out of order, so use "number" to sort them.
+
+Only core code is imported, never tkinter or PIL (see top_songs/__init__.py).
+
+Record fields:
+    number, name, artist: always written
+    uri, artist_uri, art_url: Spotify track, artist and album art, with --spotify (null if not found)
+    yt_url: YouTube music video, with --youtube (null if not found)
+
+Functions:
+    parse_args(args)
+    make_record(song, services)
+    read_cached_links(song, cache, services)
+    main(args)
+"""
+
+from top_songs.cache import ChartCache, ResolutionCache
+from top_songs import core
+import threading
+import argparse
+import json
+import sys
+import os
+
+SERVICES = ('spotify', 'youtube')
+
+
+def parse_args(args=None):
+    """
+    Read command line options.
+    
+    :param list[str] args: command line arguments (default=sys.argv[1:])
+    :rtype: argparse.Namespace
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m top_songs',
+        description='Write a Billboard chart as NDJSON, one song per line, as each song is read or resolved.',
+    )
+    arg_parser.add_argument('--chart', choices=sorted(core.CHARTS), default=core.HOT_100, help=f'chart to read (default={core.HOT_100})')
+    arg_parser.add_argument('--limit', type=int, default=100, help='number of songs to write (default=100)')
+    arg_parser.add_argument('--spotify', action='store_true', help='add Spotify track, artist and album art links')
+    arg_parser.add_argument('--youtube', action='store_true', help='add YouTube music video links')
+    arg_parser.add_argument('--workers', type=int, default=core.RESOLVE_WORKERS, help=f'songs resolved at once (default={core.RESOLVE_WORKERS})')
+    arg_parser.add_argument('--cache-only', action='store_true', help='only use links found before, never search Spotify or YouTube')
+    arg_parser.add_argument('--offline', action='store_true', help='never use the network: read the last downloaded chart, implies --cache-only')
+    options = arg_parser.parse_args(args)
+    if options.limit < 1:
+        arg_parser.error('--limit must be at least 1')
+    if options.workers < 1:
+        arg_parser.error('--workers must be at least 1')
+    options.cache_only = options.cache_only or options.offline
+    options.services = [service for service in SERVICES if getattr(options, service)]
+    return options
+
+
+def make_record(song, services):
+    """
+    Return a song as a dictionary to be written as one line of NDJSON.
+    
+    :param Song song: song to write
+    :param services: services whose links are included, from SERVICES
+    :rtype: dict
+    """
+    record = {'number': song.number, 'name': song.name, 'artist': song.artist}
+    if 'spotify' in services:
+        record['uri'] = song.uri
+        record['artist_uri'] = song.artist_uri
+        record['art_url'] = song.art_url
+    if 'youtube' in services:
+        record['yt_url'] = song.yt_url
+    return record
+
+
+def read_cached_links(song, cache, services):
+    """
+    Set a song's links from the resolution cache only, leaving links not found there as None.
+    
+    :param Song song: song to resolve
+    :param ResolutionCache cache: links found in previous sessions
+    :param services: services whose links are read, from SERVICES
+    """
+    entry = cache.get_entry(song.name, core.get_real_artist(song.artist))
+    if 'spotify' in services:
+        song.uri = entry.get('uri')
+        song.artist_uri = entry.get('artist_uri')
+        # An empty url is stored for albums without art (see core.search_spotify_track()).
+        song.art_url = entry.get('art_url') or None
+    if 'youtube' in services:
+        song.yt_url = entry.get('yt_url')
+
+
+def main(args=None):
+    """
+    Write a chart to standard output as NDJSON.
+    
+    :param list[str] args: command line arguments (default=sys.argv[1:])
+    :return: exit status, 0 if the chart was written, 1 if it couldn't be loaded
+    :rtype: int
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    options = parse_args(args)
+    chart_cache = ChartCache()
+    resolution_cache = ResolutionCache() if options.services else None
+    resolvers = []
+    if options.services and options.cache_only:
+        resolvers.append(lambda song: read_cached_links(song, resolution_cache, options.services))
+    else:
+        if 'spotify' in options.services:
+            try:
+                sp_api = core.connect_spotify_app()
+            except OSError as error:
+                print(f'Spotify credentials not found ({error}), see README.md.', file=sys.stderr)
+                return 1
+            resolvers.append(lambda song: core.resolve_spotify_data(sp_api, song, resolution_cache))
+        if 'youtube' in options.services:
+            resolvers.append(lambda song: core.resolve_youtube_data(song, resolution_cache))
+    write_lock = threading.Lock()
+    # Set when the reader goes away (e.g. piped into head), to stop resolving songs nobody will read.
+    closed = threading.Event()
+    
+    def write(song):
+        """Write a song as one line of NDJSON, flushed so the reader gets it straight away."""
+        line = json.dumps(make_record(song, options.services), ensure_ascii=False) + '\n'
+        with write_lock:
+            if closed.is_set():
+                return
+            try:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                closed.set()
+    
+    def resolve_and_write(song):
+        """Find a song's links, then write it."""
+        if closed.is_set():
+            return
+        for resolve in resolvers:
+            resolve(song)
+        write(song)
+    
+    if options.offline:
+        songs = chart_cache.get_songs(options.chart)[:options.limit]
+    else:
+        songs = core.iter_chart(options.chart, options.limit, chart_cache)
+    written = 0
+    with ThreadPoolExecutor(max_workers=options.workers) as executor:
+        futures = []
+        for song in songs:
+            if closed.is_set():
+                break
+            if resolvers:
+                # Resolve songs while the rest of the chart is still downloading.
+                futures.append(executor.submit(resolve_and_write, song))
+            else:
+                write(song)
+            written += 1
+        for future in futures:
+            future.result()
+    if resolution_cache is not None and not options.cache_only:
+        resolution_cache.save()
+    if closed.is_set():
+        # Python would otherwise complain about stdout when it closes it.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    if not written:
+        if options.offline:
+            print(f'No {options.chart} chart has been downloaded yet, run without --offline first.', file=sys.stderr)
+        else:
+            print(f"Couldn't load the {options.chart} chart, check your internet connection.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
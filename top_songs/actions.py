@@ -0,0 +1,156 @@
+"""
+Module actions
+
+Runs what clicking a song does (searching Spotify or YouTube, finding a player, starting
+playback, opening a browser) on a small thread pool, so the Tkinter thread never waits
+for the network and the window keeps responding while a click is being handled.
+
+Classes:
+    ActionDispatcher
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from top_songs import instrument
+import threading
+import queue
+
+# Actions running at once. Clicks are one at a time, so a few is plenty.
+ACTION_WORKERS = 4
+# Milliseconds between checks for finished actions, while any are running.
+ACTION_POLL_INTERVAL = 50
+
+
+class ActionDispatcher:
+    """
+    A class to run click handlers in the background and hand their results to the Tkinter thread.
+    
+    Actions are submitted with a key, their name and what they act on, e.g. ("play", song key).
+    While an action is running, submitting another with the same key does nothing, so clicking
+    a row again while it's still being handled doesn't send the same requests again. Callers
+    can show which keys are pending (e.g. greyed out buttons), on_pending is called when an
+    action starts and when it finishes.
+    
+    Actions run on a thread pool. Their results (or errors) are queued, and passed to their
+    done (or failed) functions on the Tkinter thread, found with root.after() while any
+    action is running. Only root.after() is used, so root can be any Tk or Tcl interpreter.
+    
+    Outcomes are counted in self.stats and with instrument.count() as "action.<outcome>".
+    
+    Attributes:
+        root : Tk
+            Tkinter window whose thread results are handed to
+        on_pending : function
+            called on the Tkinter thread with a key and whether it's now pending, or None
+        stats : dict[str: int]
+            outcome ("started", "done", "failed", "dropped") mapped to number of actions
+    
+    Methods:
+        submit(self, key, work, *args, done, failed):
+            Run a function on the thread pool, unless an action with the same key is running.
+        is_pending(self, key):
+            Check whether an action with a key is running, or waiting to be handed back.
+        poll(self):
+            Pass results of finished actions to their done or failed functions.
+        stop(self):
+            Stop running actions, skipping those not yet started.
+    """
+    
+    def __init__(self, root, on_pending=None, max_workers=ACTION_WORKERS, initializer=None):
+        """
+        Create attributes for ActionDispatcher object.
+        
+        :param Tk root: Tkinter window whose thread results are handed to
+        :param on_pending: function called with a key and whether it's now pending (default=None)
+        :param int max_workers: actions running at once (default=ACTION_WORKERS)
+        :param initializer: function called on each pool thread when it starts (default=None)
+        """
+        self.root = root
+        self.on_pending = on_pending
+        self.stats = {'started': 0, 'done': 0, 'failed': 0, 'dropped': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='action', initializer=initializer)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._finished = queue.Queue()
+        self._polling = False
+    
+    def submit(self, key, work, *args, done=None, failed=None):
+        """
+        Run a function on the thread pool, unless an action with the same key is running.
+        
+        :param tuple key: action name and what it acts on, e.g. ("play", song key)
+        :param work: function run on a pool thread with args, it must not use Tkinter
+        :param args: arguments passed to work
+        :param done: function called on the Tkinter thread with work's return value (default=None)
+        :param failed: function called on the Tkinter thread with the exception work raised
+            (default=None, the error is reported like any error in a Tkinter callback)
+        :return: whether the action was started, False if it was dropped as a duplicate
+        :rtype: bool
+        
+        Must be called on the Tkinter thread.
+        """
+        if key in self._pending:
+            self._record('dropped')
+            return False
+        self._pending[key] = (done, failed)
+        self._record('started')
+        self._executor.submit(self._run, key, work, args)
+        if self.on_pending is not None:
+            self.on_pending(key, True)
+        if not self._polling:
+            self._polling = True
+            self.root.after(ACTION_POLL_INTERVAL, self.poll)
+        return True
+    
+    def is_pending(self, key):
+        """Check whether an action with a key is running, or waiting to be handed back to the Tkinter thread."""
+        return key in self._pending
+    
+    def poll(self):
+        """
+        Pass results of finished actions to their done or failed functions.
+        
+        Must be called on the Tkinter thread. Called by root.after() while actions are running,
+        and again later while any still are.
+        """
+        while True:
+            try:
+                key, result, error = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            done, failed = self._pending.pop(key)
+            if self.on_pending is not None:
+                self.on_pending(key, False)
+            if error is None:
+                self._record('done')
+                if done is not None:
+                    done(result)
+            else:
+                self._record('failed')
+                if failed is not None:
+                    failed(error)
+                else:
+                    self.root.report_callback_exception(type(error), error, error.__traceback__)
+        if self._pending:
+            self.root.after(ACTION_POLL_INTERVAL, self.poll)
+        else:
+            self._polling = False
+    
+    def stop(self):
+        """Stop running actions, skipping those not yet started. Results of running actions are dropped."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _run(self, key, work, args):
+        """Run an action on a pool thread and queue its result for poll()."""
+        with instrument.span('action.run', action=key[0]):
+            try:
+                result = work(*args)
+            except Exception as error:
+                self._finished.put((key, None, error))
+                return
+        self._finished.put((key, result, None))
+    
+    def _record(self, outcome):
+        """Count an action outcome in self.stats and with instrument."""
+        with self._lock:
+            self.stats[outcome] += 1
+        instrument.count(f'action.{outcome}')
@@ -0,0 +1,400 @@
+"""
+Module archive
+
+Downloads and stores past weeks of Billboard charts, and answers questions about them.
+
+Charts are stored in SQLite in a compact, column-like layout. Song names and artists are
+interned (stored once, referred to by id), songs are (name id, artist id) pairs, and each
+week of a chart is a single array of song ids ordered by rank. An in-memory index built from
+those arrays answers questions like "weeks on chart" without re-reading any HTML.
+
+Classes:
+    ChartArchive
+
+Functions:
+    get_chart_date(day)
+    get_chart_weeks(start, end)
+    get_chart_url(chart, week)
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from top_songs.cache import get_chart_week
+from top_songs.parser import parse_chart_stream
+from top_songs.search import SearchIndex
+from top_songs.models import Song
+from top_songs import outbound
+from top_songs import core
+from array import array
+import sqlite3
+
+ARCHIVE_FILE = 'charts.sqlite3'
+# Downloading is network bound, parsing is CPU bound, so they get separate pools.
+FETCH_WORKERS = 8
+PARSE_WORKERS = None  # One per CPU.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    name_id INTEGER NOT NULL REFERENCES strings (id),
+    artist_id INTEGER NOT NULL REFERENCES strings (id),
+    UNIQUE (name_id, artist_id)
+);
+CREATE TABLE IF NOT EXISTS weeks (
+    chart TEXT NOT NULL,
+    week TEXT NOT NULL,
+    song_ids BLOB NOT NULL,
+    PRIMARY KEY (chart, week)
+);
+'''
+
+
+def get_chart_date(day):
+    """
+    Return the release date of the chart that was current at the end of a day (see cache.get_chart_week()).
+    
+    :param str day: ISO date
+    :rtype: str
+    
+    Weeks are stored under this date, so any day of a chart's week refers to the same chart.
+    """
+    return get_chart_week(datetime.combine(date.fromisoformat(day), time.max, timezone.utc))
+
+
+def get_chart_weeks(start, end):
+    """
+    Return the weekly chart dates from start to end (inclusive), one week apart.
+    
+    :param str start: ISO date in the first week
+    :param str end: ISO date in the last week
+    :return: release dates of the charts (see get_chart_date())
+    :rtype: list[str]
+    """
+    week = date.fromisoformat(get_chart_date(start))
+    last = date.fromisoformat(get_chart_date(end))
+    weeks = []
+    while week <= last:
+        weeks.append(week.isoformat())
+        week += timedelta(days=7)
+    return weeks
+
+
+def get_chart_url(chart, week):
+    """Return the url of a chart as it was on a given week."""
+    return f'{core.CHARTS[chart]}?date={week}'
+
+
+def _parse_week(html, n):
+    """Parse a downloaded chart page, returning (name, artist) pairs in rank order. Runs in a worker process."""
+    return [song.get_key() for song in parse_chart_stream([html], n)]
+
+
+class ChartArchive:
+    """
+    A class to store past weeks of charts in SQLite and answer questions about them.
+    
+    Attributes:
+        filename : str
+            path of SQLite database
+        connection : Connection
+            connection to the database
+        strings : list[str]
+            interned names and artists, indexed by string id
+        string_ids : dict[str: int]
+            interned string mapped to string id
+        songs : list[tuple[int, int]]
+            (name id, artist id) of each song, indexed by song id
+        song_ids : dict[tuple[int, int]: int]
+            (name id, artist id) mapped to song id
+        weeks : dict[str: dict[str: array]]
+            chart name mapped to week mapped to song ids in rank order
+        history : dict[str: dict[int: list[tuple[str, int]]]]
+            chart name mapped to song id mapped to (week, rank) of every appearance
+        search_index : SearchIndex
+            songs' names and artists by song id, built on the first search (None until then)
+    
+    Methods:
+        load(self):
+            Read interned strings, songs and weeks from the database and build indexes.
+        backfill(self, chart, start, end, n, fetch_workers, parse_workers):
+            Download, parse and store every week of a chart in a date range that isn't stored yet.
+        add_week(self, chart, week, songs):
+            Store one week of a chart.
+        get_week(self, chart, week):
+            Return a stored week of a chart.
+        get_song_history(self, chart, name, artist):
+            Return every (week, rank) a song appeared on a chart.
+        weeks_on_chart(self, chart, name, artist):
+            Return the number of stored weeks a song appeared on a chart.
+        peak_position(self, chart, name, artist):
+            Return the best rank a song reached on a chart.
+        movers(self, chart, week):
+            Return songs that changed rank since the previous stored week.
+        search(self, query, limit):
+            Return stored songs whose names or artists match a query.
+        close(self):
+            Close the database connection.
+    """
+    
+    def __init__(self, filename=ARCHIVE_FILE):
+        """
+        Create attributes for ChartArchive object, open the database and build indexes.
+        
+        :param str filename: path of SQLite database (default=ARCHIVE_FILE)
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+        self.strings = []
+        self.string_ids = {}
+        self.songs = []
+        self.song_ids = {}
+        self.weeks = {}
+        self.history = {}
+        self.search_index = None
+        self.load()
+    
+    def load(self):
+        """Read interned strings, songs and weeks from the database and build indexes."""
+        # SQLite ids start at 1, index 0 is left empty so that ids can be used as list indexes.
+        self.strings = [None]
+        self.string_ids = {}
+        for string_id, value in self.connection.execute('SELECT id, value FROM strings ORDER BY id'):
+            self._pad(self.strings, string_id)
+            self.strings[string_id] = value
+            self.string_ids[value] = string_id
+        self.songs = [None]
+        self.song_ids = {}
+        for song_id, name_id, artist_id in self.connection.execute('SELECT id, name_id, artist_id FROM songs ORDER BY id'):
+            self._pad(self.songs, song_id)
+            self.songs[song_id] = (name_id, artist_id)
+            self.song_ids[name_id, artist_id] = song_id
+        # Rebuilt from the new songs on the next search.
+        self.search_index = None
+        self.weeks = {}
+        self.history = {}
+        for chart, week, blob in self.connection.execute('SELECT chart, week, song_ids FROM weeks ORDER BY week'):
+            song_ids = array('I')
+            song_ids.frombytes(blob)
+            self._index_week(chart, week, song_ids)
+    
+    def backfill(self, chart, start, end, n=100, fetch_workers=FETCH_WORKERS, parse_workers=PARSE_WORKERS):
+        """
+        Download, parse and store every week of a chart in a date range that isn't stored yet.
+        
+        :param str chart: chart name, a key of core.CHARTS
+        :param str start: ISO date in the first week
+        :param str end: ISO date in the last week
+        :param int n: number of songs to store each week (default=100)
+        :param int fetch_workers: maximum number of weeks downloaded at once (default=FETCH_WORKERS)
+        :param int parse_workers: number of parsing processes (default=PARSE_WORKERS, one per CPU)
+        :return: weeks stored, as chart release dates (see get_chart_date())
+        :rtype: list[str]
+        
+        Pages are downloaded on a thread pool and handed to a process pool for
+        parsing as soon as each one arrives, so parsing overlaps downloading.
+        Every download has a timeout and passing failures are sent again (see
+        outbound.retry()). Weeks that still fail to download are skipped, running
+        backfill again will retry them.
+        
+        NOTE: as parsing uses worker processes, scripts calling backfill() on
+        Windows must do so from within an "if __name__ == '__main__':" block.
+        """
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+        import multiprocessing
+        import requests
+        
+        stored = self.weeks.get(chart, {})
+        weeks = [week for week in get_chart_weeks(start, end) if week not in stored]
+        session = core.get_session()
+        
+        def request(week):
+            """Download a week's chart page."""
+            with session.get(get_chart_url(chart, week), timeout=outbound.get_timeout('billboard')) as response:
+                response.raise_for_status()
+                return response.content
+        
+        def fetch(week):
+            """Download a week's chart page, retrying passing failures, returning None if it can't be downloaded."""
+            try:
+                return outbound.retry('billboard', request, week)
+            except requests.RequestException:
+                return None
+        
+        added = []
+        # Spawned workers don't inherit the fetch threads or the session's open sockets.
+        spawn = multiprocessing.get_context('spawn')
+        with ThreadPoolExecutor(max_workers=fetch_workers) as fetchers, ProcessPoolExecutor(max_workers=parse_workers, mp_context=spawn) as parsers:
+            downloads = {fetchers.submit(fetch, week): week for week in weeks}
+            parses = {}
+            for download in as_completed(downloads):
+                html = download.result()
+                if html is not None:
+                    parses[parsers.submit(_parse_week, html, n)] = downloads[download]
+            for parse in as_completed(parses):
+                songs = parse.result()
+                if songs:
+                    self.add_week(chart, parses[parse], songs, commit=False)
+                    added.append(parses[parse])
+        self.connection.commit()
+        return sorted(added)
+    
+    def add_week(self, chart, week, songs, commit=True):
+        """
+        Store one week of a chart.
+        
+        :param str chart: chart name
+        :param str week: ISO date in the chart's week, stored as the chart's release date (see get_chart_date())
+        :param list[tuple[str, str]] songs: (name, artist) of each song, in rank order
+        :param bool commit: commit to the database straight away (default=True)
+        """
+        week = get_chart_date(week)
+        song_ids = array('I', (self._intern_song(name, artist) for name, artist in songs))
+        self.connection.execute(
+            'INSERT OR REPLACE INTO weeks (chart, week, song_ids) VALUES (?, ?, ?)',
+            (chart, week, song_ids.tobytes())
+        )
+        if commit:
+            self.connection.commit()
+        if week in self.weeks.get(chart, {}):
+            # Replacing a week, rebuild this chart's history from scratch.
+            self.weeks[chart][week] = song_ids
+            self._rebuild_history(chart)
+        else:
+            self._index_week(chart, week, song_ids)
+    
+    def get_week(self, chart, week):
+        """
+        Return a stored week of a chart.
+        
+        :param str chart: chart name
+        :param str week: ISO date in the chart's week
+        :return: songs in rank order (empty if not stored)
+        :rtype: list[Song]
+        """
+        song_ids = self.weeks.get(chart, {}).get(get_chart_date(week), ())
+        return [
+            Song(rank, self.strings[self.songs[song_id][0]], self.strings[self.songs[song_id][1]])
+            for rank, song_id in enumerate(song_ids, 1)
+        ]
+    
+    def get_song_history(self, chart, name, artist):
+        """
+        Return every (week, rank) a song appeared on a chart, oldest first.
+        
+        :rtype: list[tuple[str, int]]
+        """
+        song_id = self._find_song(name, artist)
+        return sorted(self.history.get(chart, {}).get(song_id, []))
+    
+    def weeks_on_chart(self, chart, name, artist):
+        """Return the number of stored weeks a song appeared on a chart."""
+        song_id = self._find_song(name, artist)
+        return len(self.history.get(chart, {}).get(song_id, []))
+    
+    def peak_position(self, chart, name, artist):
+        """Return the best rank a song reached on a chart, or None if it never appeared."""
+        song_id = self._find_song(name, artist)
+        appearances = self.history.get(chart, {}).get(song_id)
+        if not appearances:
+            return None
+        return min(rank for _, rank in appearances)
+    
+    def movers(self, chart, week):
+        """
+        Return songs that changed rank since the previous stored week.
+        
+        :param str chart: chart name
+        :param str week: ISO date in the chart's week
+        :return: (name, artist, last rank, rank) tuples, biggest climb first.
+            New entries have a last rank of None and are listed last.
+        :rtype: list[tuple]
+        """
+        week = get_chart_date(week)
+        weeks = self.weeks.get(chart, {})
+        if week not in weeks:
+            return []
+        earlier = [stored for stored in weeks if stored < week]
+        previous = weeks[max(earlier)] if earlier else array('I')
+        last_ranks = {song_id: rank for rank, song_id in enumerate(previous, 1)}
+        moved = []
+        new = []
+        for rank, song_id in enumerate(weeks[week], 1):
+            name_id, artist_id = self.songs[song_id]
+            last_rank = last_ranks.get(song_id)
+            if last_rank is None:
+                new.append((self.strings[name_id], self.strings[artist_id], None, rank))
+            elif last_rank != rank:
+                moved.append((self.strings[name_id], self.strings[artist_id], last_rank, rank))
+        moved.sort(key=lambda mover: mover[3] - mover[2])
+        return moved + new
+    
+    def search(self, query, limit=None):
+        """
+        Return stored songs whose names or artists match a query, from any chart or week.
+        
+        :param str query: words (or the starts of words) to find, see search.SearchIndex
+        :param int limit: maximum number of songs to return (default=None, no limit)
+        :return: (name, artist) of matching songs, in the order they were first stored
+        :rtype: list[tuple[str, str]]
+        
+        The index is built on the first search and kept up to date as songs are stored.
+        """
+        if self.search_index is None:
+            self.search_index = SearchIndex(
+                (song_id, (self.strings[song[0]], self.strings[song[1]]))
+                for song_id, song in enumerate(self.songs) if song is not None
+            )
+        song_ids = self.search_index.search(query)[:limit]
+        return [(self.strings[self.songs[song_id][0]], self.strings[self.songs[song_id][1]]) for song_id in song_ids]
+    
+    def close(self):
+        """Close the database connection."""
+        self.connection.close()
+    
+    def _intern_string(self, value):
+        """Return the id of a string, storing it if it hasn't been seen before."""
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.connection.execute('INSERT INTO strings (value) VALUES (?)', (value,)).lastrowid
+            self._pad(self.strings, string_id)
+            self.strings[string_id] = value
+            self.string_ids[value] = string_id
+        return string_id
+    
+    def _intern_song(self, name, artist):
+        """Return the id of a song, storing it if it hasn't been seen before."""
+        key = (self._intern_string(name), self._intern_string(artist))
+        song_id = self.song_ids.get(key)
+        if song_id is None:
+            song_id = self.connection.execute('INSERT INTO songs (name_id, artist_id) VALUES (?, ?)', key).lastrowid
+            self._pad(self.songs, song_id)
+            self.songs[song_id] = key
+            self.song_ids[key] = song_id
+            if self.search_index is not None:
+                self.search_index.add(song_id, name, artist)
+        return song_id
+    
+    def _find_song(self, name, artist):
+        """Return the id of a song, or None if it isn't stored."""
+        key = (self.string_ids.get(name), self.string_ids.get(artist))
+        return self.song_ids.get(key)
+    
+    def _index_week(self, chart, week, song_ids):
+        """Add a week to the in-memory indexes."""
+        self.weeks.setdefault(chart, {})[week] = song_ids
+        history = self.history.setdefault(chart, {})
+        for rank, song_id in enumerate(song_ids, 1):
+            history.setdefault(song_id, []).append((week, rank))
+    
+    def _rebuild_history(self, chart):
+        """Rebuild the history index of a chart from its weeks."""
+        history = self.history[chart] = {}
+        for week in sorted(self.weeks[chart]):
+            for rank, song_id in enumerate(self.weeks[chart][week], 1):
+                history.setdefault(song_id, []).append((week, rank))
+    
+    @staticmethod
+    def _pad(items, index):
+        """Extend a list with None so that index is a valid position."""
+        if len(items) <= index:
+            items.extend([None] * (index + 1 - len(items)))
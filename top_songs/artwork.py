@@ -0,0 +1,224 @@
+"""
+Module artwork
+
+Loads album art thumbnails for song rows without blocking the Tkinter thread.
+
+Art urls come from the same Spotify search used to play songs (see core.search_spotify_track()).
+Art is downloaded, decoded and shrunk with PIL on a small thread pool, and thumbnails are kept
+in an ArtworkCache on disk. Only the last step, turning a thumbnail into an ImageTk.PhotoImage,
+happens on the Tkinter thread, as Tk requires.
+
+Classes:
+    ArtworkLoader
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from top_songs.cache import ArtworkCache
+from collections import OrderedDict
+from top_songs import instrument
+from PIL import ImageTk, Image
+from top_songs import core
+import threading
+import queue
+import io
+
+# Width and height of thumbnails in pixels.
+THUMBNAIL_SIZE = 28
+# Art downloads and Spotify searches running at once.
+ARTWORK_WORKERS = 4
+# Thumbnails kept in memory as PhotoImages, a few screens' worth of rows.
+MAX_IMAGES = 64
+# Seconds to wait for an image to download.
+ARTWORK_TIMEOUT = 10
+
+
+class ArtworkLoader:
+    """
+    A class to load album art thumbnails in the background and hand them to the Tkinter thread.
+    
+    Songs are requested as their rows are shown. Loading a song finds its art url (if not
+    already known), then reads its thumbnail from the disk cache, or downloads and shrinks
+    the art and stores the thumbnail. Finished thumbnails are queued and turned into
+    PhotoImages by poll(), which must be called on the Tkinter thread.
+    
+    Only songs in the wanted set (the songs in view) are loaded. Songs scrolled out of view
+    before their turn are skipped, so fast scrolling doesn't leave a backlog of downloads.
+    At most max_images PhotoImages are kept, least recently used are dropped first (unless wanted).
+    
+    Attributes:
+        resolve : function
+            called with a Song without an art url, finds it (see core.resolve_spotify_data())
+        cache : ArtworkCache
+            thumbnails stored on disk
+        size : int
+            width and height of thumbnails in pixels
+        max_images : int
+            maximum number of PhotoImages kept
+        images : OrderedDict[tuple[str, str]: PhotoImage]
+            song key mapped to thumbnail, least recently used first
+    
+    Methods:
+        set_wanted(self, songs):
+            Set which songs' art is wanted, e.g. the songs in view.
+        request(self, song):
+            Start loading a song's art in the background, unless already loaded or loading.
+        get_image(self, song):
+            Return a song's thumbnail, or None if it hasn't been loaded.
+        poll(self):
+            Turn loaded thumbnails into PhotoImages, returning the keys of songs with new thumbnails.
+        has_pending(self):
+            Check whether any requested art hasn't been passed to poll() yet.
+        stop(self):
+            Stop loading art, skipping requests not yet started.
+    """
+    
+    def __init__(self, resolve, cache=None, size=THUMBNAIL_SIZE, max_workers=ARTWORK_WORKERS, max_images=MAX_IMAGES):
+        """
+        Create attributes for ArtworkLoader object.
+        
+        :param resolve: function called with a Song to find its art url, returning whether it was found
+        :param ArtworkCache cache: thumbnails stored on disk (default=ArtworkCache())
+        :param int size: width and height of thumbnails in pixels (default=THUMBNAIL_SIZE)
+        :param int max_workers: art loaded at once (default=ARTWORK_WORKERS)
+        :param int max_images: maximum number of PhotoImages kept (default=MAX_IMAGES)
+        """
+        self.resolve = resolve
+        self.cache = cache if cache is not None else ArtworkCache()
+        self.size = size
+        self.max_images = max_images
+        self.images = OrderedDict()
+        self._wanted = frozenset()
+        self._pending = set()
+        self._failed = set()
+        self._loaded = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='artwork')
+        # Held while resolving until a song has been resolved, so spotipy only asks for authorization once.
+        self._first_resolve = threading.Lock()
+        self._resolved = threading.Event()
+    
+    def set_wanted(self, songs):
+        """Set which songs' art is wanted (e.g. the songs in view), requests for other songs are skipped."""
+        self._wanted = frozenset(song.get_key() for song in songs)
+    
+    def request(self, song):
+        """
+        Start loading a song's art in the background, unless already loaded or loading.
+        
+        :param Song song: song to load art for, its art_url is set if not already known
+        
+        Songs whose art couldn't be found aren't tried again.
+        """
+        key = song.get_key()
+        if key in self.images or key in self._pending or key in self._failed:
+            return
+        self._pending.add(key)
+        self._executor.submit(self._load, song, key)
+    
+    def get_image(self, song):
+        """Return a song's thumbnail (ImageTk.PhotoImage), or None if it hasn't been loaded."""
+        key = song.get_key()
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+        return image
+    
+    def poll(self):
+        """
+        Turn loaded thumbnails into PhotoImages, returning the keys of songs with new thumbnails.
+        
+        :rtype: set[tuple[str, str]]
+        
+        Must be called on the Tkinter thread.
+        """
+        keys = set()
+        while True:
+            try:
+                key, thumbnail, failed = self._loaded.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(key)
+            if failed:
+                self._failed.add(key)
+            if thumbnail is None:
+                continue
+            with instrument.span('artwork.photo_image'):
+                self.images[key] = ImageTk.PhotoImage(thumbnail)
+            keys.add(key)
+        self._evict()
+        return keys
+    
+    def has_pending(self):
+        """Check whether any requested art hasn't been passed to poll() yet."""
+        return bool(self._pending)
+    
+    def stop(self):
+        """Stop loading art, skipping requests not yet started."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _load(self, song, key):
+        """Load a song's thumbnail on a pool thread and queue it for poll() (None if skipped or not found)."""
+        thumbnail = None
+        failed = False
+        try:
+            if key not in self._wanted:
+                return
+            if song.art_url is None:
+                self._resolve(song)
+            if song.art_url is None:
+                failed = True
+                return
+            thumbnail = self._get_thumbnail(song.art_url)
+            failed = thumbnail is None
+        finally:
+            self._loaded.put((key, thumbnail, failed))
+    
+    def _resolve(self, song):
+        """Find a song's art url, one song at a time until the first has been found."""
+        if self._resolved.is_set():
+            return self.resolve(song)
+        with self._first_resolve:
+            if self.resolve(song):
+                self._resolved.set()
+                return True
+            return False
+    
+    def _get_thumbnail(self, url):
+        """Return the thumbnail of an image as a PIL Image, from the disk cache or by downloading it."""
+        data = self.cache.get(url)
+        if data is None:
+            import requests
+            
+            try:
+                with instrument.span('artwork.download'):
+                    response = core.get_session().get(url, timeout=ARTWORK_TIMEOUT)
+                    response.raise_for_status()
+                with instrument.span('artwork.thumbnail'):
+                    data = self._make_thumbnail(response.content)
+            except (requests.RequestException, OSError, ValueError):
+                # Unreachable, or not an image PIL can read.
+                return None
+            self.cache.put(url, data)
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+    
+    def _make_thumbnail(self, data):
+        """Decode an image and return it shrunk to fit self.size, as PNG file data."""
+        image = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder skip detail that would be thrown away when shrinking.
+        image.draft('RGB', (self.size, self.size))
+        image = image.convert('RGB')
+        image.thumbnail((self.size, self.size), Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'PNG', optimize=True)
+        return output.getvalue()
+    
+    def _evict(self):
+        """Drop least recently used PhotoImages until at most max_images remain, keeping wanted songs' images."""
+        if len(self.images) <= self.max_images:
+            return
+        for key in list(self.images):
+            if len(self.images) <= self.max_images:
+                break
+            if key not in self._wanted:
+                del self.images[key]
@@ -0,0 +1,532 @@
+"""
+Module cache
+
+Persistent caches used by TopSongs to avoid repeating network requests between sessions.
+
+Classes:
+    ChartCache
+    ResolutionCache
+    ArtworkCache
+"""
+
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from top_songs.models import Song
+from top_songs import instrument
+import threading
+import hashlib
+import json
+import time
+import os
+
+CHART_CACHE_FILE = '.chart_cache.json'
+# Billboard publishes new charts on Tuesdays, around midday Eastern Time.
+CHART_RELEASE_WEEKDAY = 1
+CHART_RELEASE_HOUR_UTC = 17
+# Minimum time between conditional requests once a new chart is due but not yet posted.
+REVALIDATE_INTERVAL = 60 * 60
+# Rows that must match last week's chart for a download to be taken as last week's chart again.
+# The tops of two real weeks can match, fifty rows (the shortest charts) never do.
+CHART_MATCH_ROWS = 50
+RESOLUTION_CACHE_FILE = '.resolution_cache.json'
+# Spotify URIs and YouTube videos rarely change, but do now and then (e.g. re-uploads).
+RESOLUTION_TTL = 30 * 24 * 60 * 60
+RESOLUTION_MAX_ENTRIES = 5000
+ARTWORK_CACHE_DIR = '.artwork_cache'
+# Thumbnails are a few kilobytes each, so this holds thousands of songs.
+ARTWORK_CACHE_BYTES = 20 * 1024 * 1024
+
+
+def get_chart_week(now=None):
+    """
+    Return the release date of the chart that is current at a given time.
+    
+    :param datetime now: time to check, must be timezone aware (default=current time)
+    :return: ISO date of the most recent chart release
+    :rtype: str
+    """
+    if now is None:
+        now = datetime.now(timezone.utc)
+    now = now.astimezone(timezone.utc)
+    release = now.replace(hour=CHART_RELEASE_HOUR_UTC, minute=0, second=0, microsecond=0)
+    release -= timedelta(days=(now.weekday() - CHART_RELEASE_WEEKDAY) % 7)
+    if release > now:
+        release -= timedelta(days=7)
+    return release.date().isoformat()
+
+
+class ChartCache:
+    """
+    A class to store parsed charts on disk along with the HTTP validators they were served with.
+    
+    Attributes:
+        filename : str
+            path of the JSON file charts are stored in
+        charts : dict[str: dict]
+            chart name mapped to a cache entry with the format:
+            {
+                "week": release date of the chart the songs are from, as far as is known,
+                "checked": time of last successful request,
+                "etag": ETag header or None,
+                "last_modified": Last-Modified header or None,
+                "songs": list of song dictionaries (see Song.to_dict())
+            }
+    
+    Methods:
+        load(self):
+            Read cached charts from file, ignoring a missing or corrupt file.
+        save(self):
+            Write cached charts to file.
+        get_songs(self, chart):
+            Return the cached songs of a chart.
+        is_fresh(self, chart, n):
+            Check whether a chart can be served without contacting Billboard.
+        get_validators(self, chart, n):
+            Return headers for a conditional request of a chart.
+        store(self, chart, songs, headers):
+            Store a freshly downloaded chart.
+        touch(self, chart):
+            Mark a chart as revalidated after a "304 Not Modified" response.
+    """
+    
+    def __init__(self, filename=CHART_CACHE_FILE):
+        """
+        Create attributes for ChartCache object and load cached charts.
+        
+        :param str filename: path of cache file (default=CHART_CACHE_FILE)
+        """
+        self.filename = filename
+        self.charts = {}
+        # Several charts may be downloaded and stored at once (see core.get_charts()).
+        self._lock = threading.RLock()
+        self.load()
+    
+    def load(self):
+        """Read cached charts from file, ignoring a missing or corrupt file."""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as file_in:
+                charts = json.load(file_in)
+        except (OSError, ValueError):
+            return
+        if isinstance(charts, dict):
+            self.charts = charts
+    
+    def save(self):
+        """
+        Write cached charts to file.
+        
+        The cache is written to a temporary file first so that a crash
+        mid-write never leaves a truncated snapshot behind.
+        """
+        temp_filename = f'{self.filename}.tmp'
+        with self._lock:
+            try:
+                with open(temp_filename, 'w', encoding='utf-8') as file_out:
+                    json.dump(self.charts, file_out, separators=(',', ':'))
+                os.replace(temp_filename, self.filename)
+            except OSError:
+                pass
+    
+    def get_songs(self, chart):
+        """
+        Return the cached songs of a chart.
+        
+        :param str chart: chart name
+        :return: cached songs (empty if chart has never been cached)
+        :rtype: list[Song]
+        """
+        entry = self.charts.get(chart)
+        return [Song.from_dict(song) for song in entry['songs']] if entry else []
+    
+    def is_fresh(self, chart, n):
+        """
+        Check whether a chart can be served without contacting Billboard.
+        
+        :param str chart: chart name
+        :param int n: number of songs needed
+        :return: True if the cached chart is still this week's chart
+        :rtype: bool
+        
+        A chart is fresh if it was downloaded after the latest release, or if
+        it was revalidated recently (a new chart is due but not yet posted).
+        """
+        entry = self.charts.get(chart)
+        if not entry or len(entry['songs']) < n:
+            return False
+        if entry['week'] == get_chart_week():
+            return True
+        return time.time() - entry['checked'] < REVALIDATE_INTERVAL
+    
+    def get_validators(self, chart, n):
+        """
+        Return headers for a conditional request of a chart.
+        
+        :param str chart: chart name
+        :param int n: number of songs needed
+        :return: If-None-Match and If-Modified-Since headers (empty if cache can't be used)
+        :rtype: dict[str: str]
+        
+        No validators are sent if the cache holds fewer than n songs, as a "304 Not
+        Modified" response would leave the request unsatisfied.
+        """
+        entry = self.charts.get(chart)
+        headers = {}
+        if not entry or len(entry['songs']) < n:
+            return headers
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def store(self, chart, songs, headers):
+        """
+        Store a freshly downloaded chart.
+        
+        :param str chart: chart name
+        :param list[Song] songs: parsed songs
+        :param headers: response headers
+        
+        Just after a release, Billboard may still serve the previous chart for a while.
+        So the chart is only taken to be this week's if the page was modified since
+        the release (when it says, with Last-Modified) and its songs differ from the
+        last week's chart. Otherwise the stored week is kept, and the chart is
+        revalidated every REVALIDATE_INTERVAL until it changes (see is_fresh()).
+        Songs are only compared when both charts have at least CHART_MATCH_ROWS,
+        shorter downloads (e.g. a top 10) rely on Last-Modified alone.
+        """
+        week = get_chart_week()
+        last_modified = headers.get('Last-Modified')
+        if last_modified:
+            try:
+                modified = parsedate_to_datetime(last_modified)
+            except (TypeError, ValueError):
+                modified = None
+            if modified is not None:
+                if modified.tzinfo is None:
+                    # HTTP dates are always in GMT.
+                    modified = modified.replace(tzinfo=timezone.utc)
+                week = min(week, get_chart_week(modified))
+        rows = [(song.number, song.name, song.artist) for song in songs]
+        with self._lock:
+            entry = self.charts.get(chart)
+            if entry and entry['week'] < week:
+                old_rows = [(song['number'], song['name'], song['artist']) for song in entry['songs']]
+                shown = min(len(rows), len(old_rows))
+                if shown >= CHART_MATCH_ROWS and rows[:shown] == old_rows[:shown]:
+                    # Same songs as the last chart stored, so the new chart isn't posted yet.
+                    week = entry['week']
+            self.charts[chart] = {
+                'week': week,
+                'checked': time.time(),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'songs': [song.to_dict() for song in songs],
+            }
+            self.save()
+    
+    def touch(self, chart):
+        """Mark a chart as revalidated after a "304 Not Modified" response."""
+        with self._lock:
+            self.charts[chart]['checked'] = time.time()
+            self.save()
+
+
+class ResolutionCache:
+    """
+    A class to store the results of Spotify and YouTube lookups on disk, shared between sessions.
+    
+    Results are keyed by song name and artist (with featured artists removed), ignoring
+    case and surrounding whitespace. Each result field (e.g. "uri", "artist_uri", "yt_url")
+    expires separately, ttl seconds after it was stored. When more than max_entries songs
+    are stored, the least recently used songs are evicted.
+    
+    Attributes:
+        filename : str
+            path of the JSON file results are stored in
+        ttl : float
+            seconds before a stored result expires
+        max_entries : int
+            maximum number of songs stored
+        entries : OrderedDict[str: dict[str: list]]
+            song key mapped to fields, each stored as [value, time stored], least recently used first
+        hits : int
+            number of lookups answered from the cache
+        misses : int
+            number of lookups not found in the cache (or expired)
+    
+    Methods:
+        make_key(name, artist):
+            Return the cache key of a song.
+        load(self):
+            Read stored results from file, ignoring a missing or corrupt file.
+        save(self):
+            Write stored results to file.
+        get(self, name, artist, field):
+            Return a stored result, or None if it isn't stored or has expired.
+        get_entry(self, name, artist, *fields):
+            Return every stored result of a song that hasn't expired, with one lookup.
+        put(self, name, artist, **fields):
+            Store results for a song.
+        get_stats(self):
+            Return hit and miss counts.
+    """
+    
+    def __init__(self, filename=RESOLUTION_CACHE_FILE, ttl=RESOLUTION_TTL, max_entries=RESOLUTION_MAX_ENTRIES):
+        """
+        Create attributes for ResolutionCache object and load stored results.
+        
+        :param str filename: path of cache file (default=RESOLUTION_CACHE_FILE)
+        :param float ttl: seconds before a stored result expires (default=RESOLUTION_TTL)
+        :param int max_entries: maximum number of songs stored (default=RESOLUTION_MAX_ENTRIES)
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Lookups happen on prefetch threads as well as the Tkinter thread.
+        self._lock = threading.Lock()
+        self.load()
+    
+    @staticmethod
+    def make_key(name, artist):
+        """Return the cache key of a song."""
+        return f'{name.strip().casefold()}\n{artist.strip().casefold()}'
+    
+    def load(self):
+        """Read stored results from file, ignoring a missing or corrupt file."""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as file_in:
+                entries = json.load(file_in, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            return
+        if isinstance(entries, dict):
+            with self._lock:
+                self.entries = entries
+                self._evict()
+    
+    def save(self):
+        """Write stored results to file, in least recently used order."""
+        temp_filename = f'{self.filename}.tmp'
+        with self._lock:
+            data = json.dumps(self.entries, separators=(',', ':'))
+        try:
+            with open(temp_filename, 'w', encoding='utf-8') as file_out:
+                file_out.write(data)
+            os.replace(temp_filename, self.filename)
+        except OSError:
+            pass
+    
+    def get(self, name, artist, field):
+        """
+        Return a stored result, or None if it isn't stored or has expired.
+        
+        :param str name: song name
+        :param str artist: song artist, with featured artists removed
+        :param str field: result field, e.g. "uri"
+        """
+        key = self.make_key(name, artist)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and field in entry:
+                value, stored = entry[field]
+                if time.time() - stored < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    instrument.count('resolution_cache.hit')
+                    return value
+                del entry[field]
+            self.misses += 1
+            instrument.count('resolution_cache.miss')
+            return None
+    
+    def get_entry(self, name, artist, *fields):
+        """
+        Return every stored result of a song that hasn't expired, with one lookup.
+        
+        :param str name: song name
+        :param str artist: song artist, with featured artists removed
+        :param fields: fields the caller needs, e.g. "uri" (default=any)
+        :return: result field mapped to value, empty if nothing is stored
+        :rtype: dict[str: str]
+        
+        Counts as one hit if all of fields (or, without fields, any result) are stored,
+        otherwise as one miss.
+        """
+        key = self.make_key(name, artist)
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            results = {}
+            if entry is not None:
+                for field, (value, stored) in list(entry.items()):
+                    if now - stored < self.ttl:
+                        results[field] = value
+                    else:
+                        del entry[field]
+            if results and all(field in results for field in fields):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                instrument.count('resolution_cache.hit')
+            else:
+                self.misses += 1
+                instrument.count('resolution_cache.miss')
+            return results
+    
+    def put(self, name, artist, **fields):
+        """
+        Store results for a song.
+        
+        :param str name: song name
+        :param str artist: song artist, with featured artists removed
+        :param fields: results to store, e.g. uri='spotify:track:...'
+        """
+        key = self.make_key(name, artist)
+        now = time.time()
+        with self._lock:
+            entry = self.entries.setdefault(key, {})
+            for field, value in fields.items():
+                entry[field] = [value, now]
+            self.entries.move_to_end(key)
+            self._evict()
+    
+    def get_stats(self):
+        """Return hit and miss counts as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+            }
+    
+    def _evict(self):
+        """Remove least recently used songs until at most max_entries remain. Caller must hold the lock."""
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class ArtworkCache:
+    """
+    A class to store album art thumbnails on disk, shared between sessions.
+    
+    Each thumbnail is a file named after a hash of its art url. When the files add up to more
+    than max_bytes, the least recently used thumbnails are deleted (reading a thumbnail
+    updates its modification time).
+    
+    Attributes:
+        directory : str
+            directory thumbnails are stored in
+        max_bytes : int
+            maximum total size of stored thumbnails
+        sizes : dict[str: int]
+            file name mapped to size of every stored thumbnail
+        total_bytes : int
+            total size of stored thumbnails
+    
+    Methods:
+        make_filename(url):
+            Return the name of the file a url's thumbnail is stored in.
+        get(self, url):
+            Return a stored thumbnail, or None if it isn't stored.
+        put(self, url, data):
+            Store a thumbnail, deleting the least recently used ones if the cache is full.
+    """
+    
+    def __init__(self, directory=ARTWORK_CACHE_DIR, max_bytes=ARTWORK_CACHE_BYTES):
+        """
+        Create attributes for ArtworkCache object and find stored thumbnails.
+        
+        :param str directory: directory to store thumbnails in (default=ARTWORK_CACHE_DIR)
+        :param int max_bytes: maximum total size of stored thumbnails (default=ARTWORK_CACHE_BYTES)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sizes = {}
+        self.total_bytes = 0
+        # Thumbnails are read and stored on image loading threads.
+        self._lock = threading.Lock()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        self.sizes[entry.name] = entry.stat().st_size
+        except OSError:
+            pass
+        self.total_bytes = sum(self.sizes.values())
+    
+    @staticmethod
+    def make_filename(url):
+        """Return the name of the file a url's thumbnail is stored in."""
+        return hashlib.sha1(url.encode('utf-8')).hexdigest() + '.png'
+    
+    def get(self, url):
+        """
+        Return a stored thumbnail, or None if it isn't stored.
+        
+        :param str url: url of the original image
+        :rtype: bytes
+        """
+        filename = self.make_filename(url)
+        with self._lock:
+            if filename not in self.sizes:
+                instrument.count('artwork_cache.miss')
+                return None
+        path = os.path.join(self.directory, filename)
+        try:
+            with open(path, 'rb') as file_in:
+                data = file_in.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.total_bytes -= self.sizes.pop(filename, 0)
+            instrument.count('artwork_cache.miss')
+            return None
+        instrument.count('artwork_cache.hit')
+        return data
+    
+    def put(self, url, data):
+        """
+        Store a thumbnail, deleting the least recently used ones if the cache is full.
+        
+        :param str url: url of the original image
+        :param bytes data: thumbnail image file
+        """
+        filename = self.make_filename(url)
+        path = os.path.join(self.directory, filename)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as file_out:
+                file_out.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            self.total_bytes += len(data) - self.sizes.get(filename, 0)
+            self.sizes[filename] = len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self):
+        """Delete least recently used thumbnails until the cache is at most 90% full. Caller must hold the lock."""
+        def get_used_time(filename):
+            """Return when a thumbnail was last used, or 0 if it's gone."""
+            try:
+                return os.path.getmtime(os.path.join(self.directory, filename))
+            except OSError:
+                return 0
+        
+        # Evicting to below the limit means files aren't sorted on every store once full.
+        for filename in sorted(self.sizes, key=get_used_time):
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+            self.total_bytes -= self.sizes.pop(filename)
@@ -0,0 +1,700 @@
+"""
+Module core
+
+Headless chart and song lookup code used by TopSongs, with no GUI dependencies.
+
+Third party modules (requests, spotipy, youtube_search) and concurrent.futures are imported
+the first time they are needed rather than when this module is imported, so programs that
+only want chart data don't pay for the rest.
+
+Functions:
+    get_spotify_creds()
+    connect_spotify(client_id, client_secret, redirect_uri)
+    connect_spotify_app(client_id, client_secret)
+    get_spotify_session()
+    get_session()
+    get_chart(chart, n, cache, revalidate)
+    iter_chart(chart, n, cache, revalidate)
+    get_charts(charts, n, cache, max_workers)
+    get_top_songs(n, cache, revalidate)
+    merge_chart(old_songs, new_songs)
+    get_real_artist(artist)
+    search_spotify(sp_api, name, artist, cache)
+    search_spotify_track(sp_api, name, artist, cache)
+    get_art_url(images, min_size)
+    search_youtube(name, artist, cache, search_pool)
+    resolve_spotify_data(sp_api, song, cache)
+    resolve_youtube_data(song, cache, search_pool)
+    resolve_songs(songs, resolve, max_workers, stop)
+    resolve_youtube_songs(songs, cache, max_workers, search_pool, stop)
+    get_playlist(sp_api, name)
+    play_songs(sp_api, songs, device_id, cache, playlist_id, max_workers)
+"""
+
+from top_songs.parser import iter_chart_rows
+from top_songs.scheduler import SpotifyScheduler
+from top_songs.cache import ChartCache
+from top_songs import instrument
+from top_songs import outbound
+import threading
+import time
+import os
+
+CREDENTIALS_FILE = 'credentials.txt'
+SPOTIFY_SCOPE = (
+    'user-read-currently-playing user-modify-playback-state user-read-playback-state '
+    'playlist-read-private playlist-modify-private'
+)
+# Addresses of Billboard and the Spotify Web API. Each can be changed with an environment variable,
+# e.g. to point Top Songs at the local stand-in servers used by benchmarks/suite.py.
+BILLBOARD_URL = os.environ.get('TOP_SONGS_BILLBOARD_URL', 'https://www.billboard.com').rstrip('/')
+SPOTIFY_API_URL = os.environ.get('TOP_SONGS_SPOTIFY_API_URL', 'https://api.spotify.com').rstrip('/')
+HOT_100 = 'hot-100'
+# Chart name mapped to chart page. Every chart uses the same page layout, so they share one parser.
+CHARTS = {
+    HOT_100: f'{BILLBOARD_URL}/charts/hot-100',
+    'billboard-200': f'{BILLBOARD_URL}/charts/billboard-200',
+    'billboard-global-200': f'{BILLBOARD_URL}/charts/billboard-global-200',
+    'country-songs': f'{BILLBOARD_URL}/charts/country-songs',
+    'r-b-hip-hop-songs': f'{BILLBOARD_URL}/charts/r-b-hip-hop-songs',
+    'rock-songs': f'{BILLBOARD_URL}/charts/rock-songs',
+    'latin-songs': f'{BILLBOARD_URL}/charts/latin-songs',
+}
+HOT_100_URL = CHARTS[HOT_100]
+CHART_CHUNK_SIZE = 16 * 1024
+# Maximum number of charts downloaded at once, and connections kept alive to Billboard.
+CHART_WORKERS = 8
+# Songs resolved at once. Spotify requests are also paced by the connection's SpotifyScheduler.
+RESOLVE_WORKERS = 4
+# Songs searched for on YouTube at once by resolve_youtube_songs().
+YOUTUBE_WORKERS = 8
+# Smallest album art wanted, in pixels. Spotify offers each album's art in a few sizes.
+ART_SIZE = 64
+# Most tracks Spotify accepts in one request.
+SPOTIFY_BATCH_SIZE = 100
+# Private playlist that play_songs() fills when there are too many tracks for one playback request.
+PLAYLIST_NAME = 'Top Songs'
+PLAYLIST_DESCRIPTION = 'Songs played from Top Songs, replaced each time.'
+# Number of sites the shared session keeps connections to (Billboard, album art and a chart service, with room to spare).
+SESSION_HOSTS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_spotify_creds():
+    """
+    Read spotify credentials from environment variables or CREDENTIALS_FILE.
+    
+    :except KeyError: if one or more env variables are missing, read from file
+    
+    Environment variable names:
+    SPOTIPY_CLIENT_ID
+    SPOTIPY_CLIENT_secret
+    SPOTIPY_REDIRECT_URI
+    
+    Credentials file format:
+    Line 1: Client Id
+    Line 2: Client Secret
+    Line 3: Redirect Uri
+    """
+    try:
+        client_id = os.environ['SPOTIPY_CLIENT_ID']
+        client_secret = os.environ['SPOTIPY_CLIENT_SECRET']
+        redirect_uri = os.environ['SPOTIPY_REDIRECT_URI']
+    except KeyError:
+        with open(CREDENTIALS_FILE, 'r') as file_in:
+            client_id = file_in.readline().strip()
+            client_secret = file_in.readline().strip()
+            redirect_uri = file_in.readline().strip()
+    
+    return client_id, client_secret, redirect_uri
+
+
+def connect_spotify(client_id=None, client_secret=None, redirect_uri=None):
+    """
+    Return a spotipy connection authorized with SPOTIFY_SCOPE, paced by a SpotifyScheduler.
+    
+    :param client_id: Client ID of your Spotify app (default=None)
+    :param client_secret: Client Secret of your Spotify app (default=None)
+    :param redirect_uri: Redirect URI of your Spotify app (default=None)
+    :rtype: SpotifyScheduler
+    
+    If any of the parameters are left blank, credentials are read with get_spotify_creds().
+    
+    Spotipy's own retries are switched off (see get_spotify_session()), so rate limited
+    requests are waited out and sent again by the scheduler (see scheduler.py), which
+    slows every other request down too, instead of each thread retrying on its own.
+    """
+    from spotipy.oauth2 import SpotifyOAuth
+    from spotipy import Spotify
+    
+    if client_id and client_secret and redirect_uri:
+        cid, secret, uri = client_id, client_secret, redirect_uri
+    else:
+        cid, secret, uri = get_spotify_creds()
+    auth_manager = SpotifyOAuth(
+        scope=SPOTIFY_SCOPE,
+        client_id=cid,
+        client_secret=secret,
+        redirect_uri=uri
+    )
+    sp_api = Spotify(
+        auth_manager=auth_manager,
+        requests_session=get_spotify_session(),
+        requests_timeout=outbound.get_timeout('spotify')
+    )
+    sp_api.prefix = f'{SPOTIFY_API_URL}/v1/'
+    return SpotifyScheduler(sp_api)
+
+
+def connect_spotify_app(client_id=None, client_secret=None):
+    """
+    Return a spotipy connection authorized as your Spotify app, without a user.
+    
+    :param client_id: Client ID of your Spotify app (default=None)
+    :param client_secret: Client Secret of your Spotify app (default=None)
+    :rtype: SpotifyScheduler
+    
+    Unlike connect_spotify(), nobody has to log in through a browser, so this works on
+    servers. The connection can search, but can't see or control anyone's players.
+    If either parameter is left blank, credentials are read with get_spotify_creds().
+    Requests are paced as in connect_spotify().
+    """
+    from spotipy.oauth2 import SpotifyClientCredentials
+    from spotipy import Spotify
+    
+    if client_id and client_secret:
+        cid, secret = client_id, client_secret
+    else:
+        cid, secret, _ = get_spotify_creds()
+    sp_api = Spotify(
+        auth_manager=SpotifyClientCredentials(client_id=cid, client_secret=secret),
+        requests_session=get_spotify_session(),
+        requests_timeout=outbound.get_timeout('spotify')
+    )
+    sp_api.prefix = f'{SPOTIFY_API_URL}/v1/'
+    return SpotifyScheduler(sp_api)
+
+
+def get_spotify_session():
+    """
+    Return a new requests session for a spotipy connection, which never retries a request.
+    
+    :rtype: requests.Session
+    
+    Spotipy's own session retries 429 and 5xx answers with urllib3, and even with
+    retries=0 urllib3 turns them into a "Max Retries" error, which spotipy reports as a
+    429 without the answer's status or Retry-After header. With this session every
+    answer reaches the SpotifyScheduler as it was sent.
+    """
+    from urllib3.util.retry import Retry
+    import requests
+    
+    retry = Retry(total=0, status_forcelist=(), respect_retry_after_header=False, raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the requests session shared by all chart downloads, album art downloads and chart service requests.
+    
+    :rtype: requests.Session
+    
+    The session keeps up to CHART_WORKERS connections to each site alive, so
+    concurrent and repeated downloads don't each pay for a new TLS handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            
+            adapter = requests.adapters.HTTPAdapter(pool_connections=SESSION_HOSTS, pool_maxsize=CHART_WORKERS)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def get_chart(chart, n, cache=None, revalidate=False):
+    """
+    Request and return a number of top songs from a Billboard chart.
+    
+    :param str chart: chart name, a key of CHARTS
+    :param int n: number of songs to return
+    :param ChartCache cache: cache to read from and store to (default=ChartCache())
+    :param bool revalidate: ask Billboard even if the cached chart is this week's (default=False)
+    :return: top songs
+    :rtype: list[Song]
+    
+    See iter_chart(), which yields the same songs as they are read.
+    """
+    return list(iter_chart(chart, n, cache, revalidate))
+
+
+def iter_chart(chart, n, cache=None, revalidate=False):
+    """
+    Request a Billboard chart and yield a number of its top songs as they are read.
+    
+    :param str chart: chart name, a key of CHARTS
+    :param int n: number of songs to yield
+    :param ChartCache cache: cache to read from and store to (default=ChartCache())
+    :param bool revalidate: ask Billboard even if the cached chart is this week's (default=False)
+    :return: generator of top songs
+    
+    songs are extracted from the chart page as it downloads (see
+    parser.iter_chart_rows()) and are stored as Song objects (see
+    models.Song). Reading stops once n songs have been found, so making n smaller
+    reduces both network load and processing time. On album charts (e.g.
+    billboard-200), "name" is the album name.
+    
+    Parsed charts are cached on disk. While the cached chart is still this
+    week's chart, Billboard is not contacted at all. Once a new chart is due,
+    the cached chart is revalidated with a conditional request (or straight away,
+    if revalidate is True), and if Billboard can't be reached, the last downloaded
+    chart is yielded. If the connection drops part way through the page, the rest
+    of the songs come from the last downloaded chart, and nothing is cached.
+    
+    The chart is only cached once every song has been read, so stop early and the
+    next call downloads it again. Requests that time out or fail for a passing reason
+    are sent again (see outbound.retry()) before falling back to the cached chart.
+    """
+    if cache is None:
+        cache = ChartCache()
+    if not revalidate and cache.is_fresh(chart, n):
+        instrument.count('chart_cache.hit')
+        yield from cache.get_songs(chart)[:n]
+        return
+    instrument.count('chart_cache.miss')
+    import requests
+    
+    def request():
+        """Request the chart page, raising requests.HTTPError for error answers so they can be retried."""
+        response = get_session().get(
+            CHARTS[chart], headers=cache.get_validators(chart, n), stream=True, timeout=outbound.get_timeout('billboard')
+        )
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            response.close()
+            raise
+        return response
+    
+    try:
+        with instrument.span('billboard.request', chart=chart):
+            response = outbound.retry('billboard', request)
+    except requests.RequestException:
+        # Offline or Billboard is down, fall back to last good snapshot.
+        instrument.count('billboard.offline')
+        yield from cache.get_songs(chart)[:n]
+        return
+    songs = []
+    # Closing the response drops the connection, even if the page hasn't been fully read.
+    with response:
+        try:
+            if response.status_code == 304:
+                instrument.count('billboard.not_modified')
+                cache.touch(chart)
+                yield from cache.get_songs(chart)[:n]
+                return
+            # Parsing happens as the page downloads, so this includes reading the page.
+            with instrument.span('billboard.download_parse', chart=chart, n=n):
+                for song in iter_chart_rows(response.iter_content(CHART_CHUNK_SIZE), n, response.encoding):
+                    songs.append(song)
+                    yield song
+        except requests.RequestException:
+            instrument.count('billboard.offline')
+            yield from cache.get_songs(chart)[len(songs):n]
+            return
+    cache.store(chart, songs, response.headers)
+
+
+def get_charts(charts, n, cache=None, max_workers=CHART_WORKERS):
+    """
+    Request and return a number of top songs from several Billboard charts at once.
+    
+    :param charts: chart names, keys of CHARTS
+    :param int n: number of songs to return from each chart
+    :param ChartCache cache: cache to read from and store to (default=ChartCache())
+    :param int max_workers: maximum number of charts downloaded at once (default=CHART_WORKERS)
+    :return: chart name mapped to top songs (see get_chart())
+    :rtype: dict[str: list[Song]]
+    
+    Charts are downloaded concurrently over the shared session (see get_session()),
+    so loading several charts takes about as long as the slowest one.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    if cache is None:
+        cache = ChartCache()
+    charts = list(charts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda chart: get_chart(chart, n, cache), charts)
+        return dict(zip(charts, results))
+
+
+def get_top_songs(n, cache=None, revalidate=False):
+    """Request and return a number of top songs from the Billboard Hot 100 (see get_chart())."""
+    return get_chart(HOT_100, n, cache, revalidate)
+
+
+def merge_chart(old_songs, new_songs):
+    """
+    Carry songs still on a chart over from an older copy of it, and find which positions changed.
+    
+    :param list[Song] old_songs: chart shown so far, its songs may have been resolved
+    :param list[Song] new_songs: newly downloaded chart
+    :return: the new chart, and the indexes whose number, name or artist changed (including
+        indexes beyond the end of either chart)
+    :rtype: tuple[list[Song], list[int]]
+    
+    Songs are matched by (name, artist), see Song.get_key(). Matched songs are the old Song
+    objects, given their new number, so links found for them (or still being found by
+    background lookups) aren't lost. Only the changed indexes need to be shown again.
+    """
+    old_rows = [(song.number, song.name, song.artist) for song in old_songs]
+    old_by_key = {song.get_key(): song for song in old_songs}
+    songs = []
+    for new_song in new_songs:
+        song = old_by_key.pop(new_song.get_key(), None)
+        if song is None:
+            song = new_song
+        else:
+            song.number = new_song.number
+        songs.append(song)
+    changed = [
+        i for i in range(max(len(old_rows), len(songs)))
+        if i >= len(old_rows) or i >= len(songs) or old_rows[i] != (songs[i].number, songs[i].name, songs[i].artist)
+    ]
+    return songs, changed
+
+
+def get_real_artist(artist):
+    """Return an artist string with featured artists removed."""
+    if ' ft.' in artist:
+        return artist[:artist.find(' ft.')]
+    return artist
+
+
+def search_spotify(sp_api, name, artist, cache=None):
+    """
+    Get a song's track and artist URIs from Spotify's API via spotipy.
+    
+    :param Spotify sp_api: spotify api connection object
+    :param str name: song name
+    :param str artist: song artist
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :returns: song URI, artist URI
+    :rtype: str, str
+    
+    NOTE: Artist URI returned is the first artist listed (TopSongs can
+    ony open one artist at this time).
+    
+    URIs found in previous sessions are read from the cache, without
+    contacting Spotify (see search_spotify_track()).
+    """
+    track = search_spotify_track(sp_api, name, artist, cache)
+    return track['uri'], track['artist_uri']
+
+
+def search_spotify_track(sp_api, name, artist, cache=None):
+    """
+    Get a song's track URI, first artist's URI and album art url from Spotify's API via spotipy.
+    
+    :param Spotify sp_api: spotify api connection object
+    :param str name: song name
+    :param str artist: song artist
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :return: "uri", "artist_uri" and "art_url" (None if the album has no art)
+    :rtype: dict[str: str]
+    :except IndexError: if Spotify found no tracks, now or recently (see outbound.call())
+    
+    All three are found with one search, and stored in the cache together. Searches
+    for a song already being searched for wait for that search instead of sending
+    their own.
+    """
+    real_artist = get_real_artist(artist)
+    if cache is not None:
+        entry = cache.get_entry(name, real_artist, 'uri', 'artist_uri', 'art_url')
+        # An empty art url is stored for albums without art, so they aren't searched for again.
+        if entry.get('uri') and entry.get('artist_uri') and entry.get('art_url') is not None:
+            return {'uri': entry['uri'], 'artist_uri': entry['artist_uri'], 'art_url': entry['art_url'] or None}
+    
+    def search():
+        """Send request to Spotify's API and sift through dict to find desired data."""
+        with instrument.span('spotify.search'):
+            result = sp_api.search(q=f'{name} {real_artist}', type='track', limit=1)
+        item = result['tracks']['items'][0]
+        return {
+            'uri': item['uri'],
+            'artist_uri': item['artists'][0]['uri'],  # First listed artist
+            'art_url': get_art_url(item.get('album', {}).get('images', [])),
+        }
+    
+    track = dict(outbound.call('spotify', (name, real_artist), search))
+    if cache is not None:
+        cache.put(name, real_artist, uri=track['uri'], artist_uri=track['artist_uri'], art_url=track['art_url'] or '')
+    return track
+
+
+def get_art_url(images, min_size=ART_SIZE):
+    """
+    Return the url of the smallest album art image at least min_size pixels wide.
+    
+    :param list[dict] images: album images, as returned by Spotify (url, width, height)
+    :param int min_size: smallest width wanted (default=ART_SIZE)
+    :return: image url, the largest image if none are big enough, None if there are no images
+    :rtype: str
+    """
+    if not images:
+        return None
+    big_enough = [image for image in images if (image.get('width') or 0) >= min_size]
+    if big_enough:
+        return min(big_enough, key=lambda image: image['width'])['url']
+    return max(images, key=lambda image: image.get('width') or 0)['url']
+
+
+def search_youtube(name, artist, cache=None, search_pool=None):
+    """
+    Search www.youtube.com for a song and return the url of the first video result.
+    
+    :param str name: song name
+    :param str artist: song artist
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :param ProcessPoolExecutor search_pool: processes to search in, None to search on
+        this thread (default=None, see resolve_youtube_songs())
+    :rtype: str
+    :except IndexError: if the search found no videos, now or recently (see outbound.call())
+    :except ValueError: if the results page couldn't be read, e.g. because YouTube changed its layout
+    :except requests.RequestException: if YouTube couldn't be reached
+    """
+    real_artist = get_real_artist(artist)
+    if cache is not None:
+        url = cache.get(name, real_artist, 'yt_url')
+        if url:
+            return url
+    
+    def search():
+        """Search for song, here or in search_pool."""
+        with instrument.span('youtube.search'):
+            if search_pool is None:
+                return _find_youtube_video(f'{name} {real_artist}')
+            return search_pool.submit(_find_youtube_video, f'{name} {real_artist}').result()
+    
+    url = outbound.call('youtube', (name, real_artist), search)
+    if cache is not None:
+        cache.put(name, real_artist, yt_url=url)
+    return url
+
+
+def _find_youtube_video(query):
+    """Search YouTube using youtube_search and return the url of the first video (see search_youtube())."""
+    from youtube_search import YoutubeSearch
+    
+    try:
+        results = YoutubeSearch(query, max_results=1, timeout=outbound.get_timeout('youtube')).to_dict()
+    except (KeyError, TypeError, AttributeError) as error:
+        # The results page isn't laid out as youtube_search expects, which is not the
+        # same as finding nothing, so it must not be remembered as not found.
+        raise ValueError(f"couldn't read YouTube's results page ({error!r})") from error
+    return f'https://www.youtube.com/watch?v={results[0]["id"]}'
+
+
+def resolve_spotify_data(sp_api, song, cache=None):
+    """
+    Get and store a song's track and artist URIs and album art url, unless already stored.
+    
+    :param Spotify sp_api: spotify api connection object
+    :param Song song: song to resolve, its uri, artist_uri and art_url are set
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :return: whether the song's URIs are now stored
+    :rtype: bool
+    """
+    if song.artist_uri is not None and song.art_url is not None:
+        return True
+    from spotipy import SpotifyException
+    import requests
+    
+    try:
+        track = search_spotify_track(sp_api, song.name, song.artist, cache)
+    except (IndexError, SpotifyException, requests.RequestException):
+        return False
+    song.uri, song.artist_uri, song.art_url = track['uri'], track['artist_uri'], track['art_url']
+    return True
+
+
+def resolve_youtube_data(song, cache=None, search_pool=None):
+    """
+    Get and store a song's music video url, unless already stored.
+    
+    :param Song song: song to resolve, its yt_url is set
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :param ProcessPoolExecutor search_pool: processes to search in (default=None, see search_youtube())
+    :return: whether the song's music video url is now stored
+    :rtype: bool
+    """
+    if song.yt_url is not None:
+        return True
+    import requests
+    
+    try:
+        song.yt_url = search_youtube(song.name, song.artist, cache, search_pool)
+    except (IndexError, ValueError, requests.RequestException):
+        return False
+    return True
+
+
+def resolve_songs(songs, resolve, max_workers=RESOLVE_WORKERS, stop=None):
+    """
+    Resolve songs concurrently, in chart order, and return throughput stats.
+    
+    :param list[Song] songs: songs to resolve, in chart order
+    :param resolve: function called with each song, returning whether it was resolved
+    :param int max_workers: maximum number of songs resolved at once (default=RESOLVE_WORKERS)
+    :param Event stop: set to skip songs not yet started (default=None)
+    :return: "resolved", "failed", "seconds" and "songs_per_second"
+    :rtype: dict
+    
+    The first song is resolved on its own, so that spotipy only asks for
+    authorization once. Pool threads take songs in submission order, so
+    top songs are resolved first.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    
+    start = time.perf_counter()
+    resolved = failed = 0
+    
+    def resolve_unless_stopped(song):
+        """Resolve a song, or skip it if stop is set."""
+        if stop is not None and stop.is_set():
+            return False
+        return resolve(song)
+    
+    songs = list(songs)
+    if songs:
+        if resolve_unless_stopped(songs.pop(0)):
+            resolved += 1
+        else:
+            failed += 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(resolve_unless_stopped, song) for song in songs]
+        for future in as_completed(futures):
+            if future.result():
+                resolved += 1
+            else:
+                failed += 1
+    seconds = time.perf_counter() - start
+    return {
+        'resolved': resolved,
+        'failed': failed,
+        'seconds': seconds,
+        'songs_per_second': resolved / seconds if seconds else 0.0,
+    }
+
+
+def resolve_youtube_songs(songs, cache=None, max_workers=YOUTUBE_WORKERS, search_pool=None, stop=None):
+    """
+    Find the music videos of many songs at once, e.g. a whole chart, and return throughput stats.
+    
+    :param list[Song] songs: songs to resolve, in chart order, their yt_url is set
+    :param ResolutionCache cache: cache to read from and store to, saving it is up to the caller (default=None)
+    :param int max_workers: maximum number of songs searched for at once (default=YOUTUBE_WORKERS)
+    :param ProcessPoolExecutor search_pool: processes to run searches in, for batch jobs
+        (default=None, search on a thread pool in this process)
+    :param Event stop: set to skip songs not yet started (default=None)
+    :return: "resolved", "failed", "seconds" and "songs_per_second" (see resolve_songs()),
+        counting only songs whose music video wasn't already stored on them
+    :rtype: dict
+    
+    Songs are searched for on a thread pool. Songs found in the cache, or already being
+    searched for (e.g. by a click, see outbound.call()), don't send another search.
+    
+    youtube_search decodes each results page, about 1 MB of JSON, while holding the GIL.
+    Headless batch jobs on many CPUs can hand searches to a search_pool instead, so pages
+    are decoded in parallel. Start it with the "spawn" method, as forking a process while
+    other threads are running isn't safe. Each process searches for one song at a time and
+    costs a Python interpreter, so threads are faster unless there are CPUs to spare for
+    as many processes as max_workers (see benchmarks/youtube_bulk.py). TopSongsApp always
+    uses threads.
+    """
+    songs = [song for song in songs if song.yt_url is None]
+    return resolve_songs(songs, lambda song: resolve_youtube_data(song, cache, search_pool), max_workers, stop)
+
+
+def get_playlist(sp_api, name=PLAYLIST_NAME):
+    """
+    Return the id of the current user's playlist with a name, creating a private one if there isn't one.
+    
+    :param Spotify sp_api: spotify api connection object
+    :param str name: playlist name (default=PLAYLIST_NAME)
+    :rtype: str
+    """
+    user_id = sp_api.current_user()['id']
+    page = sp_api.current_user_playlists(limit=50)
+    while page:
+        for playlist in page['items']:
+            if playlist['name'] == name and playlist['owner']['id'] == user_id:
+                return playlist['id']
+        page = sp_api.next(page) if page['next'] else None
+    return sp_api.user_playlist_create(user_id, name, public=False, description=PLAYLIST_DESCRIPTION)['id']
+
+
+def play_songs(sp_api, songs, device_id=None, cache=None, playlist_id=None, max_workers=RESOLVE_WORKERS):
+    """
+    Play several songs in order, resolving them first, with as few playback requests as possible.
+    
+    :param Spotify sp_api: spotify api connection object
+    :param list[Song] songs: songs to play, in order
+    :param str device_id: Spotify player to play on (default=None, the active player)
+    :param ResolutionCache cache: cache of previous results (default=None)
+    :param str playlist_id: playlist to fill if there are too many songs for one request (default=None, see get_playlist())
+    :param int max_workers: maximum number of songs resolved at once (default=RESOLVE_WORKERS)
+    :return: id of the playlist used (playlist_id if none was needed), and stats: those of
+        resolve_songs(), plus "tracks" (number of tracks played) and "requests" (number of
+        requests made to hand the tracks to Spotify, not counting finding the playlist)
+    :rtype: str, dict
+    
+    Only songs without a URI are searched for, and each distinct song (see Song.get_key())
+    is searched for once. Songs that can't be found are left out, as are repeats of a track.
+    
+    Up to SPOTIFY_BATCH_SIZE tracks are played with a single start_playback() request. Longer
+    lists replace the contents of a private playlist, SPOTIFY_BATCH_SIZE tracks per request,
+    which is then played.
+    """
+    unresolved = {}
+    for song in songs:
+        if song.uri is None:
+            unresolved.setdefault(song.get_key(), []).append(song)
+    stats = resolve_songs(
+        [same_songs[0] for same_songs in unresolved.values()],
+        lambda song: resolve_spotify_data(sp_api, song, cache),
+        max_workers
+    )
+    for first, *others in unresolved.values():
+        for song in others:
+            song.uri, song.artist_uri, song.art_url = first.uri, first.artist_uri, first.art_url
+    uris = list(dict.fromkeys(song.uri for song in songs if song.uri is not None))
+    stats['tracks'] = len(uris)
+    stats['requests'] = 0
+    if not uris:
+        return playlist_id, stats
+    if len(uris) <= SPOTIFY_BATCH_SIZE:
+        with instrument.span('spotify.start_playback', tracks=len(uris)):
+            sp_api.start_playback(device_id=device_id, uris=uris)
+        stats['requests'] = 1
+        return playlist_id, stats
+    if playlist_id is None:
+        playlist_id = get_playlist(sp_api)
+    batches = [uris[i:i + SPOTIFY_BATCH_SIZE] for i in range(0, len(uris), SPOTIFY_BATCH_SIZE)]
+    with instrument.span('spotify.fill_playlist', tracks=len(uris)):
+        sp_api.playlist_replace_items(playlist_id, batches[0])
+        for batch in batches[1:]:
+            sp_api.playlist_add_items(playlist_id, batch)
+    with instrument.span('spotify.start_playback', tracks=len(uris)):
+        sp_api.start_playback(device_id=device_id, context_uri=f'spotify:playlist:{playlist_id}')
+    stats['requests'] = len(batches) + 1
+    return playlist_id, stats
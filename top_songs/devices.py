@@ -0,0 +1,118 @@
+"""
+Module devices
+
+Keeps track of the Spotify players (devices) available to TopSongs without asking Spotify on every click.
+
+Classes:
+    DeviceCache
+"""
+
+from spotipy import SpotifyException
+from top_songs import instrument
+import threading
+import requests
+import time
+
+# Seconds before cached devices are considered out of date.
+DEVICE_TTL = 30
+# Seconds between background refreshes, shorter than DEVICE_TTL so clicks never wait.
+DEVICE_POLL_INTERVAL = 20
+
+
+class DeviceCache:
+    """
+    A class to cache the list of Spotify devices, refreshing it in the background.
+    
+    Background polling starts after the first successful refresh, which happens on
+    the user's first click, so that spotipy never asks for authorization from a
+    background thread.
+    
+    Attributes:
+        sp_api : Spotify
+            spotify api connection object used to get devices
+        ttl : float
+            seconds before cached devices are considered out of date
+        poll_interval : float
+            seconds between background refreshes (None to disable polling)
+        devices : list[dict]
+            devices returned by the last refresh
+        updated : float
+            time of the last refresh (0 if never refreshed)
+        stopped : Event
+            set to stop background polling
+    
+    Methods:
+        get(self):
+            Return cached devices, refreshing them first if they are out of date.
+        refresh(self):
+            Get devices from Spotify and cache them.
+        invalidate(self):
+            Mark cached devices as out of date, e.g. after a failed playback.
+        stop(self):
+            Stop background polling.
+    """
+    
+    def __init__(self, sp_api, ttl=DEVICE_TTL, poll_interval=DEVICE_POLL_INTERVAL):
+        """
+        Create attributes for DeviceCache object.
+        
+        :param Spotify sp_api: spotify api connection object
+        :param float ttl: seconds before cached devices are out of date (default=DEVICE_TTL)
+        :param float poll_interval: seconds between background refreshes, None to disable (default=DEVICE_POLL_INTERVAL)
+        """
+        self.sp_api = sp_api
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.devices = []
+        self.updated = 0
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._poller = None
+    
+    def get(self):
+        """
+        Return cached devices, refreshing them first if they are out of date.
+        
+        :return: devices, in the format returned by Spotify.devices()
+        :rtype: list[dict]
+        
+        If no devices were found last time, Spotify is asked again, as the user
+        may have only just opened a player.
+        """
+        with self._lock:
+            devices, updated = self.devices, self.updated
+        if devices and time.monotonic() - updated < self.ttl:
+            instrument.count('device_cache.hit')
+            return devices
+        instrument.count('device_cache.miss')
+        return self.refresh()
+    
+    def refresh(self):
+        """Get devices from Spotify and cache them, returning the new devices."""
+        with instrument.span('spotify.devices'):
+            devices = self.sp_api.devices()['devices']
+        with self._lock:
+            self.devices = devices
+            self.updated = time.monotonic()
+            if self._poller is None and self.poll_interval:
+                self._poller = threading.Thread(target=self._poll, daemon=True)
+                self._poller.start()
+        return devices
+    
+    def invalidate(self):
+        """Mark cached devices as out of date, e.g. after a failed playback."""
+        with self._lock:
+            self.updated = 0
+    
+    def stop(self):
+        """Stop background polling."""
+        self.stopped.set()
+    
+    def _poll(self):
+        """Refresh devices every poll_interval seconds until stopped."""
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except (SpotifyException, requests.RequestException):
+                # A failed poll is not worth crashing over, the next click will refresh again.
+                self.invalidate()
@@ -0,0 +1,426 @@
+"""
+Module instrument
+
+Timers, counters and latency histograms for Top Songs' slow paths (chart downloads, parsing,
+building widgets, Spotify and YouTube requests, cache lookups).
+
+Recording is off by default. While it is off, span() returns a shared object that does
+nothing and count() returns straight away, so instrumented code costs about one attribute
+lookup and a function call.
+
+Recording is switched on by environment variables, read when this module is imported:
+    TOP_SONGS_TRACE: file to write a Chrome trace to when Python exits ("1" for DEFAULT_TRACE_FILE)
+    TOP_SONGS_STATS: seconds between stats dumps to stderr (see Recorder.start_dump())
+or in code with recorder.enable() (see also TopSongsApp's trace parameter).
+
+Traces can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Classes:
+    Histogram
+    Recorder
+
+Functions:
+    span(name, **args)
+    count(name, n)
+    observe(name, milliseconds)
+    configure_from_environment(environ)
+
+Variables:
+    recorder : Recorder
+        recorder used by all of Top Songs
+"""
+
+from collections import deque
+import threading
+import bisect
+import atexit
+import json
+import time
+import sys
+import os
+
+TRACE_VARIABLE = 'TOP_SONGS_TRACE'
+STATS_VARIABLE = 'TOP_SONGS_STATS'
+DEFAULT_TRACE_FILE = 'top_songs_trace.json'
+# Trace events kept, older events are dropped first. Counters and histograms are never dropped.
+MAX_EVENTS = 100_000
+# Upper bounds of histogram buckets in milliseconds, the last bucket holds everything slower.
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    A class to count durations in fixed buckets, so percentiles can be estimated in constant memory.
+    
+    Attributes:
+        buckets : list[int]
+            number of durations in each bucket (see HISTOGRAM_BOUNDS)
+        count : int
+            number of durations added
+        total : float
+            sum of durations added, in milliseconds
+        max : float
+            longest duration added, in milliseconds
+    
+    Methods:
+        add(self, milliseconds):
+            Add a duration.
+        percentile(self, p):
+            Return the upper bound of the bucket holding the p-th percentile.
+        to_dict(self):
+            Return a summary of the histogram.
+    """
+    
+    __slots__ = ('buckets', 'count', 'total', 'max')
+    
+    def __init__(self):
+        """Create attributes for Histogram object."""
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def add(self, milliseconds):
+        """Add a duration."""
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+    
+    def percentile(self, p):
+        """
+        Return the upper bound of the bucket holding the p-th percentile, in milliseconds.
+        
+        :param float p: percentile, between 0 and 100
+        :rtype: float
+        
+        For the last bucket, which has no upper bound, the longest duration is returned.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for bound, bucket in zip(HISTOGRAM_BOUNDS, self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(float(bound), self.max)
+        return self.max
+    
+    def to_dict(self):
+        """Return a summary of the histogram: count, mean, percentiles, max and bucket counts."""
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+            'buckets': {
+                f'<={bound}ms' if bound is not None else f'>{HISTOGRAM_BOUNDS[-1]}ms': bucket
+                for bound, bucket in zip(HISTOGRAM_BOUNDS + (None,), self.buckets) if bucket
+            },
+        }
+
+
+class _Span:
+    """Times a with block and records it with a Recorder (see Recorder.span())."""
+    
+    __slots__ = ('recorder', 'name', 'args', 'start')
+    
+    def __init__(self, recorder, name, args):
+        """Create attributes for _Span object."""
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+        self.start = 0.0
+    
+    def __enter__(self):
+        """Start timing."""
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop timing and record the span, noting the exception if one was raised."""
+        if exc_type is not None:
+            self.args = dict(self.args or {}, error=exc_type.__name__)
+        self.recorder.add_span(self.name, self.start, time.perf_counter(), self.args)
+
+
+class _NullSpan:
+    """Stands in for _Span while recording is off, doing nothing."""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        """Do nothing."""
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Do nothing."""
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Recorder:
+    """
+    A class to record spans, counters and histograms, and export them.
+    
+    Every span is also added to the histogram with the same name, so each
+    instrumented stage gets a latency histogram.
+    
+    Attributes:
+        enabled : bool
+            whether anything is being recorded
+        events : deque[dict]
+            Chrome trace events recorded (at most max_events)
+        counters : dict[str: int]
+            counter name mapped to count
+        histograms : dict[str: Histogram]
+            histogram name mapped to histogram
+        max_events : int
+            trace events kept before older events are dropped
+    
+    Methods:
+        enable(self):
+            Start recording.
+        disable(self):
+            Stop recording (recorded data is kept).
+        reset(self):
+            Forget everything recorded.
+        span(self, name, **args):
+            Return a context manager timing a with block.
+        add_span(self, name, start, end, args):
+            Record a span that has finished.
+        count(self, name, n):
+            Add to a counter.
+        observe(self, name, milliseconds):
+            Add a duration to a histogram.
+        get_stats(self):
+            Return counters, cache hit rates and histogram summaries.
+        get_trace(self):
+            Return recorded spans in Chrome's trace event format.
+        export_trace(self, filename):
+            Write recorded spans to a Chrome trace file.
+        start_dump(self, interval, file):
+            Write stats to a file every interval seconds, on a background thread.
+        stop_dump(self):
+            Stop writing stats.
+    """
+    
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        """
+        Create attributes for Recorder object.
+        
+        :param bool enabled: start recording straight away (default=False)
+        :param int max_events: trace events kept before older events are dropped (default=MAX_EVENTS)
+        """
+        self.enabled = enabled
+        self.max_events = max_events
+        self.events = deque(maxlen=max_events)
+        self.counters = {}
+        self.histograms = {}
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._dump_stopped = None
+    
+    def enable(self):
+        """Start recording."""
+        self.enabled = True
+    
+    def disable(self):
+        """Stop recording (recorded data is kept)."""
+        self.enabled = False
+    
+    def reset(self):
+        """Forget everything recorded."""
+        with self._lock:
+            self.events = deque(maxlen=self.max_events)
+            self.counters = {}
+            self.histograms = {}
+            self._thread_names = {}
+    
+    def span(self, name, **args):
+        """
+        Return a context manager timing a with block.
+        
+        :param str name: stage name, e.g. "spotify.search"
+        :param args: details shown with the span in the trace, e.g. chart="hot-100"
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args or None)
+    
+    def add_span(self, name, start, end, args=None):
+        """
+        Record a span that has finished.
+        
+        :param str name: stage name
+        :param float start: time.perf_counter() at the start of the span
+        :param float end: time.perf_counter() at the end of the span
+        :param dict args: details shown with the span in the trace (default=None)
+        """
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self._thread_names[thread.ident] = thread.name
+            self._observe(name, (end - start) * 1000)
+    
+    def count(self, name, n=1):
+        """Add n to a counter, e.g. count('chart_cache.hit')."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def observe(self, name, milliseconds):
+        """Add a duration to a histogram."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._observe(name, milliseconds)
+    
+    def _observe(self, name, milliseconds):
+        """Add a duration to a histogram, with self._lock held."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(milliseconds)
+    
+    def get_stats(self):
+        """
+        Return counters, cache hit rates and histogram summaries.
+        
+        :return: "counters", "hit_rates" and "histograms" (see Histogram.to_dict())
+        :rtype: dict
+        
+        Hit rates are worked out for every pair of counters named "<cache>.hit" and "<cache>.miss".
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith('.hit'):
+                cache = name[:-len('.hit')]
+                lookups = hits + counters.get(f'{cache}.miss', 0)
+                hit_rates[cache] = hits / lookups if lookups else 0.0
+        return {'counters': counters, 'hit_rates': hit_rates, 'histograms': histograms}
+    
+    def get_trace(self):
+        """
+        Return recorded spans in Chrome's trace event format.
+        
+        :rtype: dict
+        
+        Thread names are added as metadata events, and counters as one counter event at the end.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self._thread_names)
+            counters = dict(self.counters)
+        for tid, name in thread_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        if counters:
+            now = (time.perf_counter() - self._origin) * 1e6
+            events.append({'name': 'counters', 'ph': 'C', 'ts': now, 'pid': pid, 'tid': 0, 'args': counters})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+    
+    def export_trace(self, filename=DEFAULT_TRACE_FILE):
+        """Write recorded spans to a Chrome trace file (see get_trace())."""
+        with open(filename, 'w') as file_out:
+            json.dump(self.get_trace(), file_out)
+    
+    def start_dump(self, interval, file=None):
+        """
+        Write stats to a file every interval seconds, on a background thread.
+        
+        :param float interval: seconds between dumps
+        :param file: file object to write to (default=sys.stderr)
+        
+        Each dump is one line of JSON (see get_stats()), with the time it was written.
+        """
+        self.stop_dump()
+        stopped = self._dump_stopped = threading.Event()
+        
+        def dump():
+            """Write stats until stopped."""
+            while not stopped.wait(interval):
+                line = json.dumps(dict(self.get_stats(), time=time.time()))
+                print(line, file=file or sys.stderr, flush=True)
+        
+        threading.Thread(target=dump, name='stats-dump', daemon=True).start()
+    
+    def stop_dump(self):
+        """Stop writing stats."""
+        if self._dump_stopped is not None:
+            self._dump_stopped.set()
+            self._dump_stopped = None
+
+
+recorder = Recorder()
+
+
+def span(name, **args):
+    """Return a context manager timing a with block (see Recorder.span())."""
+    if not recorder.enabled:
+        return NULL_SPAN
+    return _Span(recorder, name, args or None)
+
+
+def count(name, n=1):
+    """Add n to a counter (see Recorder.count())."""
+    if recorder.enabled:
+        recorder.count(name, n)
+
+
+def observe(name, milliseconds):
+    """Add a duration to a histogram (see Recorder.observe())."""
+    if recorder.enabled:
+        recorder.observe(name, milliseconds)
+
+
+def configure_from_environment(environ=None):
+    """
+    Switch recording on if TRACE_VARIABLE or STATS_VARIABLE are set.
+    
+    :param environ: environment variables (default=os.environ)
+    
+    A STATS_VARIABLE that isn't a positive number of seconds is warned about on stderr
+    and ignored, so a typo doesn't stop Top Songs from starting.
+    """
+    environ = os.environ if environ is None else environ
+    trace_file = environ.get(TRACE_VARIABLE)
+    if trace_file:
+        recorder.enable()
+        if trace_file.lower() in ('1', 'true', 'yes'):
+            trace_file = DEFAULT_TRACE_FILE
+        # Use an absolute path, in case the working directory changes before exit.
+        atexit.register(recorder.export_trace, os.path.abspath(trace_file))
+    interval = environ.get(STATS_VARIABLE)
+    if interval:
+        try:
+            seconds = float(interval)
+        except ValueError:
+            seconds = 0
+        if not seconds > 0:
+            print(f'Ignoring {STATS_VARIABLE}={interval!r}, it must be a number of seconds.', file=sys.stderr)
+            return
+        recorder.enable()
+        recorder.start_dump(seconds)
+
+
+configure_from_environment()
@@ -13,17 +13,28 @@ Github: https://www.github.com/CalebWebsterJCU/TopSongs
 See README.md for info regarding application setup.
 """
 
-from youtube_search import YoutubeSearch
-from spotipy.oauth2 import SpotifyOAuth
+from top_songs.scheduler import SpotifyScheduler, INTERACTIVE, VISIBLE, BACKGROUND
+from top_songs.artwork import ArtworkLoader, THUMBNAIL_SIZE
+from top_songs.actions import ActionDispatcher
+from top_songs.cache import ChartCache, ResolutionCache
+from top_songs.prefetch import HoverPrefetcher, HOVER_DELAY
+from top_songs.service import ServiceClient, SERVICE_URL
+from top_songs.devices import DeviceCache
+from top_songs.search import SearchIndex
 from PIL import ImageTk, Image as Img
+from spotipy import SpotifyException
 from tkinter import messagebox
-from bs4 import BeautifulSoup
-from spotipy import Spotify
+from top_songs import instrument
+from top_songs import core
 from tkinter import ttk
 from tkinter import *
 import webbrowser
-import requests
+import threading
 import socket
+import queue
+import math
+import time
+import sys
 import os
 
 NUM_SONGS = 100
@@ -31,7 +42,17 @@ LARGE_FONT = ('Goldman', 22)
 MEDIUM_FONT = ('Goldman', 10)
 SMALL_FONT = ('Sansation', 12)
 SCROLL_SPEED = 1
-CREDENTIALS_FILE = 'credentials.txt'
+# Milliseconds between checks for a chart being loaded in the background.
+CHART_POLL_INTERVAL = 50
+# Seconds between checks for a new chart. Until a new chart is due, a check only reads the chart cache.
+REFRESH_INTERVAL = 60 * 60
+SONG_LIST_HEIGHT = 480
+# Extra song rows beyond those needed to fill SONG_LIST_HEIGHT, so partly visible rows are covered.
+VISIBLE_ROW_BUFFER = 2
+ROW_PADX = 6
+ROW_PADY = 3
+# Song attribute found by each hover prefetch service, songs that already have it aren't looked up.
+PREFETCH_FIELDS = {'spotify': 'uri', 'youtube': 'yt_url'}
 
 
 class TopSongsApp:
@@ -39,28 +60,118 @@ class TopSongsApp:
     A class to store methods for the Top Songs Application.
     
     Attributes:
-        sp_api : Spotify
-            spotify api connection object used to play songs
-        songs : list[dict]
+        sp_api : SpotifyScheduler
+            spotify api connection object used to play songs, paced so clicks go before background lookups
+        songs : list[Song]
             list of songs read from www.billboard.com
         root : Tk
             Tkinter base window on which to build ui
         images : dict[str: ImageTk]
-            loaded images used for youtube buttons and scroll top button
+            loaded images used for youtube buttons, scroll top button and songs without album art
         widgets : dict[str: Widget]
             dictionary of widgets (widget name mapped to widget object)
+        row_height : int
+            height of a song row in pixels, including padding
+        song_order : list[int]
+            indexes of songs shown in the scrollable region, in order
+        device_cache : DeviceCache
+            Spotify players found recently, refreshed in the background
+        pc_name : str
+            name of this computer, which is also the name of its Spotify desktop player
+        resolution_cache : ResolutionCache
+            Spotify URIs and YouTube urls found in this and previous sessions
+        prefetch_stats : dict
+            results of the last prefetch (see prefetch_song_data())
+        video_prefetch_stats : dict
+            results of the last music video prefetch (see prefetch_song_data())
+        stop_prefetch : Event
+            set to stop prefetching when the app closes
+        prefetch : bool
+            whether to prefetch songs' Spotify URIs and music videos once the chart is loaded
+        chart_queue : Queue
+            passes the chart from the background loading thread to the Tkinter thread
+        chart_cache : ChartCache
+            charts downloaded in this and previous sessions
+        refresh_interval : float
+            seconds between checks for a new chart, None to only check when asked (F5)
+        startup_times : dict[str: float]
+            startup stage mapped to time reached (see get_startup_report())
+        search_index : SearchIndex
+            index of songs' names and artists, by index in self.songs
+        search_text : StringVar
+            text in the search box
+        playlist_id : str
+            id of the playlist used by play_all(), None until first needed
+        play_all_queue : Queue
+            passes results of play_all() from its background thread to the Tkinter thread
+        artwork : ArtworkLoader
+            loads album art thumbnails for the songs in view, in the background
+        hover_prefetcher : HoverPrefetcher
+            looks up the song under the pointer, so clicking it doesn't wait for Spotify or YouTube
+        service : ServiceClient
+            shared chart service the chart and song links are got from, None to get them directly
+        actions : ActionDispatcher
+            runs what clicking a song does in the background, so the window never waits for the network
     
     Methods:
         get_spotify_creds():
             Read spotify credentials from environment variables or CREDENTIALS_FILE
         get_top_songs(n):
             Request and return a number of top songs from www.billboard.com
+        fetch_chart(self, cache, revalidate):
+            Get the top songs from self.service if one is used, otherwise from www.billboard.com.
+        resolve_spotify(self, song, priority):
+            Get and store a song's Spotify URIs and album art url, unless already stored.
+        resolve_youtube(self, song):
+            Get and store a song's music video url, unless already stored.
         create_ui(self):
             Create static buttons and sections and add them to the GUI.
         create_scrollable_frame(self):
             Create Scrollable region to contain song widgets.
         create_song_widgets(self):
-            Create buttons and labels for each song.
+            Create a pool of song rows, just enough to fill the scrollable region.
+        create_song_row(self):
+            Create an empty song row (frame and buttons) and add it to the scrollable region.
+        show_song_in_row(self, song_frame, index):
+            Show a song in a song row.
+        show_art_in_row(self, song_frame, song):
+            Show a song's album art in a song row, loading it in the background if needed.
+        show_pending_in_row(self, song_frame, song):
+            Grey out a song row's buttons whose clicks are still being handled.
+        show_action_pending(self, key, _pending):
+            Show or clear a click being handled in the rows showing its song.
+        show_action_error(self, error):
+            Report a click that couldn't be handled.
+        check_artwork_loaded(self):
+            Show album art loaded in the background, and check again later while more is loading.
+        set_song_order(self, order):
+            Set which songs are shown in the scrollable region, and in which order.
+        update_song_rows(self):
+            Move song rows into view and show the right songs in them.
+        index_songs(self):
+            Rebuild the search index from self.songs.
+        filter_songs(self):
+            Show only the songs matching the search box.
+        search_changed(self, *_args):
+            Filter songs when the text in the search box changes.
+        clear_search(self, _event):
+            Empty the search box, showing every song again.
+        play_all(self):
+            Play every song shown, in order, on the currently open Spotify player.
+        check_play_all_done(self):
+            Show the result of play_all() once it has finished, otherwise check again later.
+        refresh_chart(self, event):
+            Check for a new chart in the background, then show only the songs that changed.
+        load_chart(self, cache, revalidate):
+            Get top songs on a background thread and pass them to the Tkinter thread.
+        check_chart_loaded(self):
+            Show the chart if it has been loaded, otherwise check again later.
+        show_songs(self, songs):
+            Show a new copy of the chart, changing only the songs that differ from those shown.
+        record_startup_time(self, stage):
+            Record the time a startup stage was reached.
+        get_startup_report(self):
+            Return how long each startup stage took to reach.
         open_project_github(event):
             Open the TopSongs directory in GitHub.
         open_developer_github(event):
@@ -73,6 +184,8 @@ class TopSongsApp:
             Open the Spotify Web Player in the default browser.
         scroll_to_top(self):
             Scroll to top of scrollable songs frame.
+        scroll_to(self, *args):
+            Scroll songs as instructed by the scrollbar.
         scroll(self, event):
             Scroll through songs.
         number_btn_release(self, event):
@@ -91,12 +204,16 @@ class TopSongsApp:
             Open Billboard chart with button's song selected.
         get_song_data(self, song):
             Get a song's track and artist URIs from Spotify's API via spotipy.
+        prefetch_song_data(self, max_workers):
+            Start getting every song's track and artist URIs and music video in the background.
         spotify_launchers_are_running(self):
             Check whether Spotify app or web players (or both) are running.
         open_artist(self, button):
             Open an artist in the currently open Spotify player.
         play_song(self, button):
             Play a song in the currently open Spotify player.
+        play_song_done(self, played):
+            Tell the user if a song couldn't be played because no player is running.
         open_music_video(self, button):
             Open a song's music video on YouTube in the default browser.
         get_real_artist(artist):
@@ -105,38 +222,78 @@ class TopSongsApp:
             Start TopSongs app.
     """
     
-    def __init__(self, client_id=None, client_secret=None, redirect_uri=None):
+    def __init__(self, client_id=None, client_secret=None, redirect_uri=None, prefetch=False, load_in_background=True,
+                 sp_api=None, trace=None, hover_delay=HOVER_DELAY, service_url=SERVICE_URL,
+                 refresh_interval=REFRESH_INTERVAL):
         """
         Create attributes for TopSongs object, connect spotipy, get songs, initialize Tkinter.
         
         :param client_id: Client ID of your Spotify app (default=None)
         :param client_secret: Client Secret of your Spotify app (default=None)
         :param redirect_uri: Redirect URI of your Spotify app (default=None)
+        :param bool prefetch: get all songs' Spotify URIs and music videos in the background (default=False)
+        :param bool load_in_background: show the window before the chart has loaded (default=True)
+        :param Spotify sp_api: spotify api connection to use instead of connecting with the credentials,
+            wrapped in a SpotifyScheduler if it isn't one (default=None)
+        :param trace: Chrome trace file written when the app closes, or True for instrument.DEFAULT_TRACE_FILE (default=None)
+        :param int hover_delay: milliseconds the pointer rests on a song before it's looked up, None to disable (default=HOVER_DELAY)
+        :param str service_url: url of a chart service to get the chart and song links from (default=service.SERVICE_URL)
+        :param float refresh_interval: seconds between checks for a new chart, None to disable (default=REFRESH_INTERVAL)
         
         The above parameters are optional, if they are left blank the program will set them from
-        environment variables or by reading CREDENTIALS_FILE (see get_spotify_creds()). Whichever
+        environment variables or by reading core.CREDENTIALS_FILE (see get_spotify_creds()). Whichever
         of these three ways you choose, these three variables must be set and correct to run TopSongs.
         
         NOTE: providing TopSongs with your credentials allows the program to access your spotify account.
         
         the variable scope dictates which parts of your information TopSongs can access. The scope is set
-        to "user-read-currently-playing user-modify-playback-state user-read-playback-state", which means
-        that TopSongs can only start/stop playback, see what you're playing, and what device you're playing
-        on.
+        to "user-read-currently-playing user-modify-playback-state user-read-playback-state
+        playlist-read-private playlist-modify-private", which means that TopSongs can only start/stop
+        playback, see what you're playing, and what device you're playing on, and see and change your
+        private playlists (only the "Top Songs" playlist is ever changed, see play_all()).
+        
+        If load_in_background is True, the window is shown straight away with the last
+        cached chart (or a loading message) while the chart is loaded on another thread.
+        Otherwise, the window is only created after the chart has loaded.
+        
+        If trace is set, timings of slow stages (chart download, building widgets, Spotify
+        and YouTube requests) are recorded (see instrument.py) and written as a Chrome trace
+        when run() returns, and how long startup took is printed (see get_startup_report()). Recording can also be switched on with environment variables.
+        
+        Resting the pointer on a song's name, artist or music video button for hover_delay
+        milliseconds looks the song up in the background (see prefetch.HoverPrefetcher),
+        so that clicking it is instant. Lower delays make more clicks instant, at the cost
+        of looking up songs that are never clicked (see hover_prefetcher.get_stats()).
+        
+        If service_url is set (or the TOP_SONGS_SERVICE_URL environment variable), the chart
+        and songs' Spotify and YouTube links are got from a chart service shared with other
+        users (see service.py) instead of from Billboard, Spotify and YouTube. Playback still
+        uses your own Spotify account.
+        
+        Every refresh_interval seconds, and whenever F5 is pressed, the chart is checked for
+        changes in the background (see refresh_chart()).
         """
-        scope = 'user-read-currently-playing user-modify-playback-state user-read-playback-state'
-        if client_id and client_secret and redirect_uri:
-            cid, secret, uri = client_id, client_secret, redirect_uri
+        self.startup_times = {'start': time.perf_counter()}
+        self.trace = trace
+        if trace:
+            instrument.recorder.enable()
+        if sp_api is None:
+            sp_api = core.connect_spotify(client_id, client_secret, redirect_uri)
+        elif not isinstance(sp_api, SpotifyScheduler):
+            sp_api = SpotifyScheduler(sp_api)
+        self.sp_api = sp_api
+        self.service = ServiceClient(service_url) if service_url else None
+        self.device_cache = DeviceCache(self.sp_api)
+        self.pc_name = socket.gethostname()
+        self.chart_cache = ChartCache()
+        self.refresh_interval = refresh_interval
+        self._loading_chart = False
+        self._refresh_job = None
+        self._refresh_by_hand = False
+        if load_in_background:
+            self.songs = self.chart_cache.get_songs(core.HOT_100)[:NUM_SONGS]
         else:
-            cid, secret, uri = self.get_spotify_creds()
-        auth_manager = SpotifyOAuth(
-            scope=scope,
-            client_id=cid,
-            client_secret=secret,
-            redirect_uri=uri
-        )
-        self.sp_api = Spotify(auth_manager=auth_manager)
-        self.songs = self.get_top_songs(NUM_SONGS)
+            self.songs = self.fetch_chart(self.chart_cache)
         self.root = Tk()
         self.root.title('Top Songs')
         self.root.resizable(False, False)
@@ -144,77 +301,95 @@ class TopSongsApp:
         self.images = {
             'youtube': ImageTk.PhotoImage(Img.open('top_songs/youtube.png')),
             'up_arrow': ImageTk.PhotoImage(Img.open('top_songs/up_arrow.png')),
+            'no_art': ImageTk.PhotoImage(Img.new('RGBA', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))),
         }
         self.widgets = {}
-        self.create_ui()
+        self.resolution_cache = ResolutionCache()
+        # Art and hovered songs are looked up before whole-chart prefetching, clicks before both.
+        self.artwork = ArtworkLoader(lambda song: self.resolve_spotify(song, VISIBLE))
+        self._checking_artwork = False
+        self.hover_prefetcher = HoverPrefetcher(self.root, {
+            'spotify': lambda song: self.resolve_spotify(song, VISIBLE),
+            'youtube': self.resolve_youtube,
+        }, hover_delay)
+        self.actions = ActionDispatcher(
+            self.root, self.show_action_pending, initializer=lambda: self.sp_api.set_priority(INTERACTIVE)
+        )
+        self._play_clicks = 0
+        self.prefetch_stats = {}
+        self.video_prefetch_stats = {}
+        self.stop_prefetch = threading.Event()
+        self.prefetch = prefetch
+        self.playlist_id = None
+        self.play_all_queue = queue.Queue()
+        self.chart_queue = queue.Queue()
+        self.search_index = SearchIndex()
+        self.index_songs()
+        with instrument.span('ui.create_ui'):
+            self.create_ui()
+        # Runs once mainloop has started, i.e. when the window appears.
+        self.root.after(0, self.record_startup_time, 'window')
+        if not load_in_background:
+            self.record_startup_time('chart')
+            if prefetch:
+                self.prefetch_song_data()
+            self.schedule_refresh()
+            return
+        if self.songs:
+            self.record_startup_time('snapshot')
+        else:
+            self.widgets['hover_label'].config(text='Loading chart...')
+        self.refresh_chart()
     
     @staticmethod
     def get_spotify_creds():
+        """Read spotify credentials from environment variables or core.CREDENTIALS_FILE (see core.get_spotify_creds())."""
+        return core.get_spotify_creds()
+    
+    @staticmethod
+    def get_top_songs(n, cache=None, revalidate=False):
+        """Request and return a number of top songs from www.billboard.com (see core.get_top_songs())."""
+        return core.get_top_songs(n, cache, revalidate)
+    
+    def fetch_chart(self, cache, revalidate=False):
         """
-        Read spotify credentials from environment variables or CREDENTIALS_FILE.
-        
-        :except KeyError: if one or more env variables are missing, read from file
+        Get the top songs from self.service if one is used, otherwise from www.billboard.com.
         
-        Environment variable names:
-        SPOTIPY_CLIENT_ID
-        SPOTIPY_CLIENT_secret
-        SPOTIPY_REDIRECT_URI
+        :param ChartCache cache: cache to read from and store to
+        :param bool revalidate: ask Billboard even if the cached chart is this week's (default=False)
+        :rtype: list[Song]
         
-        Credentials file format:
-        Line 1: Client Id
-        Line 2: Client Secret
-        Line 3: Redirect Uri
+        Charts got from the service are stored in the cache too, so the next start
+        shows them straight away. The service keeps charts up to date itself.
         """
-        try:
-            client_id = os.environ['SPOTIPY_CLIENT_ID']
-            client_secret = os.environ['SPOTIPY_CLIENT_SECRET']
-            redirect_uri = os.environ['SPOTIPY_REDIRECT_URI']
-        except KeyError:
-            with open(CREDENTIALS_FILE, 'r') as file_in:
-                client_id = file_in.readline().strip()
-                client_secret = file_in.readline().strip()
-                redirect_uri = file_in.readline().strip()
-                
-        return client_id, client_secret, redirect_uri
+        if self.service is None:
+            return self.get_top_songs(NUM_SONGS, cache, revalidate)
+        songs = self.service.get_chart(core.HOT_100, NUM_SONGS)
+        if songs:
+            cache.store(core.HOT_100, songs, {})
+        return songs
     
-    @staticmethod
-    def get_top_songs(n):
+    def resolve_spotify(self, song, priority=BACKGROUND):
         """
-        Request and return a number of top songs from www.billboard.com.
+        Get and store a song's Spotify URIs and album art url, unless already stored.
         
-        :param int n: number of songs to return
-        :return: top songs
-        :rtype: list[dict]
+        :param Song song: song to resolve
+        :param int priority: priority of the Spotify search, see scheduler.py (default=BACKGROUND)
+        :return: whether the song's URIs are now stored
+        :rtype: bool
         
-        songs are extracted from HTML parsed by beautifulsoup4 and are
-        stored as dictionaries with the format:
-        {
-            "number": number,
-            "name": name,
-            "artist": artist
-        }
-        NOTE: making n smaller does not reduce network load or processing time.
-        You just get less songs.
+        Used by background lookups (prefetching, album art), see core.resolve_spotify_data().
         """
-        top_100 = requests.get('https://www.billboard.com/charts/hot-100')
-        try:
-            top_100.raise_for_status()
-        except requests.HTTPError:
-            return []
-        html = top_100.text
-        top_100.close()
-        # Parse HTML.
-        soup = BeautifulSoup(html, 'html.parser')
-        songs = []
-        for number, song in enumerate(soup.find_all('div', class_='o-chart-results-list-row-container', limit=n), 1):
-            # print(song)
-            name_element = song.find('h3', class_='c-title')
-            name = name_element.text.strip()
-            # print(name)
-            artist = name_element.next_sibling.next_sibling.text.strip().replace('Featuring', 'ft.').replace(' x ', ', ').replace(' & ', ', ').replace(' X ', ', ')
-            # print(artist)
-            songs.append({'number': number, 'name': name, 'artist': artist})
-        return songs
+        if self.service is not None:
+            return self.service.resolve_spotify_data(song)
+        with self.sp_api.priority(priority):
+            return core.resolve_spotify_data(self.sp_api, song, self.resolution_cache)
+    
+    def resolve_youtube(self, song):
+        """Get and store a song's music video url unless already stored, returning whether stored (see core.resolve_youtube_data())."""
+        if self.service is not None:
+            return self.service.resolve_youtube_data(song)
+        return core.resolve_youtube_data(song, self.resolution_cache)
     
     def create_ui(self):
         """
@@ -234,6 +409,9 @@ class TopSongsApp:
         app_btn = Button(top_frame, width=4, bd=3, text='App', font=SMALL_FONT, command=self.open_desktop_player)
         web_btn = Button(top_frame, width=4, bd=3, text='Web', font=SMALL_FONT, command=self.open_web_player)
         scroll_top_btn = Button(top_frame, bd=3, image=self.images['up_arrow'], command=self.scroll_to_top)
+        self.search_text = StringVar(self.root)
+        search_entry = Entry(top_frame, bd=3, font=SMALL_FONT, textvariable=self.search_text)
+        play_all_btn = Button(top_frame, bd=3, text='Play All', font=SMALL_FONT, command=self.play_all)
         bottom_frame = LabelFrame(self.root, relief=SUNKEN)
         hover_label = Label(bottom_frame, text='', font=SMALL_FONT, anchor=W, width=59)
         # Pack em' in.
@@ -243,6 +421,8 @@ class TopSongsApp:
         app_btn.grid(row=0, column=2, padx=(35, 0))
         web_btn.grid(row=0, column=3)
         scroll_top_btn.grid(row=0, column=4, padx=(31, 0))
+        search_entry.grid(row=1, column=0, columnspan=4, padx=15, pady=(0, 5), sticky=W + E)
+        play_all_btn.grid(row=1, column=4, padx=(31, 0), pady=(0, 5), sticky=W + E)
         bottom_frame.grid(row=2, column=0, padx=5, pady=5, sticky=W + E)
         hover_label.grid(row=0, column=0)
         # Add widgets to dict.
@@ -251,6 +431,8 @@ class TopSongsApp:
         self.widgets['subtitle_btn'] = subtitle_btn
         self.widgets['app_btn'] = app_btn
         self.widgets['web_btn'] = web_btn
+        self.widgets['search_entry'] = search_entry
+        self.widgets['play_all_btn'] = play_all_btn
         self.widgets['bottom_frame'] = bottom_frame
         self.widgets['hover_label'] = hover_label
         self.widgets['song_frames'] = []
@@ -260,38 +442,51 @@ class TopSongsApp:
         app_btn.message = 'Open Spotify Desktop Player'
         web_btn.message = 'Open Spotify Web Player'
         scroll_top_btn.message = 'Scroll to Top'
+        search_entry.message = 'Search songs and artists (Esc to clear)'
+        play_all_btn.message = 'Play every song shown, in order'
         # Bindings for labels.
         title_btn.bind('<ButtonRelease-1>', self.open_project_github)
         subtitle_btn.bind('<ButtonRelease-1>', self.open_developer_github)
+        # Check for a new chart when F5 is pressed.
+        self.root.bind('<F5>', self.refresh_chart)
+        # Filter songs as the user types.
+        self.search_text.trace_add('write', self.search_changed)
+        search_entry.bind('<Escape>', self.clear_search)
         # Bind hover event to buttons to display info.
         title_btn.bind('<Enter>', self.button_hover)
         subtitle_btn.bind('<Enter>', self.button_hover)
         app_btn.bind('<Enter>', self.button_hover)
         web_btn.bind('<Enter>', self.button_hover)
         scroll_top_btn.bind('<Enter>', self.button_hover)
+        search_entry.bind('<Enter>', self.button_hover)
+        play_all_btn.bind('<Enter>', self.button_hover)
         # Bind leave event to buttons to clear info panel.
         title_btn.bind('<Leave>', self.button_leave)
         subtitle_btn.bind('<Leave>', self.button_leave)
         app_btn.bind('<Leave>', self.button_leave)
         web_btn.bind('<Leave>', self.button_leave)
         scroll_top_btn.bind('<Leave>', self.button_leave)
+        search_entry.bind('<Leave>', self.button_leave)
+        play_all_btn.bind('<Leave>', self.button_leave)
         
         self.create_scrollable_frame()
         self.create_song_widgets()
     
     def create_scrollable_frame(self):
-        """Create Scrollable region to contain song widgets."""
+        """
+        Create Scrollable region to contain song widgets.
+        
+        The region is a canvas whose scrollregion is as tall as the whole chart,
+        but only holds enough song rows to fill its height (see create_song_widgets()).
+        Every change to the view goes through scroll_to() or scroll(), which move
+        the rows into view and show the right songs in them.
+        """
         middle_frame_outer = LabelFrame(self.root, bd=3, relief=SUNKEN)
-        # Behold, the process for creating a simple scrolling widget in Tkinter.
-        canvas = Canvas(middle_frame_outer, height=480)
-        scrollbar = ttk.Scrollbar(middle_frame_outer, orient=VERTICAL, command=canvas.yview)
+        canvas = Canvas(middle_frame_outer, height=SONG_LIST_HEIGHT)
+        scrollbar = ttk.Scrollbar(middle_frame_outer, orient=VERTICAL, command=self.scroll_to)
         canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.bind('<Configure>', lambda event: canvas.configure(scrollregion=canvas.bbox('all')))
-        middle_frame_inner = Frame(canvas)
-        middle_frame_inner.bind('<MouseWheel>', self.scroll)
+        canvas.bind('<MouseWheel>', self.scroll)
         scrollbar.bind('<MouseWheel>', self.scroll)
-        canvas.create_window((0, 0), window=middle_frame_inner, anchor=N + W)
-        canvas.yview("moveto", 0)
         
         middle_frame_outer.grid(row=1, column=0, padx=5, pady=5, sticky=W + E)
         canvas.pack(side=LEFT, fill=BOTH, expand=True)
@@ -300,67 +495,414 @@ class TopSongsApp:
         self.widgets['middle_frame_outer'] = middle_frame_outer
         self.widgets['canvas'] = canvas
         self.widgets['scrollbar'] = scrollbar
-        self.widgets['middle_frame_inner'] = middle_frame_inner
     
     def create_song_widgets(self):
-        """Create buttons and labels for each song."""
+        """
+        Create a pool of song rows, just enough to fill the scrollable region.
+        
+        Rather than creating widgets for every song, rows are recycled: as the
+        list scrolls, rows leaving the view are moved to the other end and shown
+        a different song (see update_song_rows()). The number of widgets stays
+        the same however long the chart is.
+        """
+        with instrument.span('ui.create_song_widgets'):
+            canvas = self.widgets['canvas']
+            song_frames = self.widgets['song_frames']
+            # Measure one row to work out how many are needed to fill the canvas.
+            song_frames.append(self.create_song_row())
+            canvas.update_idletasks()
+            self.row_height = song_frames[0].winfo_reqheight() + 2 * ROW_PADY
+            num_rows = math.ceil(SONG_LIST_HEIGHT / self.row_height) + VISIBLE_ROW_BUFFER
+            while len(song_frames) < num_rows:
+                song_frames.append(self.create_song_row())
+            # Scroll one row at a time.
+            canvas.configure(yscrollincrement=self.row_height)
+            self.filter_songs()
+    
+    def create_song_row(self):
+        """
+        Create an empty song row (frame and buttons) and add it to the scrollable region.
+        
+        :return: song frame, with its buttons stored in song_frame.buttons
+        :rtype: LabelFrame
+        """
         max_name_length = 20
         max_artist_length = 15
-        # Add song widgets to bottom frame.
-        middle_frame_inner = self.widgets['middle_frame_inner']
-        for x in range(len(self.songs)):
-            song = self.songs[x]
-            # Shorten song and artist name if they exceed the maximum values.
-            shortened_name = song['name'][:max_name_length + 1] + '...' if len(song['name']) > max_name_length else song['name']
-            shortened_artist = song['artist'][:max_name_length + 1] + '...' if len(song['artist']) > max_name_length else song['artist']
-            # Create inner frame and buttons for song name, artist, album cover, and music video.
-            song_frame = LabelFrame(middle_frame_inner, bd=3, relief=RAISED)
-            number_btn = Label(song_frame, width=3, text=str(song['number']) + '.', font=SMALL_FONT)
-            name_btn = Label(song_frame, width=max_name_length, text=shortened_name, padx=10, anchor=W, font=SMALL_FONT)
-            artist_btn = Label(song_frame, width=max_artist_length + 5, text=shortened_artist, padx=10, anchor=W, font=SMALL_FONT)
-            youtube_btn = Label(song_frame, image=self.images['youtube'])
-            # Add data (dict key) and index (song i) to buttons.
-            name_btn.data = 'song_uri'
-            artist_btn.data = 'artist_uri'
-            youtube_btn.data = 'yt_url'
-            number_btn.index = x
-            name_btn.index = x
-            artist_btn.index = x
-            youtube_btn.index = x
-            # Bind open functions to buttons.
-            number_btn.bind('<ButtonRelease-1>', self.number_btn_release)
-            name_btn.bind('<ButtonRelease-1>', self.song_btn_release)
-            artist_btn.bind('<ButtonRelease-1>', self.artist_btn_release)
-            youtube_btn.bind('<ButtonRelease-1>', self.yt_btn_release)
-            # Add buttons and frame to bottom frame.
-            song_frame.grid(row=x, column=0, padx=6, pady=3, sticky=W + E)
-            number_btn.grid(row=0, column=0)
-            name_btn.grid(row=0, column=1)
-            artist_btn.grid(row=0, column=2)
-            youtube_btn.grid(row=0, column=3, padx=10)
-            # Attach hover message to buttons.
-            number_btn.message = song['number']
-            name_btn.message = song['name']
-            artist_btn.message = song['artist']
-            youtube_btn.message = f'{song["name"]} Music Video'
-            # Bind hover event to buttons to display info.
-            number_btn.bind('<Enter>', self.button_hover)
-            name_btn.bind('<Enter>', self.button_hover)
-            artist_btn.bind('<Enter>', self.button_hover)
-            youtube_btn.bind('<Enter>', self.button_hover)
-            # Bind leave event to buttons to clear info panel.
-            number_btn.bind('<Leave>', self.button_leave)
-            name_btn.bind('<Leave>', self.button_leave)
-            artist_btn.bind('<Leave>', self.button_leave)
-            youtube_btn.bind('<Leave>', self.button_leave)
-            # Bind scroll event to buttons and container.
-            song_frame.bind('<MouseWheel>', self.scroll)
-            number_btn.bind('<MouseWheel>', self.scroll)
-            name_btn.bind('<MouseWheel>', self.scroll)
-            artist_btn.bind('<MouseWheel>', self.scroll)
-            youtube_btn.bind('<MouseWheel>', self.scroll)
-            
-            self.widgets['song_frames'].append(song_frame)
+        canvas = self.widgets['canvas']
+        # Create inner frame and buttons for song name, artist, album cover, and music video.
+        song_frame = LabelFrame(canvas, bd=3, relief=RAISED)
+        art_btn = Label(song_frame, image=self.images['no_art'])
+        number_btn = Label(song_frame, width=3, font=SMALL_FONT)
+        name_btn = Label(song_frame, width=max_name_length, padx=10, anchor=W, font=SMALL_FONT)
+        artist_btn = Label(song_frame, width=max_artist_length + 5, padx=10, anchor=W, font=SMALL_FONT)
+        youtube_btn = Label(song_frame, image=self.images['youtube'])
+        # Add data (Song attribute) to buttons, index (song i) is added when a song is shown.
+        name_btn.data = 'song_uri'
+        artist_btn.data = 'artist_uri'
+        youtube_btn.data = 'yt_url'
+        # Add service to look songs up on when hovered (see button_hover()).
+        art_btn.service = 'spotify'
+        name_btn.service = 'spotify'
+        artist_btn.service = 'spotify'
+        youtube_btn.service = 'youtube'
+        # Add action run when clicked, to show rows whose clicks are being handled (see show_pending_in_row()).
+        art_btn.action = 'play'
+        number_btn.action = 'chart'
+        name_btn.action = 'play'
+        artist_btn.action = 'artist'
+        youtube_btn.action = 'video'
+        # Bind open functions to buttons.
+        art_btn.bind('<ButtonRelease-1>', self.song_btn_release)
+        number_btn.bind('<ButtonRelease-1>', self.number_btn_release)
+        name_btn.bind('<ButtonRelease-1>', self.song_btn_release)
+        artist_btn.bind('<ButtonRelease-1>', self.artist_btn_release)
+        youtube_btn.bind('<ButtonRelease-1>', self.yt_btn_release)
+        # Add buttons to frame, and frame to canvas (hidden until it shows a song).
+        art_btn.grid(row=0, column=0, padx=(4, 0))
+        number_btn.grid(row=0, column=1)
+        name_btn.grid(row=0, column=2)
+        artist_btn.grid(row=0, column=3)
+        youtube_btn.grid(row=0, column=4, padx=10)
+        song_frame.item = canvas.create_window(ROW_PADX, 0, window=song_frame, anchor=N + W, state=HIDDEN)
+        song_frame.buttons = (art_btn, number_btn, name_btn, artist_btn, youtube_btn)
+        song_frame.song = None
+        # Bind hover event to buttons to display info.
+        art_btn.bind('<Enter>', self.button_hover)
+        number_btn.bind('<Enter>', self.button_hover)
+        name_btn.bind('<Enter>', self.button_hover)
+        artist_btn.bind('<Enter>', self.button_hover)
+        youtube_btn.bind('<Enter>', self.button_hover)
+        # Bind leave event to buttons to clear info panel.
+        art_btn.bind('<Leave>', self.button_leave)
+        number_btn.bind('<Leave>', self.button_leave)
+        name_btn.bind('<Leave>', self.button_leave)
+        artist_btn.bind('<Leave>', self.button_leave)
+        youtube_btn.bind('<Leave>', self.button_leave)
+        # Bind scroll event to buttons and container.
+        song_frame.bind('<MouseWheel>', self.scroll)
+        art_btn.bind('<MouseWheel>', self.scroll)
+        number_btn.bind('<MouseWheel>', self.scroll)
+        name_btn.bind('<MouseWheel>', self.scroll)
+        artist_btn.bind('<MouseWheel>', self.scroll)
+        youtube_btn.bind('<MouseWheel>', self.scroll)
+        return song_frame
+    
+    def show_song_in_row(self, song_frame, index):
+        """
+        Show a song in a song row.
+        
+        :param LabelFrame song_frame: song row to update
+        :param int index: index of song in self.songs
+        
+        Rows remember which song they show, so showing the same song again does nothing.
+        The song's album art is shown once loaded (see show_art_in_row()). Buttons whose
+        clicks are still being handled are greyed out (see show_pending_in_row()).
+        """
+        max_name_length = 20
+        song = self.songs[index]
+        shown = (index, song.number, song.name, song.artist)
+        if song_frame.song == shown:
+            return
+        song_frame.song = shown
+        art_btn, number_btn, name_btn, artist_btn, youtube_btn = song_frame.buttons
+        # Shorten song and artist name if they exceed the maximum values.
+        shortened_name = song.name[:max_name_length + 1] + '...' if len(song.name) > max_name_length else song.name
+        shortened_artist = song.artist[:max_name_length + 1] + '...' if len(song.artist) > max_name_length else song.artist
+        number_btn.config(text=str(song.number) + '.')
+        name_btn.config(text=shortened_name)
+        artist_btn.config(text=shortened_artist)
+        # Add index (song i) to buttons.
+        for button in song_frame.buttons:
+            button.index = index
+        # Attach hover message to buttons.
+        art_btn.message = f'Play {song.name}'
+        number_btn.message = song.number
+        name_btn.message = song.name
+        artist_btn.message = song.artist
+        youtube_btn.message = f'{song.name} Music Video'
+        self.show_art_in_row(song_frame, song)
+        self.show_pending_in_row(song_frame, song)
+    
+    def show_art_in_row(self, song_frame, song):
+        """
+        Show a song's album art in a song row, loading it in the background if needed.
+        
+        :param LabelFrame song_frame: song row to update
+        :param Song song: song shown in the row
+        
+        Until the art has loaded (or if the song has none), a blank image of the same
+        size is shown, so rows don't change size. Loaded art is shown by check_artwork_loaded().
+        """
+        art_btn = song_frame.buttons[0]
+        image = self.artwork.get_image(song)
+        if image is not None:
+            art_btn.config(image=image)
+            return
+        art_btn.config(image=self.images['no_art'])
+        self.artwork.request(song)
+        if self.artwork.has_pending() and not self._checking_artwork:
+            self._checking_artwork = True
+            self.root.after(CHART_POLL_INTERVAL, self.check_artwork_loaded)
+    
+    def show_pending_in_row(self, song_frame, song):
+        """
+        Grey out a song row's buttons whose clicks are still being handled.
+        
+        :param LabelFrame song_frame: song row to update
+        :param Song song: song shown in the row
+        """
+        key = song.get_key()
+        for button in song_frame.buttons:
+            pending = self.actions.is_pending((button.action, key))
+            button.config(state=DISABLED if pending else NORMAL, cursor='watch' if pending else '')
+    
+    def show_action_pending(self, key, _pending):
+        """
+        Show or clear a click being handled in the rows showing its song, if in view.
+        
+        :param tuple key: action name and song key (see self.actions)
+        :param bool _pending: whether the click is now being handled, rows ask self.actions instead
+        """
+        for song_frame in self.widgets['song_frames']:
+            if song_frame.song is not None and song_frame.song[2:] == key[1]:
+                self.show_pending_in_row(song_frame, self.songs[song_frame.song[0]])
+    
+    def show_action_error(self, error):
+        """
+        Report a click that couldn't be handled, because the song wasn't found or Spotify or YouTube couldn't be reached.
+        
+        :param Exception error: error raised while handling the click
+        
+        Other errors are reported like any error in a Tkinter callback.
+        """
+        if isinstance(error, IndexError):
+            # Searches that found nothing raise IndexError (see core.search_spotify_track()).
+            self.widgets['hover_label'].config(text="Couldn't find this song, try again later.")
+        elif isinstance(error, (SpotifyException, OSError)):
+            # Requests' exceptions are OSErrors.
+            self.widgets['hover_label'].config(text="Couldn't reach Spotify or YouTube, check your internet connection.")
+        else:
+            self.root.report_callback_exception(type(error), error, error.__traceback__)
+    
+    def check_artwork_loaded(self):
+        """
+        Show album art loaded in the background, and check again later while more is loading.
+        
+        PhotoImages can only be made on the Tkinter thread, so this turns the thumbnails
+        loaded since the last check into PhotoImages (see ArtworkLoader.poll()) and
+        shows them in the rows of their songs, if still in view.
+        """
+        loaded = self.artwork.poll()
+        if loaded:
+            for song_frame in self.widgets['song_frames']:
+                if song_frame.song is not None and song_frame.song[2:] in loaded:
+                    self.show_art_in_row(song_frame, self.songs[song_frame.song[0]])
+        if self.artwork.has_pending():
+            self.root.after(CHART_POLL_INTERVAL, self.check_artwork_loaded)
+        else:
+            self._checking_artwork = False
+    
+    def set_song_order(self, order):
+        """
+        Set which songs are shown in the scrollable region, and in which order.
+        
+        :param order: indexes of songs in self.songs
+        """
+        self.song_order = list(order)
+        canvas = self.widgets['canvas']
+        canvas.configure(scrollregion=(0, 0, 0, len(self.song_order) * self.row_height + ROW_PADY))
+        # Rows already showing the right song are left alone (see show_song_in_row()).
+        self.update_song_rows()
+    
+    def update_song_rows(self):
+        """
+        Move song rows into view and show the right songs in them.
+        
+        Row i always shows the song at a position p where p % number of rows == i,
+        so scrolling by one position only changes one row.
+        """
+        with instrument.span('ui.update_song_rows'):
+            canvas = self.widgets['canvas']
+            song_frames = self.widgets['song_frames']
+            first = max(int(canvas.canvasy(0) // self.row_height), 0)
+            # Only load album art for the songs in view, art for songs scrolled past is skipped.
+            in_view = self.song_order[first:first + len(song_frames)]
+            self.artwork.set_wanted(self.songs[index] for index in in_view)
+            for position in range(first, first + len(song_frames)):
+                song_frame = song_frames[position % len(song_frames)]
+                if position < len(self.song_order):
+                    self.show_song_in_row(song_frame, self.song_order[position])
+                    canvas.coords(song_frame.item, ROW_PADX, position * self.row_height + ROW_PADY)
+                    canvas.itemconfigure(song_frame.item, state=NORMAL)
+                else:
+                    canvas.itemconfigure(song_frame.item, state=HIDDEN)
+    
+    def index_songs(self):
+        """Rebuild the search index from self.songs, indexing each song by its name and artist."""
+        self.search_index.clear()
+        for index, song in enumerate(self.songs):
+            self.search_index.add(index, song.name, song.artist)
+    
+    def filter_songs(self):
+        """
+        Show only the songs matching the search box, scrolled to the top.
+        
+        Matching songs are found in self.search_index (see search.SearchIndex), and
+        shown in the existing song rows (see set_song_order()), so no widgets are created.
+        """
+        query = self.search_text.get()
+        with instrument.span('ui.filter_songs', query=query):
+            order = self.search_index.search(query)
+            self.widgets['canvas'].yview_moveto(0)
+            self.set_song_order(order)
+        if query.strip() and not order:
+            self.widgets['hover_label'].config(text=f'No songs match "{query.strip()}".')
+    
+    def search_changed(self, *_args):
+        """Filter songs when the text in the search box changes (_args are given by StringVar.trace_add())."""
+        self.filter_songs()
+    
+    def clear_search(self, _event):
+        """Empty the search box, showing every song again."""
+        self.search_text.set('')
+    
+    def refresh_chart(self, event=None):
+        """
+        Check for a new chart in the background, then show only the songs that changed.
+        
+        :param event: key press when asked for with F5, None when scheduled (default=None)
+        
+        Scheduled checks only contact Billboard once a new chart is due (see core.get_chart()),
+        checks asked for with F5 always do, with a conditional request that costs little if
+        the chart hasn't changed. Only one check runs at a time.
+        """
+        if self._loading_chart:
+            return
+        self._loading_chart = True
+        self._refresh_by_hand = event is not None
+        if self._refresh_by_hand:
+            self.widgets['hover_label'].config(text='Checking for a new chart...')
+        thread = threading.Thread(target=self.load_chart, args=(self.chart_cache, self._refresh_by_hand), daemon=True)
+        thread.start()
+        self.root.after(CHART_POLL_INTERVAL, self.check_chart_loaded)
+    
+    def schedule_refresh(self):
+        """Check for a new chart in self.refresh_interval seconds (see refresh_chart()), replacing any check already scheduled."""
+        if self._refresh_job is not None:
+            self.root.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        if self.refresh_interval is not None:
+            self._refresh_job = self.root.after(int(self.refresh_interval * 1000), self.refresh_chart)
+    
+    def load_chart(self, cache, revalidate=False):
+        """
+        Get top songs on a background thread and pass them to the Tkinter thread.
+        
+        :param ChartCache cache: cache to read from and store to
+        :param bool revalidate: ask Billboard even if the cached chart is this week's (default=False)
+        
+        Tkinter can only be used from the thread running mainloop, so songs are put
+        on self.chart_queue and picked up by check_chart_loaded(), together with the
+        error that stopped them loading, if any, so a failed check is always reported.
+        """
+        try:
+            self.chart_queue.put((self.fetch_chart(cache, revalidate), None))
+        except Exception as error:
+            self.chart_queue.put((None, error))
+    
+    def check_chart_loaded(self):
+        """Show the chart if it has been loaded, otherwise check again later."""
+        try:
+            songs, error = self.chart_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(CHART_POLL_INTERVAL, self.check_chart_loaded)
+            return
+        self._loading_chart = False
+        if error is not None:
+            hover_label = self.widgets['hover_label']
+            if not self.songs:
+                hover_label.config(text=f"Couldn't load chart ({error}).")
+            elif self._refresh_by_hand:
+                hover_label.config(text=f"Couldn't check for a new chart ({error}).")
+            self.schedule_refresh()
+            return
+        changed = self.show_songs(songs)
+        self.record_startup_time('chart')
+        if self._refresh_by_hand:
+            hover_label = self.widgets['hover_label']
+            if changed is None:
+                hover_label.config(text="Couldn't check for a new chart, check your internet connection.")
+            elif changed:
+                hover_label.config(text=f'Chart updated, {changed} positions changed.')
+            else:
+                hover_label.config(text='The chart is up to date.')
+        if self.prefetch and changed:
+            self.prefetch_song_data()
+        self.schedule_refresh()
+    
+    def show_songs(self, songs):
+        """
+        Show a new copy of the chart, changing only the songs that differ from those shown.
+        
+        :param list[Song] songs: new songs
+        :return: number of chart positions that changed, None if no songs were loaded
+        :rtype: int
+        
+        Songs still on the chart are carried over with the links already found for them
+        (see core.merge_chart()). Only changed positions are indexed for search again, and
+        only rows showing them are redrawn (see show_song_in_row()), so the cost depends on
+        how much of the chart changed. The list keeps its scroll position and search.
+        """
+        hover_label = self.widgets['hover_label']
+        if not songs:
+            if not self.songs:
+                hover_label.config(text="Couldn't load chart, check your internet connection.")
+            return None
+        if not self.songs:
+            # Clear "Loading chart...".
+            hover_label.config(text='')
+        songs, changed = core.merge_chart(self.songs, songs)
+        if not changed:
+            return 0
+        with instrument.span('ui.show_songs', songs=len(songs), changed=len(changed)):
+            self.songs = songs
+            for index in changed:
+                self.search_index.remove(index)
+                if index < len(songs):
+                    self.search_index.add(index, songs[index].name, songs[index].artist)
+            order = self.search_index.search(self.search_text.get())
+            if order != self.song_order:
+                self.set_song_order(order)
+            else:
+                self.update_song_rows()
+        return len(changed)
+    
+    def record_startup_time(self, stage):
+        """Record the time a startup stage was reached (only the first time), as a startup.<stage> span when tracing."""
+        if stage in self.startup_times:
+            return
+        reached = self.startup_times[stage] = time.perf_counter()
+        if instrument.recorder.enabled:
+            instrument.recorder.add_span(f'startup.{stage}', self.startup_times['start'], reached)
+    
+    def get_startup_report(self):
+        """
+        Return how long each startup stage took to reach.
+        
+        :return: one line per stage reached, in milliseconds since TopSongsApp was created
+        :rtype: str
+        
+        Stages:
+        window: the window appeared
+        snapshot: the cached chart was shown (only when loading in the background)
+        chart: the downloaded (or revalidated) chart was shown
+        """
+        start = self.startup_times['start']
+        lines = []
+        for stage, reached in sorted(self.startup_times.items(), key=lambda item: item[1]):
+            if stage != 'start':
+                lines.append(f'{stage}: {(reached - start) * 1000:.0f} ms')
+        return '\n'.join(lines)
     
     @staticmethod
     def open_project_github(event):
@@ -392,17 +934,21 @@ class TopSongsApp:
     
     def scroll_to_top(self):
         """Scroll to top of scrollable songs frame."""
+        self.scroll_to('moveto', 0)
+    
+    def scroll_to(self, *args):
+        """Scroll songs as instructed by the scrollbar (see Canvas.yview())."""
         canvas = self.widgets['canvas']
-        canvas.yview_scroll(-len(self.songs), 'units')
+        canvas.yview(*args)
+        self.update_song_rows()
     
     def scroll(self, event):
         """Scroll through songs."""
-        canvas = self.widgets['canvas']
         # Event.delta will be either 120 or -120.
         # By finding the sign of event.delta, the
         # program can scroll the opposite direction.
         sign = event.delta // abs(event.delta)
-        canvas.yview_scroll(-sign * SCROLL_SPEED, 'units')
+        self.scroll_to('scroll', -sign * SCROLL_SPEED, 'units')
     
     def number_btn_release(self, event):
         """Open Billboard song chart upon releasing song number button."""
@@ -442,16 +988,27 @@ class TopSongsApp:
             self.open_music_video(button)
     
     def button_hover(self, event):
-        """Upon hovering over a widget, update status label with widget's message."""
+        """
+        Upon hovering over a widget, update status label with widget's message.
+        
+        Hovering over a song button also starts looking the song up on the button's
+        service, in case it's clicked (see self.hover_prefetcher).
+        """
         button = event.widget
         hover_label = self.widgets['hover_label']
         hover_label.config(text=button.message)
+        service = getattr(button, 'service', None)
+        if service is not None and hasattr(button, 'index'):
+            song = self.songs[button.index]
+            if getattr(song, PREFETCH_FIELDS[service]) is None:
+                self.hover_prefetcher.hover(song, service)
     
     def button_leave(self, event):
-        """Upon leaving a widget, clear status label."""
+        """Upon leaving a widget, clear status label and cancel any lookup not yet started."""
         assert event
         hover_label = self.widgets['hover_label']
         hover_label.config(text='')
+        self.hover_prefetcher.leave()
     
     def open_song_chart(self, button):
         """
@@ -460,30 +1017,70 @@ class TopSongsApp:
         :param button: button that was pressed.
         
         Song buttons store their song's index, which is used to find the correct song.
+        The browser is opened in the background (see self.actions).
         """
         song = self.songs[button.index]
-        song_number = song['number']
-        webbrowser.open(f'https://www.billboard.com/charts/hot-100?rank={song_number}')
+        song_number = song.number
+        self.actions.submit(
+            ('chart', song.get_key()), webbrowser.open, f'{core.HOT_100_URL}?rank={song_number}',
+            failed=self.show_action_error
+        )
     
     def get_song_data(self, song):
         """
         Get a song's track and artist URIs from Spotify's API via spotipy.
         
-        :param dict song: song data dictionary
+        :param Song song: song to search for
         :returns: song URI, artist URI
         :rtype: str, str
+        :except IndexError: if Spotify found no tracks, now or recently (see outbound.py)
+        
+        See core.search_spotify(), URIs found in previous sessions are read
+        from self.resolution_cache, without contacting Spotify. If a chart service
+        is used, it is asked instead.
+        """
+        if self.service is not None:
+            track = self.service.search_spotify_track(song.name, song.artist)
+            return track['uri'], track['artist_uri']
+        return core.search_spotify(self.sp_api, song.name, song.artist, self.resolution_cache)
+    
+    def prefetch_song_data(self, max_workers=core.RESOLVE_WORKERS):
+        """
+        Start getting every song's track and artist URIs and music video in the background.
+        
+        :param int max_workers: maximum number of concurrent Spotify searches (default=core.RESOLVE_WORKERS)
         
-        NOTE: Artist URI returned is the first artist listed (TopSongs can
-        ony open one artist at this time).
+        URIs and music video urls are stored on the songs, where play_song(), open_artist()
+        and open_music_video() already look for them, so clicks on prefetched songs don't
+        wait for a search. Songs are searched in chart order, so the top songs are ready
+        first. When done, results are stored in self.prefetch_stats and self.video_prefetch_stats.
+        
+        Spotify and YouTube are searched at the same time, as Spotify's searches are paced
+        (see scheduler.py). Music videos are only prefetched when YouTube is searched directly,
+        not through a chart service.
         """
-        song_name = song['name']
-        artist = song['artist']
-        real_artist = self.get_real_artist(artist)
-        # Send request to Spotify's API and sift through dict to find desired data.
-        result = self.sp_api.search(q=f'{song_name} {real_artist}', type='track', limit=1)
-        uri = result['tracks']['items'][0]['uri']
-        artist_uri = result['tracks']['items'][0]['artists'][0]['uri']  # First listed artist
-        return uri, artist_uri
+        thread = threading.Thread(target=self._prefetch_song_data, args=(max_workers,), daemon=True)
+        thread.start()
+        if self.service is None:
+            thread = threading.Thread(target=self._prefetch_videos, daemon=True)
+            thread.start()
+    
+    def _prefetch_song_data(self, max_workers):
+        """Get every song's URIs on a thread pool, recording throughput in self.prefetch_stats."""
+        # self.sp_api waits out "429 Too Many Requests" responses, honouring Retry-After, and
+        # lets clicks and songs in view go first (see scheduler.SpotifyScheduler).
+        self.prefetch_stats = core.resolve_songs(
+            self.songs,
+            self.resolve_spotify,
+            max_workers,
+            self.stop_prefetch
+        )
+        self.resolution_cache.save()
+    
+    def _prefetch_videos(self):
+        """Get every song's music video (see core.resolve_youtube_songs()), recording throughput in self.video_prefetch_stats."""
+        self.video_prefetch_stats = core.resolve_youtube_songs(self.songs, self.resolution_cache, stop=self.stop_prefetch)
+        self.resolution_cache.save()
     
     def spotify_launchers_are_running(self):
         """
@@ -491,15 +1088,14 @@ class TopSongsApp:
         
         :return: tuple (bool, bool) for app, web player running
         
-        This function uses the socket module to get your PC's name.
+        The desktop player is named after your PC (see self.pc_name). Devices
+        are read from self.device_cache, so this usually doesn't contact Spotify.
         """
         app = False
         web = False
-        pc_name = socket.gethostname()
-        devices = self.sp_api.devices()['devices']
-        print(devices)
+        devices = self.device_cache.get()
         for device in devices:
-            if device['name'] == pc_name:
+            if device['name'] == self.pc_name:
                 app = True
             if 'Web Player' in device['name']:
                 web = True
@@ -511,19 +1107,27 @@ class TopSongsApp:
         
         :param button: button that was pressed
         
-        If a artist's URI is already stored, open it in the browser,
-        desktop app, or both. If not, get and store song's data, then
-        open artist's URI.
+        The artist is found and opened in the background (see self.actions), clicks
+        on the same artist before it has opened are ignored.
         """
         # Button stores data key and song index.
-        i = button.index
-        song = self.songs[i]
+        song = self.songs[button.index]
+        self.actions.submit(('artist', song.get_key()), self._open_artist, song, failed=self.show_action_error)
     
-        if 'artist_uri' in song:
-            uri = song['artist_uri']
+    def _open_artist(self, song):
+        """
+        Open a song's artist in the browser, desktop app, or both, on an action thread.
+        
+        If the artist's URI is already stored, open it. If not, get and
+        store the song's data, then open the artist's URI.
+        """
+        self.hover_prefetcher.claim(song, 'spotify', song.artist_uri is not None)
+        
+        if song.artist_uri is not None:
+            uri = song.artist_uri
         else:
-            song['uri'], song['artist_uri'] = self.get_song_data(song)
-            uri = self.songs[i]['artist_uri']
+            song.uri, song.artist_uri = self.get_song_data(song)
+            uri = song.artist_uri
         
         app, web = self.spotify_launchers_are_running()
         
@@ -532,72 +1136,182 @@ class TopSongsApp:
         if web:
             uri_type, uri_id = uri.split(':')[1], uri.split(':')[2]
             webbrowser.open(f'https://open.spotify.com/{uri_type}/{uri_id}')
-        
+    
     def play_song(self, button):
         """
         Play a song in the currently open Spotify player.
         
         :param button: button that was pressed
         
-        If a song's URI is already stored, play it. get and store song's
-        data, then play song's URI.
+        The song is found and played in the background (see self.actions), and
+        play_song_done() is called with the result. Clicks on the same song before
+        it has started playing are ignored. If another song is clicked before this
+        one starts, only the song clicked last is played.
         """
         # Button stores data key and song index.
-        i = button.index
-        song = self.songs[i]
+        song = self.songs[button.index]
+        self._play_clicks += 1
+        self.actions.submit(
+            ('play', song.get_key()), self._play_song, song, self._play_clicks,
+            done=self.play_song_done, failed=self.show_action_error
+        )
+    
+    def _play_song(self, song, click):
+        """
+        Play a song on an action thread.
+        
+        :param Song song: song to play
+        :param int click: number of the click that asked for it (see self._play_clicks)
+        :return: True if played, False if no player is running, None if a later click replaced it
+        :rtype: bool
+        
+        If the song's URI is already stored, play it. If not, get and store
+        the song's data, then play the song's URI.
+        
+        Playback starts on the first device in self.device_cache. If that fails
+        (e.g. the player has since been closed), devices are refreshed and
+        playback is tried once more.
+        """
+        self.hover_prefetcher.claim(song, 'spotify', song.uri is not None)
         
-        if 'uri' in song:
-            uri = song['uri']
+        if song.uri is not None:
+            uri = song.uri
         else:
-            song['uri'], song['artist_uri'] = self.get_song_data(song)
-            uri = self.songs[i]['uri']
+            song.uri, song.artist_uri = self.get_song_data(song)
+            uri = song.uri
         
-        devices = self.sp_api.devices()['devices']
+        devices = self.device_cache.get()
+        if click != self._play_clicks:
+            # Another song was clicked while this one was being found, play that one instead.
+            return None
         if len(devices) > 0:
             device_id = devices[0]['id']  # Play on first device
-            self.sp_api.start_playback(uris=[uri], device_id=device_id)
-        else:
+            try:
+                with instrument.span('spotify.start_playback'):
+                    self.sp_api.start_playback(uris=[uri], device_id=device_id)
+                return True
+            except SpotifyException:
+                # Player may have closed since devices were cached, check again and retry below.
+                self.device_cache.invalidate()
+                devices = self.device_cache.get()
+        if len(devices) > 0:
+            self.sp_api.start_playback(uris=[uri], device_id=devices[0]['id'])
+            return True
+        return False
+    
+    def play_song_done(self, played):
+        """Tell the user if a song couldn't be played because no player is running (played is False)."""
+        if played is False:
             messagebox.showinfo('No Player', 'No Spotify player running! Use the App/Web buttons to launch Spotify. You may have to wait a second before hitting play.')
     
+    def play_all(self):
+        """
+        Play every song shown (the whole chart, or the songs matching the search box), in order.
+        
+        Songs are resolved and handed to Spotify in a few batched requests on a
+        background thread (see core.play_songs()), and the result is shown by
+        check_play_all_done(). Playback starts on the first device in self.device_cache.
+        """
+        songs = [self.songs[index] for index in self.song_order]
+        if not songs:
+            return
+        self.widgets['play_all_btn'].config(state=DISABLED)
+        self.widgets['hover_label'].config(text=f'Sending {len(songs)} songs to Spotify...')
+        thread = threading.Thread(target=self._play_all, args=(songs,), daemon=True)
+        thread.start()
+        self.root.after(CHART_POLL_INTERVAL, self.check_play_all_done)
+    
+    def _play_all(self, songs):
+        """Play songs with core.play_songs(), putting the stats (None if no player is running, or the error) on self.play_all_queue."""
+        self.sp_api.set_priority(INTERACTIVE)
+        try:
+            devices = self.device_cache.get()
+            if not devices:
+                self.play_all_queue.put(None)
+                return
+            if self.service is not None:
+                # Look songs up through the service, so play_songs() only has to hand them to Spotify.
+                core.resolve_songs([song for song in songs if song.uri is None], self.resolve_spotify)
+            self.playlist_id, stats = core.play_songs(
+                self.sp_api, songs, devices[0]['id'], self.resolution_cache, self.playlist_id
+            )
+        except (SpotifyException, OSError) as error:
+            # Requests' exceptions are OSErrors.
+            self.play_all_queue.put(error)
+            return
+        self.play_all_queue.put(stats)
+    
+    def check_play_all_done(self):
+        """Show the result of play_all() once it has finished, otherwise check again later."""
+        try:
+            result = self.play_all_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(CHART_POLL_INTERVAL, self.check_play_all_done)
+            return
+        self.widgets['play_all_btn'].config(state=NORMAL)
+        hover_label = self.widgets['hover_label']
+        if result is None:
+            hover_label.config(text='')
+            messagebox.showinfo('No Player', 'No Spotify player running! Use the App/Web buttons to launch Spotify. You may have to wait a second before hitting play.')
+        elif isinstance(result, Exception):
+            hover_label.config(text="Couldn't play songs, check your internet connection.")
+        elif result['failed']:
+            hover_label.config(text=f'Playing {result["tracks"]} songs ({result["failed"]} not found on Spotify).')
+        else:
+            hover_label.config(text=f'Playing {result["tracks"]} songs.')
+    
     def open_music_video(self, button):
         """
         Open a song's music video on YouTube in the default browser.
         
         :param button: button that was pressed
         
-        If a song's music video url is already stored, open it. If not, search
-        for the song on www.youtube.com, get and store the first video result,
-        then open the music video.
+        The video is found and opened in the background (see self.actions), clicks
+        on the same video before it has opened are ignored.
         """
         # Button stores data key and song index.
-        key = button.data
-        i = button.index
-        song = self.songs[i]
+        song = self.songs[button.index]
+        self.actions.submit(('video', song.get_key()), self._open_music_video, song, button.data, failed=self.show_action_error)
+    
+    def _open_music_video(self, song, key):
+        """
+        Open a song's music video on an action thread.
+        
+        If a song's music video url is already stored (in the song or in
+        self.resolution_cache), open it. If not, search for the song on
+        www.youtube.com, get and store the first video result, then open
+        the music video.
+        """
+        self.hover_prefetcher.claim(song, 'youtube', getattr(song, key) is not None)
         
-        if key in song:
-            url = song[key]
+        if getattr(song, key) is not None:
+            url = getattr(song, key)
         else:
-            song_name = song['name']
-            artist = song['artist']
-            real_artist = self.get_real_artist(artist)
-            # Search for song using youtube_search and sift through dict to find desired data.
-            results = YoutubeSearch(f'{song_name} {real_artist}', max_results=1).to_dict()
-            video_id = results[0]['id']
-            url = f'https://www.youtube.com/watch?v={video_id}'
-            song['yt_url'] = url
+            if self.service is not None:
+                url = self.service.search_youtube(song.name, song.artist)
+            else:
+                url = core.search_youtube(song.name, song.artist, self.resolution_cache)
+            song.yt_url = url
         
         webbrowser.open(url)
     
     @staticmethod
     def get_real_artist(artist):
         """Return an artist string with featured artists removed."""
-        if ' ft.' in artist:
-            return artist[:artist.find(' ft.')]
-        return artist
+        return core.get_real_artist(artist)
     
     def run(self):
         """Start TopSongs app."""
         self.root.mainloop()
+        self.stop_prefetch.set()
+        self.artwork.stop()
+        self.actions.stop()
+        self.hover_prefetcher.stop()
+        self.device_cache.stop()
+        self.resolution_cache.save()
+        if self.trace:
+            print(self.get_startup_report(), file=sys.stderr)
+            instrument.recorder.export_trace(instrument.DEFAULT_TRACE_FILE if self.trace is True else self.trace)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+"""
+Module models
+
+Compact data types for chart entries.
+
+Charts repeat the same titles and artists week after week, and across charts. Songs store
+their name and artist through a shared StringTable, so each distinct string is held in
+memory once no matter how many charts or weeks refer to it.
+
+Classes:
+    StringTable
+    Song
+
+Variables:
+    strings : StringTable
+        string table shared by every Song
+"""
+
+
+class StringTable:
+    """
+    A class to intern strings, so that equal strings share one object.
+    
+    Unlike sys.intern(), the table can be inspected and cleared.
+    
+    Attributes:
+        table : dict[str: str]
+            every interned string, mapped to itself
+    
+    Methods:
+        intern(self, value):
+            Return the shared copy of a string, adding it to the table if it's new.
+        clear(self):
+            Forget every interned string.
+    """
+    
+    def __init__(self):
+        """Create attributes for StringTable object."""
+        self.table = {}
+    
+    def __len__(self):
+        """Return the number of distinct strings interned."""
+        return len(self.table)
+    
+    def intern(self, value):
+        """Return the shared copy of a string, adding it to the table if it's new."""
+        return self.table.setdefault(value, value)
+    
+    def clear(self):
+        """Forget every interned string (strings still in use are not freed)."""
+        self.table.clear()
+
+
+strings = StringTable()
+
+
+class Song:
+    """
+    A class to store a chart entry and what has been found about it.
+    
+    Songs use __slots__, so they have no per-object __dict__, and their name and
+    artist are interned in the shared string table.
+    
+    Attributes:
+        number : int
+            position on the chart
+        name : str
+            song name (album name on album charts)
+        artist : str
+            song artist, including featured artists
+        uri : str
+            Spotify track URI, None until found
+        artist_uri : str
+            Spotify URI of the first listed artist, None until found
+        yt_url : str
+            url of the song's music video on YouTube, None until found
+        art_url : str
+            url of the song's album art, None until found
+    
+    Methods:
+        from_dict(data):
+            Create a Song from a dictionary (see to_dict()).
+        to_dict(self):
+            Return the song as a dictionary, leaving out fields that haven't been found.
+        get_key(self):
+            Return (name, artist), which identifies a song across charts and weeks.
+    """
+    
+    __slots__ = ('number', 'name', 'artist', 'uri', 'artist_uri', 'yt_url', 'art_url')
+    
+    def __init__(self, number, name, artist, uri=None, artist_uri=None, yt_url=None, art_url=None):
+        """
+        Create attributes for Song object.
+        
+        :param int number: position on the chart
+        :param str name: song name
+        :param str artist: song artist
+        :param str uri: Spotify track URI (default=None)
+        :param str artist_uri: Spotify artist URI (default=None)
+        :param str yt_url: YouTube music video url (default=None)
+        :param str art_url: album art url (default=None)
+        """
+        self.number = number
+        self.name = strings.intern(name)
+        self.artist = strings.intern(artist)
+        self.uri = uri
+        self.artist_uri = artist_uri
+        self.yt_url = yt_url
+        self.art_url = art_url
+    
+    def __repr__(self):
+        """Return a string representation of the song."""
+        return f'Song({self.number!r}, {self.name!r}, {self.artist!r})'
+    
+    def __eq__(self, other):
+        """Check whether two songs hold the same chart entry and results."""
+        if not isinstance(other, Song):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Create a Song from a dictionary (see to_dict())."""
+        return cls(**data)
+    
+    def to_dict(self):
+        """Return the song as a dictionary, leaving out fields that haven't been found."""
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+    
+    def get_key(self):
+        """Return (name, artist), which identifies a song across charts and weeks."""
+        return self.name, self.artist
@@ -0,0 +1,239 @@
+"""
+Module outbound
+
+Rules shared by every request Top Songs sends to Billboard, Spotify, YouTube and the chart
+service: how long to wait for an answer, when to try again, and how to avoid sending the
+same request twice.
+
+Calls made through call() get:
+    single-flight: while a lookup is running, identical lookups wait for its answer
+        instead of sending their own request
+    retries: requests that time out, can't connect, or get a 429 or 5xx answer are sent
+        again, up to MAX_ATTEMPTS times, after a random (jittered) backoff
+    negative caching: lookups that found nothing (IndexError, as in core) fail straight
+        away for NEGATIVE_TTL seconds, without asking again
+
+Functions here use the shared Gateway, gateway. Like core, requests is only imported
+when first needed.
+
+Classes:
+    Gateway
+
+Functions:
+    call(service, key, function, *args, **kwargs)
+    retry(service, function, *args, **kwargs)
+    get_timeout(service)
+
+Variables:
+    gateway : Gateway
+        gateway used by all of Top Songs
+"""
+
+from collections import OrderedDict
+from top_songs import instrument
+import threading
+import random
+import time
+
+# Seconds to wait to connect, and then for each part of the answer, by service.
+TIMEOUTS = {
+    'billboard': (5, 15),
+    'spotify': (5, 10),
+    'youtube': (5, 10),
+    'service': (5, 30),
+}
+# Times a request is sent before giving up, including the first.
+MAX_ATTEMPTS = 3
+# Seconds of backoff before the first retry, doubled for each retry after. Each wait is
+# a random time up to this, so clients that failed together don't retry together.
+RETRY_BACKOFF = 0.25
+# Seconds a lookup that found nothing keeps failing without asking again.
+NEGATIVE_TTL = 60 * 60
+# Lookups that found nothing remembered at once, oldest are forgotten first.
+NEGATIVE_MAX_ENTRIES = 10_000
+
+
+class _Flight:
+    """A lookup in progress, whose answer (or error) is shared with identical lookups made meanwhile."""
+    
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        """Create attributes for _Flight object."""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Gateway:
+    """
+    A class to send lookups at most once at a time, retry them when they fail, and remember those that found nothing.
+    
+    Lookups are identified by a service (a key of TIMEOUTS) and a key, e.g. the song
+    searched for. Outcomes are counted in self.stats and with instrument.count() as
+    "outbound.<service>.<outcome>".
+    
+    Attributes:
+        timeouts : dict[str: tuple[float, float]]
+            service mapped to seconds to wait to connect and to read
+        max_attempts : int
+            times a request is sent before giving up
+        backoff : float
+            most seconds waited before the first retry, doubled for each retry after
+        negative_ttl : float
+            seconds a lookup that found nothing keeps failing without asking again
+        stats : dict[str: dict[str: int]]
+            service mapped to outcome ("sent", "coalesced", "retried", "failed", "not_found",
+            "negative_hit") mapped to number of lookups
+    
+    Methods:
+        call(self, service, key, function, *args, **kwargs):
+            Look something up, sharing the answer of an identical lookup already running.
+        retry(self, service, function, *args, **kwargs):
+            Call a function that sends a request, sending it again if it fails for a passing reason.
+        get_timeout(self, service):
+            Return the timeout of a service's requests, as passed to requests.
+        get_stats(self):
+            Return outcome counts by service.
+    """
+    
+    def __init__(self, timeouts=None, max_attempts=MAX_ATTEMPTS, backoff=RETRY_BACKOFF, negative_ttl=NEGATIVE_TTL):
+        """
+        Create attributes for Gateway object.
+        
+        :param dict timeouts: service mapped to (connect, read) seconds (default=TIMEOUTS)
+        :param int max_attempts: times a request is sent before giving up (default=MAX_ATTEMPTS)
+        :param float backoff: most seconds waited before the first retry (default=RETRY_BACKOFF)
+        :param float negative_ttl: seconds lookups that found nothing fail without asking (default=NEGATIVE_TTL)
+        """
+        self.timeouts = dict(TIMEOUTS if timeouts is None else timeouts)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.negative_ttl = negative_ttl
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._flights = {}
+        # (service, key) mapped to time the lookup may be sent again, oldest first.
+        self._not_found = OrderedDict()
+    
+    def call(self, service, key, function, *args, **kwargs):
+        """
+        Look something up, sharing the answer of an identical lookup already running.
+        
+        :param str service: service asked, a key of self.timeouts
+        :param key: hashable description of the lookup, e.g. (name, artist)
+        :param function: function sending the request, called with args and kwargs
+        :return: function's return value
+        :except IndexError: if the lookup found nothing, now or in the last negative_ttl seconds
+        
+        Errors are shared with identical lookups waiting for the answer, as are results,
+        so results must not be changed by callers.
+        """
+        flight_key = (service, key)
+        with self._lock:
+            expires = self._not_found.get(flight_key)
+            if expires is not None and time.monotonic() >= expires:
+                del self._not_found[flight_key]
+                expires = None
+            flight = self._flights.get(flight_key)
+            leader = expires is None and flight is None
+            if leader:
+                flight = self._flights[flight_key] = _Flight()
+        if expires is not None:
+            self._record(service, 'negative_hit')
+            raise IndexError(f'nothing found on {service} for {key}')
+        if not leader:
+            self._record(service, 'coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self.retry(service, function, *args, **kwargs)
+        except IndexError as error:
+            self._record(service, 'not_found')
+            with self._lock:
+                self._not_found[flight_key] = time.monotonic() + self.negative_ttl
+                while len(self._not_found) > NEGATIVE_MAX_ENTRIES:
+                    self._not_found.popitem(last=False)
+            flight.error = error
+            raise
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[flight_key]
+            flight.done.set()
+        return flight.result
+    
+    def retry(self, service, function, *args, **kwargs):
+        """
+        Call a function that sends a request, sending it again if it fails for a passing reason.
+        
+        :param str service: service asked, a key of self.timeouts
+        :param function: function sending the request, called with args and kwargs
+        :return: function's return value
+        
+        Timeouts, connection errors and 429 or 5xx answers (requests.HTTPError, see
+        Response.raise_for_status()) are retried, up to self.max_attempts requests in all.
+        Other errors, and the last attempt's error, are raised.
+        """
+        import requests
+        
+        for attempt in range(self.max_attempts):
+            self._record(service, 'sent')
+            try:
+                return function(*args, **kwargs)
+            except requests.RequestException as error:
+                if attempt + 1 == self.max_attempts or not self._is_passing(error):
+                    self._record(service, 'failed')
+                    raise
+            self._record(service, 'retried')
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+    
+    def get_timeout(self, service):
+        """Return the (connect, read) timeout in seconds of a service's requests, as passed to requests."""
+        return self.timeouts[service]
+    
+    def get_stats(self):
+        """Return outcome counts by service (see self.stats), and the number of lookups remembered as finding nothing."""
+        with self._lock:
+            stats = {service: dict(outcomes) for service, outcomes in self.stats.items()}
+            stats['not_found_entries'] = len(self._not_found)
+        return stats
+    
+    @staticmethod
+    def _is_passing(error):
+        """Check whether a requests error is worth retrying: a timeout, a connection error, or a 429 or 5xx answer."""
+        import requests
+        
+        if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+            return True
+        response = getattr(error, 'response', None)
+        return response is not None and (response.status_code == 429 or response.status_code >= 500)
+    
+    def _record(self, service, outcome):
+        """Count a lookup outcome in self.stats and with instrument."""
+        with self._lock:
+            outcomes = self.stats.setdefault(service, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        instrument.count(f'outbound.{service}.{outcome}')
+
+
+gateway = Gateway()
+
+
+def call(service, key, function, *args, **kwargs):
+    """Look something up through the shared gateway (see Gateway.call())."""
+    return gateway.call(service, key, function, *args, **kwargs)
+
+
+def retry(service, function, *args, **kwargs):
+    """Send a request through the shared gateway, retrying passing failures (see Gateway.retry())."""
+    return gateway.retry(service, function, *args, **kwargs)
+
+
+def get_timeout(service):
+    """Return the timeout of a service's requests (see Gateway.get_timeout())."""
+    return gateway.get_timeout(service)
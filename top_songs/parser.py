@@ -0,0 +1,204 @@
+"""
+Module parser
+
+Extracts songs from Billboard chart pages.
+
+Two parsers are provided. parse_chart_html() is the reference implementation, it builds
+a complete BeautifulSoup tree of the page before searching it. iter_chart_rows() parses the
+page incrementally as it is downloaded and stops as soon as enough songs have been found,
+using lxml when it is installed and Python's built-in HTMLParser otherwise.
+
+Functions:
+    clean_artist(artist)
+    parse_chart_html(html, n)
+    iter_chart_rows(chunks, n, encoding)
+    parse_chart_stream(chunks, n, encoding)
+"""
+
+from top_songs.models import Song
+from html.parser import HTMLParser
+import codecs
+
+ROW_CLASS = 'o-chart-results-list-row-container'
+TITLE_CLASS = 'c-title'
+# Elements that never have an end tag, and so never contain anything.
+VOID_ELEMENTS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+})
+
+
+def clean_artist(artist):
+    """Return an artist string in TopSongs' format ("Featuring" becomes "ft.", collaborators are comma separated)."""
+    return artist.strip().replace('Featuring', 'ft.').replace(' x ', ', ').replace(' & ', ', ').replace(' X ', ', ')
+
+
+def parse_chart_html(html, n):
+    """
+    Parse a complete chart page with beautifulsoup4 and return a number of top songs.
+    
+    :param str html: chart page HTML
+    :param int n: number of songs to return
+    :return: top songs
+    :rtype: list[Song]
+    
+    This is the reference parser, iter_chart_rows() must return the same songs.
+    """
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    songs = []
+    for number, song in enumerate(soup.find_all('div', class_=ROW_CLASS, limit=n), 1):
+        name_element = song.find('h3', class_=TITLE_CLASS)
+        name = name_element.text.strip()
+        artist = clean_artist(name_element.next_sibling.next_sibling.text)
+        songs.append(Song(number, name, artist))
+    return songs
+
+
+def iter_chart_rows(chunks, n, encoding=None):
+    """
+    Parse a chart page as it is downloaded and yield a number of top songs.
+    
+    :param chunks: iterable of bytes making up the page (e.g. response.iter_content())
+    :param int n: number of songs to yield
+    :param str encoding: encoding of the page (default=utf-8)
+    :return: generator of songs, in the same format as parse_chart_html()
+    
+    Each song is yielded as soon as its row has been read. Once n songs have been
+    yielded no more chunks are consumed, so the rest of the page is never downloaded.
+    """
+    if n <= 0:
+        return
+    etree = _get_etree()
+    if etree is not None:
+        rows = _iter_rows_lxml(etree, chunks, encoding)
+    else:
+        rows = _iter_rows_html_parser(chunks, encoding)
+    for number, (name, artist) in enumerate(rows, 1):
+        yield Song(number, name.strip(), clean_artist(artist))
+        if number >= n:
+            return
+
+
+def parse_chart_stream(chunks, n, encoding=None):
+    """
+    Parse a chart page as it is downloaded and return a number of top songs.
+    
+    :param chunks: iterable of bytes making up the page
+    :param int n: number of songs to return
+    :param str encoding: encoding of the page (default=utf-8)
+    :return: top songs
+    :rtype: list[Song]
+    """
+    return list(iter_chart_rows(chunks, n, encoding))
+
+
+def _get_etree():
+    """Return lxml.etree, or None if lxml isn't installed."""
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+    return etree
+
+
+def _iter_rows_lxml(etree, chunks, encoding):
+    """Yield (name, artist) for each chart row using lxml's incremental HTML parser."""
+    parser = etree.HTMLPullParser(events=('end',), encoding=encoding)
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            if element.tag != 'div' or ROW_CLASS not in element.get('class', '').split():
+                continue
+            for title in element.iter('h3'):
+                if TITLE_CLASS in title.get('class', '').split():
+                    artist = title.getnext()
+                    yield ''.join(title.itertext()), ''.join(artist.itertext()) if artist is not None else ''
+                    break
+            # Rows are never looked at again, free them as we go.
+            element.clear()
+
+
+def _iter_rows_html_parser(chunks, encoding):
+    """Yield (name, artist) for each chart row using Python's built-in HTMLParser."""
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    parser = _ChartRowParser()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        while parser.rows:
+            yield parser.rows.pop(0)
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.rows
+
+
+class _ChartRowParser(HTMLParser):
+    """
+    An HTMLParser that builds a small tree for each chart row and extracts its song.
+    
+    Everything outside of chart rows is skipped. Nodes are lists of [tag, classes, children],
+    where children are nodes or strings. Completed rows are appended to self.rows as
+    (name, artist) tuples.
+    """
+    
+    def __init__(self):
+        """Create attributes for _ChartRowParser object."""
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._stack = []
+    
+    def handle_starttag(self, tag, attrs):
+        """Open a new node if inside a row, or start a row if tag is a row container."""
+        classes = (dict(attrs).get('class') or '').split()
+        if not self._stack:
+            if tag == 'div' and ROW_CLASS in classes:
+                self._stack.append([tag, classes, []])
+            return
+        node = [tag, classes, []]
+        self._stack[-1][2].append(node)
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(node)
+    
+    def handle_endtag(self, tag):
+        """Close the innermost open node with a matching tag, and any left open inside it."""
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                row = self._stack[0]
+                del self._stack[i:]
+                if not self._stack:
+                    song = self._extract_song(row)
+                    if song:
+                        self.rows.append(song)
+                return
+    
+    def handle_data(self, data):
+        """Add text to the innermost open node."""
+        if self._stack:
+            self._stack[-1][2].append(data)
+    
+    def _extract_song(self, row):
+        """Return (name, artist) of a row: the first c-title heading and the element that follows it."""
+        found = self._find_title(row)
+        if found is None:
+            return None
+        title, siblings = found
+        artist = next((node for node in siblings if not isinstance(node, str)), None)
+        return self._text(title), self._text(artist) if artist else ''
+    
+    def _find_title(self, node):
+        """Depth first search for the first c-title heading, returning it and the nodes following it."""
+        children = node[2]
+        for i, child in enumerate(children):
+            if isinstance(child, str):
+                continue
+            if child[0] == 'h3' and TITLE_CLASS in child[1]:
+                return child, children[i + 1:]
+            found = self._find_title(child)
+            if found is not None:
+                return found
+        return None
+    
+    def _text(self, node):
+        """Return all text inside a node."""
+        return ''.join(child if isinstance(child, str) else self._text(child) for child in node[2])
@@ -0,0 +1,192 @@
+"""
+Module prefetch
+
+Starts looking up a song's Spotify or YouTube links while the pointer rests on its row, so
+that by the time the user clicks, the answer is usually already there.
+
+Classes:
+    HoverPrefetcher
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from top_songs import instrument
+import threading
+
+# Milliseconds the pointer must rest on a button before its lookup starts. Shorter
+# delays make more clicks instant, but look up more songs that are never clicked.
+HOVER_DELAY = 150
+# Lookups running at once. Hovering is one song at a time, so a few is plenty.
+HOVER_WORKERS = 2
+# Seconds a click waits for an unfinished lookup before looking the song up itself.
+CLICK_TIMEOUT = 10
+
+
+class HoverPrefetcher:
+    """
+    A class to look up songs in the background while the pointer rests on them.
+    
+    hover() schedules a lookup after a short delay (the debounce), so sweeping the pointer
+    across rows doesn't start one per row. leave() cancels a lookup that hasn't started
+    yet. Lookups already sent are left to finish, their result is kept on the song.
+    
+    A click calls claim() before using a song's links. If a lookup for the song is still
+    running, the click waits for it instead of sending the same request again.
+    
+    Clicks are recorded as hits (the song's lookup was started by hovering, "late" if it
+    hadn't finished) or misses. Prefetches that are never clicked are recorded as cancelled
+    (left before they started) or wasted (sent anyway), see get_stats(). The same counts
+    are recorded with instrument.count() as "hover_prefetch.<outcome>".
+    
+    Attributes:
+        root : Tk
+            Tkinter window used to schedule delayed lookups
+        resolvers : dict[str: function]
+            service (e.g. "spotify") mapped to a function called with a Song to look it up
+        delay : int
+            milliseconds the pointer must rest on a song before its lookup starts
+        stats : dict[str: int]
+            outcome mapped to number of prefetches (see get_stats())
+    
+    Methods:
+        hover(self, song, service):
+            Look a song up on a service if the pointer stays on it for self.delay milliseconds.
+        leave(self):
+            Cancel the lookup scheduled or queued by the last hover(), unless already started.
+        claim(self, song, service, resolved):
+            Record a click on a song, waiting for its lookup if one is running.
+        get_stats(self):
+            Return how many prefetches were used, cancelled and wasted, and the click hit rate.
+        stop(self):
+            Stop prefetching, counting finished but unclicked lookups as wasted.
+    """
+    
+    def __init__(self, root, resolvers, delay=HOVER_DELAY, max_workers=HOVER_WORKERS):
+        """
+        Create attributes for HoverPrefetcher object.
+        
+        :param Tk root: Tkinter window used to schedule delayed lookups
+        :param dict[str: function] resolvers: service mapped to function looking up a Song on it
+        :param int delay: milliseconds before a hovered song is looked up, None to disable (default=HOVER_DELAY)
+        :param int max_workers: lookups running at once (default=HOVER_WORKERS)
+        """
+        self.root = root
+        self.resolvers = resolvers
+        self.delay = delay
+        self.stats = {'started': 0, 'hit': 0, 'late': 0, 'miss': 0, 'cancelled': 0, 'wasted': 0, 'failed': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hover')
+        self._lock = threading.Lock()
+        # (service, song key) mapped to future of a lookup not yet claimed by a click.
+        self._futures = {}
+        self._scheduled = None
+        self._queued = None
+    
+    def hover(self, song, service):
+        """
+        Look a song up on a service if the pointer stays on it for self.delay milliseconds.
+        
+        :param Song song: song under the pointer
+        :param str service: key of self.resolvers, e.g. "spotify" or "youtube"
+        """
+        self.leave()
+        if self.delay is None:
+            return
+        key = (service, song.get_key())
+        with self._lock:
+            if key in self._futures:
+                return
+        self._scheduled = self.root.after(self.delay, self._start, song, key)
+    
+    def leave(self):
+        """Cancel the lookup scheduled or queued by the last hover(), unless it has already started."""
+        if self._scheduled is not None:
+            self.root.after_cancel(self._scheduled)
+            self._scheduled = None
+        if self._queued is not None:
+            key, future = self._queued
+            self._queued = None
+            if future.cancel():
+                with self._lock:
+                    self._futures.pop(key, None)
+                self._record('cancelled')
+    
+    def claim(self, song, service, resolved=False):
+        """
+        Record a click on a song, waiting for its lookup if one is running.
+        
+        :param Song song: clicked song
+        :param str service: service the click needs, e.g. "spotify"
+        :param bool resolved: whether the song's links were already known (default=False)
+        
+        Call before looking the song up. A click counts as a hit if hovering started a
+        lookup for it, otherwise as a miss, unless its links were already known some other
+        way (e.g. an earlier click), as prefetching couldn't have helped.
+        """
+        key = (service, song.get_key())
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is None:
+            if not resolved:
+                self._record('miss')
+            return
+        self._record('hit')
+        if future.done():
+            return
+        self._record('late')
+        try:
+            future.result(timeout=CLICK_TIMEOUT)
+        except Exception:
+            # The click looks the song up itself, and reports any error.
+            pass
+    
+    def get_stats(self):
+        """
+        Return how many prefetches were used, cancelled and wasted, and the click hit rate.
+        
+        :return: self.stats, plus "unclaimed" (sent but not clicked yet, wasted if never
+            clicked) and "hit_rate" (share of clicks whose lookup was started by hovering)
+        :rtype: dict
+        
+        "hit" includes "late" hits, clicks that waited for their lookup to finish. "started"
+        minus "hit" is the number of requests prefetching has added so far.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats['unclaimed'] = sum(not future.cancelled() for future in self._futures.values())
+        clicks = stats['hit'] + stats['miss']
+        stats['hit_rate'] = stats['hit'] / clicks if clicks else 0.0
+        return stats
+    
+    def stop(self):
+        """Stop prefetching, counting finished but unclicked lookups as wasted."""
+        self.leave()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            self._record('cancelled' if future.cancelled() else 'wasted')
+    
+    def _start(self, song, key):
+        """Queue a song's lookup on the thread pool, once the pointer has rested on it."""
+        self._scheduled = None
+        future = self._executor.submit(self._resolve, song, key)
+        with self._lock:
+            self._futures[key] = future
+        self._queued = (key, future)
+    
+    def _resolve(self, song, key):
+        """Look a song up on a pool thread."""
+        self._record('started')
+        with instrument.span('hover_prefetch.resolve', service=key[0]):
+            try:
+                if not self.resolvers[key[0]](song):
+                    self._record('failed')
+            except Exception:
+                # A click looks the song up again, and reports the error then.
+                self._record('failed')
+    
+    def _record(self, outcome):
+        """Count a prefetch outcome in self.stats and with instrument (so its hit rate is in instrument's stats)."""
+        with self._lock:
+            self.stats[outcome] += 1
+        instrument.count(f'hover_prefetch.{outcome}')
@@ -0,0 +1,274 @@
+"""
+Module scheduler
+
+Paces requests to the Spotify Web API, so that background lookups (prefetching, album art)
+can run as fast as Spotify allows without getting Top Songs rate limited, and without
+making the user's own clicks wait behind them.
+
+Classes:
+    SpotifyScheduler
+"""
+
+from contextlib import contextmanager
+from top_songs import instrument
+import itertools
+import threading
+import heapq
+import time
+
+# Priority classes, highest first. Requests of a higher class always go before waiting
+# requests of a lower class.
+INTERACTIVE = 0  # Clicks: playing songs, opening artists.
+VISIBLE = 1  # Lookups for songs the user is looking at: hover prefetching, album art in view.
+BACKGROUND = 2  # Everything else, e.g. prefetching the whole chart and refreshing devices.
+PRIORITY_NAMES = ('interactive', 'visible', 'background')
+# Requests per second to start at, and never exceed. Spotify doesn't publish its limits,
+# which are counted over a rolling 30 seconds, so this is a conservative guess.
+SPOTIFY_RATE = 10
+# Requests that can be sent at once after a quiet spell.
+SPOTIFY_BURST = 10
+# Requests per second never gone below, however often Spotify says to slow down.
+MIN_RATE = 1
+# Requests per second added back after every request that isn't rate limited.
+RATE_STEP = 0.1
+# Seconds to wait after a 429 response without a Retry-After header.
+DEFAULT_RETRY_AFTER = 1
+# Longest Retry-After waited out, in seconds. Requests fail straight away during longer waits.
+MAX_RETRY_AFTER = 60
+# Times a request is sent again after a 429 or 5xx response.
+MAX_RETRIES = 3
+# Seconds to wait before sending a request again after a 5xx response, doubled each time.
+RETRY_BACKOFF = 0.5
+
+
+class SpotifyScheduler:
+    """
+    A class to send Spotify requests no faster than Spotify allows, most important first.
+    
+    SpotifyScheduler wraps a spotipy connection and has the same methods, e.g.
+    scheduler.search(...), so it can be used wherever a connection is. Every call waits
+    for a token from a token bucket, filled at self.rate tokens per second and holding up
+    to self.burst. Calls waiting for a token are served by priority (see priority()),
+    then in the order they were made.
+    
+    When Spotify answers "429 Too Many Requests", every call waits for as long as its
+    Retry-After header says, the rate is halved (down to MIN_RATE) and the request is sent
+    again. The rate creeps back up by RATE_STEP after every request that isn't rate limited,
+    so the scheduler settles just under Spotify's actual limit. 5xx responses are sent again
+    after a short backoff, without slowing other calls down. The wrapped connection should
+    not retry on its own (see core.get_spotify_session()), otherwise it hides 429 responses
+    and their Retry-After headers from the scheduler.
+    
+    Calls are sent on the calling thread, so a call still blocks its caller (e.g. a
+    background or action thread) until answered.
+    
+    Attributes:
+        sp_api : Spotify
+            spotipy connection requests are sent through
+        rate : float
+            requests per second currently allowed
+        max_rate : float
+            requests per second never exceeded
+        burst : int
+            requests that can be sent at once after a quiet spell
+        stats : dict[str: int]
+            "throttled" (429 responses), "retried" and "failed" requests, and "calls" by priority
+    
+    Methods:
+        priority(self, priority):
+            Send calls made on this thread in a with block at a priority.
+        set_priority(self, priority):
+            Send calls made on this thread from now on at a priority.
+        get_priority(self):
+            Return the priority of calls made on this thread.
+        call(self, function, *args, **kwargs):
+            Call a function of self.sp_api once the rate limit and priority allow.
+        get_stats(self):
+            Return queue depths, waiting times and throttling counts.
+    """
+    
+    def __init__(self, sp_api, rate=SPOTIFY_RATE, burst=SPOTIFY_BURST, default_priority=BACKGROUND):
+        """
+        Create attributes for SpotifyScheduler object.
+        
+        :param Spotify sp_api: spotipy connection to send requests through
+        :param float rate: requests per second to start at, and never exceed (default=SPOTIFY_RATE)
+        :param int burst: requests that can be sent at once after a quiet spell (default=SPOTIFY_BURST)
+        :param int default_priority: priority of calls made outside priority() (default=BACKGROUND)
+        """
+        self.sp_api = sp_api
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.default_priority = default_priority
+        self.stats = {'throttled': 0, 'retried': 0, 'failed': 0, 'calls': [0] * len(PRIORITY_NAMES)}
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._tokens = burst
+        self._refilled = time.monotonic()
+        self._paused_until = 0
+        self._throttle_error = None
+        # Heap of (priority, ticket) of calls waiting for a token.
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._depths = [0] * len(PRIORITY_NAMES)
+        self._max_depths = [0] * len(PRIORITY_NAMES)
+        self._waited = [0.0] * len(PRIORITY_NAMES)
+    
+    def __getattr__(self, name):
+        """Return self.sp_api's attribute, with methods wrapped to go through call()."""
+        if name == 'sp_api':
+            # Not set yet, e.g. while unpickling.
+            raise AttributeError(name)
+        attribute = getattr(self.sp_api, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+        return lambda *args, **kwargs: self.call(attribute, *args, **kwargs)
+    
+    @contextmanager
+    def priority(self, priority):
+        """
+        Send calls made on this thread in a with block at a priority.
+        
+        :param int priority: INTERACTIVE, VISIBLE or BACKGROUND
+        
+        e.g. with scheduler.priority(INTERACTIVE): core.search_spotify(scheduler, ...)
+        """
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+    
+    def set_priority(self, priority):
+        """Send calls made on this thread from now on at a priority, e.g. on threads that only handle clicks."""
+        self._local.priority = priority
+    
+    def get_priority(self):
+        """Return the priority of calls made on this thread (see priority())."""
+        priority = getattr(self._local, 'priority', None)
+        return self.default_priority if priority is None else priority
+    
+    def call(self, function, *args, **kwargs):
+        """
+        Call a function of self.sp_api once the rate limit and priority allow.
+        
+        :param function: method of self.sp_api, e.g. self.sp_api.search
+        :return: function's return value
+        :except SpotifyException: if Spotify still refuses after MAX_RETRIES, or asks to
+            wait longer than MAX_RETRY_AFTER
+        """
+        from spotipy import SpotifyException
+        
+        priority = self.get_priority()
+        ticket = next(self._tickets)
+        for attempt in range(MAX_RETRIES + 1):
+            self._acquire(priority, ticket)
+            try:
+                result = function(*args, **kwargs)
+            except SpotifyException as error:
+                throttled = self._is_throttled(error)
+                if throttled:
+                    self._throttle(error)
+                elif error.http_status is None or (error.http_status < 500 and error.http_status != 429):
+                    raise
+                if attempt == MAX_RETRIES:
+                    self._record('failed')
+                    raise
+                self._record('retried')
+                if not throttled:
+                    time.sleep(RETRY_BACKOFF * 2 ** attempt)
+                continue
+            with self._condition:
+                self.rate = min(self.rate + RATE_STEP, self.max_rate)
+            return result
+    
+    def get_stats(self):
+        """
+        Return queue depths, waiting times and throttling counts.
+        
+        :return: self.stats, plus "rate" (requests per second allowed now), "paused"
+            (seconds left of a Retry-After wait), and by priority name: "queued" (calls
+            waiting now), "max_queued" and "mean_wait_ms"
+        :rtype: dict
+        """
+        with self._condition:
+            stats = dict(self.stats)
+            stats['calls'] = dict(zip(PRIORITY_NAMES, self.stats['calls']))
+            stats['rate'] = self.rate
+            stats['paused'] = max(self._paused_until - time.monotonic(), 0)
+            stats['queued'] = dict(zip(PRIORITY_NAMES, self._depths))
+            stats['max_queued'] = dict(zip(PRIORITY_NAMES, self._max_depths))
+            stats['mean_wait_ms'] = {
+                name: waited / calls * 1000 if calls else 0.0
+                for name, waited, calls in zip(PRIORITY_NAMES, self._waited, self.stats['calls'])
+            }
+        return stats
+    
+    def _acquire(self, priority, ticket):
+        """Wait until a call is first in line, a token is free and Spotify isn't asking to wait, then take the token."""
+        start = time.monotonic()
+        entry = (priority, ticket)
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            self._depths[priority] += 1
+            self._max_depths[priority] = max(self._max_depths[priority], self._depths[priority])
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._tokens = min(self._tokens + (now - self._refilled) * self.rate, self.burst)
+                    self._refilled = now
+                    if self._paused_until - now > MAX_RETRY_AFTER:
+                        raise self._throttle_error
+                    if self._waiting[0] != entry:
+                        timeout = None
+                    elif now < self._paused_until:
+                        timeout = self._paused_until - now
+                    elif self._tokens < 1:
+                        timeout = (1 - self._tokens) / self.rate
+                    else:
+                        break
+                    self._condition.wait(timeout)
+                self._tokens -= 1
+                self.stats['calls'][priority] += 1
+                self._waited[priority] += now - start
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._depths[priority] -= 1
+                # Let the next call in line check whether it can go.
+                self._condition.notify_all()
+        instrument.observe(f'spotify_scheduler.wait.{PRIORITY_NAMES[priority]}', (now - start) * 1000)
+    
+    @staticmethod
+    def _is_throttled(error):
+        """
+        Check whether a SpotifyException is a 429 answer from Spotify.
+        
+        Spotipy also reports running out of urllib3 retries as a 429, without the answer's
+        headers, whatever the answer was (see core.get_spotify_session()). Those are sent
+        again after a backoff, like 5xx answers, without slowing every other call down.
+        """
+        return error.http_status == 429 and bool(getattr(error, 'headers', None))
+    
+    def _throttle(self, error):
+        """Make every call wait for as long as a 429 response's Retry-After says, and halve the rate."""
+        headers = error.headers
+        try:
+            retry_after = float(headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+        except ValueError:
+            retry_after = DEFAULT_RETRY_AFTER
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._throttle_error = error
+            self.rate = max(self.rate / 2, MIN_RATE)
+            self._tokens = 0
+            self._condition.notify_all()
+        self._record('throttled')
+    
+    def _record(self, outcome):
+        """Count a request outcome in self.stats and with instrument."""
+        with self._condition:
+            self.stats[outcome] += 1
+        instrument.count(f'spotify_scheduler.{outcome}')
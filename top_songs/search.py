@@ -0,0 +1,181 @@
+"""
+Module search
+
+Finds songs by words from their names and artists, as the user types.
+
+Every word of every song is indexed once. A query matches the songs that have, for each
+word in the query, a word starting with it, so "tay sw" finds "Taylor Swift" songs. Words
+are compared without case or accents, so "beyonce" finds "Beyoncé".
+
+Classes:
+    SearchIndex
+
+Functions:
+    get_words(text)
+"""
+
+import unicodedata
+import bisect
+import re
+
+WORD_PATTERN = re.compile(r'\w+')
+# Removed before splitting into words, so "dont" finds "Don't".
+IGNORED_CHARACTERS = str.maketrans('', '', '\'’.')
+# Sorts after every character a word can contain, used to find the end of a prefix's range.
+MAX_CHARACTER = '\U0010ffff'
+
+
+def get_words(text):
+    """
+    Return the words of a text, in lower case and without accents.
+    
+    :param str text: song name, artist or query
+    :rtype: list[str]
+    """
+    text = unicodedata.normalize('NFKD', text.casefold().translate(IGNORED_CHARACTERS))
+    return WORD_PATTERN.findall(''.join(character for character in text if not unicodedata.combining(character)))
+
+
+class SearchIndex:
+    """
+    A class to find items (e.g. songs) by the words of their texts (e.g. name and artist).
+    
+    Distinct words are kept in a sorted list, so the words starting with a prefix are found
+    with two binary searches, however many items are indexed. Each word maps to the items
+    containing it.
+    
+    A query of several words starts from the items matching its longest word. Typing
+    usually adds to the end of the last query, which can only narrow its results, so if
+    the last query matched fewer items, only those are checked against the new query.
+    
+    Attributes:
+        words : list[str]
+            every distinct word, sorted
+        postings : dict[str: set[int]]
+            word mapped to ids of the items containing it
+        item_words : dict[int: tuple[str]]
+            item id mapped to the words of its texts
+    
+    Methods:
+        add(self, item_id, *texts):
+            Index an item by the words of one or more texts.
+        remove(self, item_id):
+            Remove an item from the index.
+        clear(self):
+            Remove every item from the index.
+        search(self, query):
+            Return the ids of items matching a query, in ascending order.
+    """
+    
+    def __init__(self, items=None):
+        """
+        Create attributes for SearchIndex object.
+        
+        :param items: (item id, texts) pairs to index (default=None)
+        """
+        self.words = []
+        self.postings = {}
+        self.item_words = {}
+        self._sorted = True
+        self._last_query = None
+        self._last_results = None
+        for item_id, texts in items or ():
+            self.add(item_id, *texts)
+    
+    def __len__(self):
+        """Return the number of items indexed."""
+        return len(self.item_words)
+    
+    def add(self, item_id, *texts):
+        """
+        Index an item by the words of one or more texts, adding to any texts already indexed for it.
+        
+        :param int item_id: id of item, e.g. the song's index in a list
+        :param str texts: texts to find the item by, e.g. song name and artist
+        """
+        words = set(self.item_words.get(item_id, ()))
+        for text in texts:
+            words.update(get_words(text))
+        self.item_words[item_id] = tuple(words)
+        for word in words:
+            items = self.postings.get(word)
+            if items is None:
+                items = self.postings[word] = set()
+                # Re-sorted on the next search, so that building an index is one sort, not one per word.
+                self._sorted = False
+            items.add(item_id)
+        self._last_query = None
+    
+    def remove(self, item_id):
+        """
+        Remove an item from the index, e.g. before adding it again with new texts.
+        
+        :param int item_id: id of item, items that aren't indexed are ignored
+        """
+        for word in self.item_words.pop(item_id, ()):
+            items = self.postings[word]
+            items.discard(item_id)
+            if not items:
+                del self.postings[word]
+                # Re-sorted on the next search, as in add().
+                self._sorted = False
+        self._last_query = None
+    
+    def clear(self):
+        """Remove every item from the index."""
+        self.words = []
+        self.postings = {}
+        self.item_words = {}
+        self._sorted = True
+        self._last_query = None
+    
+    def search(self, query):
+        """
+        Return the ids of items matching a query, in ascending order.
+        
+        :param str query: words (or the starts of words) to find
+        :rtype: list[int]
+        
+        Every item matches an empty query.
+        """
+        query_words = get_words(query)
+        if not query_words:
+            return sorted(self.item_words)
+        if not self._sorted:
+            self.words = sorted(self.postings)
+            self._sorted = True
+        # Start from the longest word, which usually matches the fewest items.
+        candidates = self._find_prefix(max(query_words, key=len))
+        if len(query_words) == 1:
+            # Every candidate has a word starting with the only query word.
+            results = sorted(candidates)
+        else:
+            if self._narrows_last_query(query_words) and len(self._last_results) < len(candidates):
+                candidates = self._last_results
+            results = sorted(item_id for item_id in candidates if self._matches(item_id, query_words))
+        self._last_query = query_words
+        self._last_results = results
+        return results
+    
+    def _find_prefix(self, prefix):
+        """Return the ids of items with a word starting with prefix."""
+        start = bisect.bisect_left(self.words, prefix)
+        end = bisect.bisect_left(self.words, prefix + MAX_CHARACTER, start)
+        if end - start == 1:
+            return self.postings[self.words[start]]
+        items = set()
+        for word in self.words[start:end]:
+            items.update(self.postings[word])
+        return items
+    
+    def _matches(self, item_id, query_words):
+        """Check whether an item has, for each query word, a word starting with it."""
+        item_words = self.item_words[item_id]
+        return all(any(word.startswith(query_word) for word in item_words) for query_word in query_words)
+    
+    def _narrows_last_query(self, query_words):
+        """Check whether every item matching query_words also matched the last query."""
+        last_query = self._last_query
+        if last_query is None or len(query_words) < len(last_query):
+            return False
+        return all(word.startswith(last_word) for word, last_word in zip(query_words, last_query))
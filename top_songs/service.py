@@ -0,0 +1,439 @@
+"""
+Module service
+
+Runs chart and song lookups for several Top Songs apps at once, so a team scrapes Billboard
+and searches Spotify and YouTube once between them, not once each.
+
+ChartService is a small asyncio HTTP server with one in-memory cache shared by every client.
+Concurrent requests for the same chart or song are coalesced into one fetch. Fetches run
+core functions on a thread pool, backed by the usual disk caches (see cache.py), so results
+survive restarts. ServiceClient is used by TopSongsApp (see its service_url parameter) and
+anything else that wants to use a running service.
+
+Start a service with: python -m top_songs.service [--host HOST] [--port PORT]
+
+Routes (all GET, answers are compact JSON):
+    /chart?chart=<chart>&n=<n>: {"chart": chart, "songs": [{"number", "name", "artist"}, ...]}
+    /spotify?name=<name>&artist=<artist>: {"uri", "artist_uri", "art_url"}, 404 if not on Spotify
+    /youtube?name=<name>&artist=<artist>: {"yt_url"}, 404 if no video was found
+    /stats: request, cache and coalescing counts (see ChartService.get_stats())
+
+Classes:
+    ChartService
+    ServiceClient
+
+Functions:
+    main(args)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from top_songs.cache import ChartCache, ResolutionCache
+from urllib.parse import urlsplit, parse_qs
+from collections import OrderedDict
+from top_songs.models import Song
+from top_songs import outbound
+from top_songs import core
+import threading
+import argparse
+import asyncio
+import json
+import time
+import os
+
+# Address of a running service, used by TopSongsApp when set.
+SERVICE_URL = os.environ.get('TOP_SONGS_SERVICE_URL', '').rstrip('/') or None
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Seconds a chart is served from memory before the disk chart cache is asked again (which
+# only contacts Billboard once a new chart is due).
+CHART_TTL = 5 * 60
+# Seconds a Spotify or YouTube answer is served from memory, including "not found".
+LOOKUP_TTL = 24 * 60 * 60
+# Answers kept in memory, least recently used are dropped first.
+MAX_ENTRIES = 20000
+# Fetches (Billboard downloads, Spotify and YouTube searches) running at once.
+FETCH_WORKERS = 8
+# Seconds between writes of the resolution cache to disk.
+SAVE_INTERVAL = 60
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 502: 'Bad Gateway',
+                  503: 'Service Unavailable'}
+
+
+def encode(data):
+    """Return data as compact JSON bytes."""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class ChartService:
+    """
+    A class to answer chart and song lookups over HTTP, sharing one cache between all clients.
+    
+    Answers are cached in memory as encoded JSON, so a cached read is a dictionary lookup
+    and a socket write. A request for something not cached starts one fetch on the thread
+    pool, and every request for the same thing that arrives while it runs waits for that
+    fetch instead of starting another. Failed fetches (e.g. Billboard unreachable) aren't
+    cached, songs that weren't found are (for LOOKUP_TTL).
+    
+    Attributes:
+        host : str
+            address to listen on
+        port : int
+            port to listen on, set to the port chosen when started with 0
+        chart_cache : ChartCache
+            charts stored on disk, shared with core.get_chart()
+        resolution_cache : ResolutionCache
+            Spotify and YouTube results stored on disk
+        answers : OrderedDict[tuple: tuple[int, bytes, float]]
+            request key mapped to status, body and expiry time, least recently used first
+        stats : dict[str: int]
+            counts of requests, cache hits and misses, coalesced requests and errors
+    
+    Methods:
+        serve(self):
+            Answer requests until stop() is called.
+        start(self):
+            Start answering requests on a background thread, returning once listening.
+        stop(self):
+            Stop answering requests, from any thread.
+        get_stats(self):
+            Return request, cache and coalescing counts.
+    """
+    
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, chart_cache=None, resolution_cache=None,
+                 max_workers=FETCH_WORKERS, max_entries=MAX_ENTRIES):
+        """
+        Create attributes for ChartService object.
+        
+        :param str host: address to listen on (default=DEFAULT_HOST)
+        :param int port: port to listen on, 0 for any free port (default=DEFAULT_PORT)
+        :param ChartCache chart_cache: charts stored on disk (default=ChartCache())
+        :param ResolutionCache resolution_cache: lookups stored on disk (default=ResolutionCache())
+        :param int max_workers: fetches running at once (default=FETCH_WORKERS)
+        :param int max_entries: answers kept in memory (default=MAX_ENTRIES)
+        """
+        self.host = host
+        self.port = port
+        self.chart_cache = chart_cache if chart_cache is not None else ChartCache()
+        self.resolution_cache = resolution_cache if resolution_cache is not None else ResolutionCache()
+        self.max_entries = max_entries
+        self.answers = OrderedDict()
+        self.stats = {'requests': 0, 'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='service')
+        # Request key mapped to the task fetching it.
+        self._fetches = {}
+        self._sp_api = None
+        self._sp_api_lock = threading.Lock()
+        self._loop = None
+        self._stopping = None
+        self._started = threading.Event()
+    
+    async def serve(self):
+        """Answer requests until stop() is called, saving the resolution cache now and then and when stopping."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+        saver = asyncio.ensure_future(self._save_periodically())
+        try:
+            async with server:
+                await self._stopping.wait()
+        finally:
+            saver.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self.resolution_cache.save()
+    
+    def start(self):
+        """Start answering requests on a background thread, returning once listening (e.g. for benchmarks)."""
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name='service', daemon=True)
+        thread.start()
+        self._started.wait()
+        return thread
+    
+    def stop(self):
+        """Stop answering requests, from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+    
+    def get_stats(self):
+        """
+        Return request, cache and coalescing counts.
+        
+        :return: self.stats, plus "entries" (answers in memory) and "fetching" (fetches running)
+        :rtype: dict[str: int]
+        """
+        return dict(self.stats, entries=len(self.answers), fetching=len(self._fetches))
+    
+    async def _save_periodically(self):
+        """Write the resolution cache to disk every SAVE_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            await self._loop.run_in_executor(self._executor, self.resolution_cache.save)
+    
+    async def _handle_connection(self, reader, writer):
+        """Answer requests on one connection until the client closes it (connections are kept alive)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = not request_line.rstrip().endswith(b'HTTP/1.0')
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    if header.lower().startswith(b'connection:'):
+                        keep_alive = header.split(b':', 1)[1].strip().lower() == b'keep-alive'
+                try:
+                    method, target = request_line.decode('latin-1').split()[:2]
+                except ValueError:
+                    break
+                status, body = await self._answer(method, target)
+                writer.write(
+                    f'HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # Client went away or sent something that isn't HTTP.
+            pass
+        except asyncio.CancelledError:
+            # Service stopping with the connection still open, close it quietly.
+            pass
+        finally:
+            writer.close()
+    
+    async def _answer(self, method, target):
+        """Return the status and body answering a request."""
+        self.stats['requests'] += 1
+        if method != 'GET':
+            return 405, encode({'error': 'only GET is supported'})
+        url = urlsplit(target)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        if url.path == '/stats':
+            return 200, encode(self.get_stats())
+        if url.path == '/chart':
+            chart = query.get('chart', core.HOT_100)
+            if chart not in core.CHARTS:
+                return 404, encode({'error': f'unknown chart {chart}'})
+            try:
+                n = int(query.get('n', 100))
+            except ValueError:
+                return 400, encode({'error': 'n must be a number'})
+            return await self._get_answer(('chart', chart, n), CHART_TTL, lambda: self._fetch_chart(chart, n))
+        if url.path in ('/spotify', '/youtube'):
+            name = query.get('name', '').strip()
+            artist = core.get_real_artist(query.get('artist', '').strip())
+            if not name or not artist:
+                return 400, encode({'error': 'name and artist are required'})
+            key = (url.path[1:], ResolutionCache.make_key(name, artist))
+            fetch = self._fetch_spotify if url.path == '/spotify' else self._fetch_youtube
+            return await self._get_answer(key, LOOKUP_TTL, lambda: fetch(name, artist))
+        return 404, encode({'error': f'unknown path {url.path}'})
+    
+    async def _get_answer(self, key, ttl, fetch):
+        """
+        Return a cached answer, or fetch it once however many requests are waiting for it.
+        
+        :param tuple key: identifies the request, e.g. ("chart", "hot-100", 100)
+        :param float ttl: seconds the answer is cached for
+        :param fetch: function run on the thread pool, returning status and body
+        :rtype: tuple[int, bytes]
+        """
+        answer = self.answers.get(key)
+        if answer is not None and answer[2] > time.monotonic():
+            self.answers.move_to_end(key)
+            self.stats['hits'] += 1
+            return answer[0], answer[1]
+        task = self._fetches.get(key)
+        if task is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['misses'] += 1
+            task = self._fetches[key] = asyncio.ensure_future(self._fetch(key, ttl, fetch))
+            task.add_done_callback(lambda _: self._fetches.pop(key, None))
+        # Shielded, so one client giving up doesn't cancel the fetch for the others.
+        return await asyncio.shield(task)
+    
+    async def _fetch(self, key, ttl, fetch):
+        """Run a fetch on the thread pool and cache its answer, unless it failed."""
+        try:
+            status, body = await self._loop.run_in_executor(self._executor, fetch)
+        except Exception as error:
+            # Failures aren't cached, so the next request tries again.
+            self.stats['errors'] += 1
+            return 502, encode({'error': f'{type(error).__name__}: {error}'})
+        if status in (200, 404):
+            self.answers[key] = (status, body, time.monotonic() + ttl)
+            self.answers.move_to_end(key)
+            while len(self.answers) > self.max_entries:
+                self.answers.popitem(last=False)
+        return status, body
+    
+    def _fetch_chart(self, chart, n):
+        """Get a chart (see core.get_chart()), on a pool thread."""
+        songs = core.get_chart(chart, n, self.chart_cache)
+        if not songs:
+            # Billboard unreachable and nothing downloaded before.
+            raise OSError(f"couldn't load {chart}")
+        return 200, encode({'chart': chart, 'songs': [song.to_dict() for song in songs]})
+    
+    def _fetch_spotify(self, name, artist):
+        """Search Spotify for a song (see core.search_spotify_track()), on a pool thread."""
+        from spotipy import SpotifyException
+        
+        with self._sp_api_lock:
+            if self._sp_api is None:
+                try:
+                    self._sp_api = core.connect_spotify_app()
+                except OSError:
+                    return 503, encode({'error': 'Spotify credentials not found, see README.md'})
+        try:
+            track = core.search_spotify_track(self._sp_api, name, artist, self.resolution_cache)
+        except IndexError:
+            return 404, encode({'error': 'not found'})
+        except SpotifyException as error:
+            raise OSError(str(error))
+        return 200, encode(track)
+    
+    def _fetch_youtube(self, name, artist):
+        """Search YouTube for a song's music video (see core.search_youtube()), on a pool thread."""
+        try:
+            url = core.search_youtube(name, artist, self.resolution_cache)
+        except IndexError:
+            return 404, encode({'error': 'not found'})
+        return 200, encode({'yt_url': url})
+
+
+class ServiceClient:
+    """
+    A class to get charts and song links from a running ChartService, in place of core functions.
+    
+    Methods return the same things as the core functions they stand in for, and songs that
+    aren't found raise IndexError, as in core. Requests go over the shared session (see
+    core.get_session()), so connections to the service are kept alive.
+    
+    Attributes:
+        url : str
+            base url of the service, e.g. http://127.0.0.1:8765
+    
+    Methods:
+        get_chart(self, chart, n):
+            Return a number of top songs from a chart.
+        search_spotify_track(self, name, artist):
+            Return a song's track URI, artist URI and album art url.
+        search_youtube(self, name, artist):
+            Return the url of a song's music video.
+        resolve_spotify_data(self, song):
+            Get and store a song's Spotify URIs and album art url, unless already stored.
+        resolve_youtube_data(self, song):
+            Get and store a song's music video url, unless already stored.
+    """
+    
+    def __init__(self, url=SERVICE_URL):
+        """
+        Create attributes for ServiceClient object.
+        
+        :param str url: base url of the service (default=SERVICE_URL)
+        """
+        self.url = url.rstrip('/')
+    
+    def get_chart(self, chart, n):
+        """
+        Return a number of top songs from a chart, an empty list if the service can't be reached.
+        
+        :param str chart: chart name, a key of core.CHARTS
+        :param int n: number of songs
+        :rtype: list[Song]
+        """
+        import requests
+        
+        try:
+            data = self._get('/chart', chart=chart, n=n)
+        except (requests.RequestException, IndexError):
+            return []
+        return [Song.from_dict(song) for song in data['songs']]
+    
+    def search_spotify_track(self, name, artist):
+        """
+        Return a song's track URI, first artist's URI and album art url (see core.search_spotify_track()).
+        
+        :except IndexError: if Spotify found no tracks
+        :except requests.RequestException: if the service couldn't be reached or Spotify failed
+        :rtype: dict[str: str]
+        """
+        return self._get('/spotify', name=name, artist=artist)
+    
+    def search_youtube(self, name, artist):
+        """
+        Return the url of a song's music video (see core.search_youtube()).
+        
+        :except IndexError: if YouTube found no videos
+        :except requests.RequestException: if the service couldn't be reached or YouTube failed
+        :rtype: str
+        """
+        return self._get('/youtube', name=name, artist=artist)['yt_url']
+    
+    def resolve_spotify_data(self, song):
+        """Get and store a song's track and artist URIs and album art url unless already stored, returning whether stored."""
+        if song.artist_uri is not None and song.art_url is not None:
+            return True
+        import requests
+        
+        try:
+            track = self.search_spotify_track(song.name, song.artist)
+        except (IndexError, requests.RequestException):
+            return False
+        song.uri, song.artist_uri, song.art_url = track['uri'], track['artist_uri'], track['art_url']
+        return True
+    
+    def resolve_youtube_data(self, song):
+        """Get and store a song's music video url unless already stored, returning whether stored."""
+        if song.yt_url is not None:
+            return True
+        import requests
+        
+        try:
+            song.yt_url = self.search_youtube(song.name, song.artist)
+        except (IndexError, requests.RequestException):
+            return False
+        return True
+    
+    def _get(self, path, **params):
+        """
+        Send a request to the service and return the decoded answer, raising IndexError if not found.
+        
+        Identical requests already being sent wait for that answer instead, and answers
+        that weren't found are remembered for a while (see outbound.call()).
+        """
+        return outbound.call('service', (self.url, path, tuple(sorted(params.items()))), self._send, path, params)
+    
+    def _send(self, path, params):
+        """Send a request to the service and return the decoded answer, raising IndexError if not found."""
+        response = core.get_session().get(f'{self.url}{path}', params=params, timeout=outbound.get_timeout('service'))
+        if response.status_code == 404:
+            raise IndexError(response.json().get('error', 'not found'))
+        response.raise_for_status()
+        return response.json()
+
+
+def main(args=None):
+    """Start a ChartService and answer requests until interrupted (Ctrl+C)."""
+    arg_parser = argparse.ArgumentParser(prog='python -m top_songs.service', description=__doc__.split('\n\n')[1])
+    arg_parser.add_argument('--host', default=DEFAULT_HOST, help=f'address to listen on (default={DEFAULT_HOST})')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default={DEFAULT_PORT})')
+    arg_parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help=f'fetches running at once (default={FETCH_WORKERS})')
+    options = arg_parser.parse_args(args)
+    service = ChartService(options.host, options.port, max_workers=options.workers)
+    print(f'Serving charts on http://{options.host}:{options.port}, press Ctrl+C to stop.')
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()